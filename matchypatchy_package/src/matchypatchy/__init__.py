@@ -8,94 +8,148 @@ from matchypatchy import threads
 
 from matchypatchy.config import (HOME_DIR, add, initiate, load_cfg,
                                  resource_path, update,)
-from matchypatchy.database import (COLUMNS, IMAGE_EXT, MatchyPatchyDB,
+from matchypatchy.database import (COLUMNS, ConnectionPool, DRAFT_SCALES,
+                                   EmbeddingIndex, GC_GRACE, IMAGE_EXT,
+                                   INDEXES, INDEX_DTYPE, INDEX_FILE,
+                                   MIGRATIONS, MatchyPatchyDB, NeighborGraph,
+                                   PACK_FILE, PACK_PREFIX, PRAGMAS,
+                                   PROJECTS_FILE, REQUIRED_TABLES,
+                                   SCHEMA_VERSION, THUMBNAIL_COLUMNS,
                                    THUMBNAIL_NOTFOUND, THUMBNAIL_SIZE,
-                                   TZ_CONVERT_DICT, VIDEO_EXT,
-                                   check_missing_thumbnails, export_data,
-                                   fetch_individual, fetch_media,
+                                   THUMBNAIL_STORES, TOUCH_INTERVAL,
+                                   TZ_CONVERT_DICT, ThumbnailPack, VIDEO_EXT,
+                                   add_file_hash, add_schema_version,
+                                   add_thumbnail_stat,
+                                   check_missing_thumbnails,
+                                   collect_thumbnails, connection,
+                                   create_indexes, draft_scale, emb_index,
+                                   export_data, fetch_individual, fetch_media,
                                    fetch_media_thumbnails, fetch_regions,
                                    fetch_roi, fetch_roi_media,
                                    fetch_roi_thumbnails,
-                                   fetch_station_names_from_id, fetch_stations,
-                                   fetch_surveys, get_frame, get_roi_bbox,
-                                   get_roi_frame, get_sequence, get_sha256,
-                                   individual_roi_dict, location, media,
-                                   media_count, mpdb, save_media_thumbnail,
-                                   save_roi_thumbnail, sequence_roi_dict,
-                                   setup, setup_chromadb, setup_database,
-                                   thumbnails,)
+                                   fetch_station_names_from_id,
+                                   fetch_stations, fetch_surveys, get_frame,
+                                   get_frames, get_pack, get_roi_bbox,
+                                   get_roi_frame, get_schema_version,
+                                   get_sequence, get_sha256, group_ids,
+                                   hash_files, individual_roi_dict,
+                                   is_key_file, key_path, load_thumbnail,
+                                   location, media, media_count, migrate,
+                                   migrate_chunk, migrate_thumbnails,
+                                   migrations, mpdb, needs_migration,
+                                   neighbor_graph, project_thumbnails,
+                                   read_image, read_projects, read_thumbnail,
+                                   referenced_thumbnails, register_project,
+                                   save_media_thumbnail, save_roi_thumbnail,
+                                   save_thumbnail, save_thumbnails,
+                                   scan_thumbnail_dir, select_removals,
+                                   sequence_roi_dict, setup, setup_chromadb,
+                                   setup_database, thumbnail_exists,
+                                   thumbnail_key, thumbnail_pack,
+                                   thumbnail_path, thumbnail_stat, thumbnails,
+                                   touch_thumbnail, unreferenced_thumbnails,
+                                   verify_thumbnail, write_thumbnail,)
 from matchypatchy.gui import (AboutPopup, AlertPopup, ClickableSlider,
-                              ComboBoxDelegate, ComboBoxSeparator, ConfigPopup,
-                              DisplayBase, DisplayCompare, DisplayMedia,
-                              FilterBar, FilterBox, HorizontalSeparator,
-                              ImageAdjustBar, ImageWidget, ImportCSVPopup,
-                              ImportFolderPopup, IndividualFillPopup,
-                              IndividualPopup, LicensePopup, MLDownloadPopup,
-                              MLOptionsPopup, MainWindow, MediaEditPopup,
-                              MediaTable, MediaWidget, MetadataPanel,
+                              ComboBoxDelegate, ComboBoxSeparator,
+                              ConfigPopup, DisplayBase, DisplayCompare,
+                              DisplayMedia, FilterBar, FilterBox,
+                              HorizontalSeparator, ImageAdjustBar,
+                              ImageWidget, ImportCSVPopup, ImportFolderPopup,
+                              IndividualFillPopup, IndividualPopup,
+                              LicensePopup, MLDownloadPopup, MLOptionsPopup,
+                              MainWindow, MediaEditPopup, MediaTable,
+                              MediaTableModel, MediaWidget, MetadataPanel,
                               PairXPopup, QC_QueryContainer, QueryContainer,
                               READMEPopup, StandardButton, StationFillPopup,
                               StationPopup, SurveyFillPopup, SurveyPopup,
-                              ThreePointSlider, VerticalSeparator,
+                              ThreePointSlider, ThumbnailCache,
+                              ThumbnailDelegate, VerticalSeparator,
                               VideoPlayerBar, VideoViewer, VideoWidget,
                               dialogs, display_base, display_compare,
-                              display_media, gui_assets, main_gui, media_table,
-                              popup_alert, popup_config, popup_import_csv,
+                              display_media, gui_assets, main_gui,
+                              media_table, pixmap_bytes, popup_alert,
+                              popup_config, popup_import_csv,
                               popup_import_folder, popup_individual,
                               popup_media_edit, popup_ml, popup_pairx,
                               popup_readme, popup_station, popup_survey,
-                              qc_query, query, widget_filterbar,
-                              widget_image_adjustment, widget_media, widgets,)
+                              qc_query, query, thumbnail_cache,
+                              widget_filterbar, widget_image_adjustment,
+                              widget_media, widgets,)
 from matchypatchy.logging_config import (get_logger, setup_logger,)
 from matchypatchy.threads import (AnimlThread, BuildManifestThread,
                                   CSVImportThread, DownloadMLThread,
                                   FetchTableThread, FolderImportThread,
-                                  LoadTableThread, MEGADETECTORv1000_SIZE,
+                                  MEGADETECTORv1000_SIZE,
                                   MatchEmbeddingThread, MatchObject,
-                                  ReIDThread, SequenceThread, animl_thread,
-                                  delete, get_path, import_thread,
-                                  is_valid_reid_model, load_model,
-                                  match_object, match_thread,
-                                  model_download_thread, reid_thread,
-                                  sequence_thread, table_thread,
-                                  update_model_yml,)
+                                  ReIDThread, SequenceThread,
+                                  ThumbnailLoaderThread, ThumbnailThread,
+                                  animl_thread, batch_filepaths,
+                                  batch_roi_ids, delete, get_path,
+                                  import_thread, is_valid_reid_model,
+                                  load_model, match_object, match_thread,
+                                  model_download_thread, rank_matches,
+                                  readable_image, reid_thread,
+                                  sequence_groups, sequence_thread,
+                                  table_thread, thumbnail_loader_thread,
+                                  thumbnail_thread, update_model_yml,)
 
 __all__ = ['AboutPopup', 'AlertPopup', 'AnimlThread', 'BuildManifestThread',
-           'COLUMNS', 'CSVImportThread', 'ClickableSlider', 'ComboBoxDelegate',
-           'ComboBoxSeparator', 'ConfigPopup', 'DisplayBase', 'DisplayCompare',
-           'DisplayMedia', 'DownloadMLThread', 'FetchTableThread', 'FilterBar',
-           'FilterBox', 'FolderImportThread', 'HOME_DIR',
-           'HorizontalSeparator', 'IMAGE_EXT', 'ImageAdjustBar', 'ImageWidget',
-           'ImportCSVPopup', 'ImportFolderPopup', 'IndividualFillPopup',
-           'IndividualPopup', 'LicensePopup', 'LoadTableThread',
-           'MEGADETECTORv1000_SIZE', 'MLDownloadPopup', 'MLOptionsPopup',
-           'MainWindow', 'MatchEmbeddingThread', 'MatchObject',
-           'MatchyPatchyDB', 'MediaEditPopup', 'MediaTable', 'MediaWidget',
-           'MetadataPanel', 'PairXPopup', 'QC_QueryContainer',
-           'QueryContainer', 'READMEPopup', 'ReIDThread', 'SequenceThread',
-           'StandardButton', 'StationFillPopup', 'StationPopup',
-           'SurveyFillPopup', 'SurveyPopup', 'THUMBNAIL_NOTFOUND',
-           'THUMBNAIL_SIZE', 'TZ_CONVERT_DICT', 'ThreePointSlider',
+           'COLUMNS', 'CSVImportThread', 'ClickableSlider',
+           'ComboBoxDelegate', 'ComboBoxSeparator', 'ConfigPopup',
+           'ConnectionPool', 'DRAFT_SCALES', 'DisplayBase', 'DisplayCompare',
+           'DisplayMedia', 'DownloadMLThread', 'EmbeddingIndex',
+           'FetchTableThread', 'FilterBar', 'FilterBox', 'FolderImportThread',
+           'GC_GRACE', 'HOME_DIR', 'HorizontalSeparator', 'IMAGE_EXT',
+           'INDEXES', 'INDEX_DTYPE', 'INDEX_FILE', 'ImageAdjustBar',
+           'ImageWidget', 'ImportCSVPopup', 'ImportFolderPopup',
+           'IndividualFillPopup', 'IndividualPopup', 'LicensePopup',
+           'MEGADETECTORv1000_SIZE', 'MIGRATIONS', 'MLDownloadPopup',
+           'MLOptionsPopup', 'MainWindow', 'MatchEmbeddingThread',
+           'MatchObject', 'MatchyPatchyDB', 'MediaEditPopup', 'MediaTable',
+           'MediaTableModel', 'MediaWidget', 'MetadataPanel', 'NeighborGraph',
+           'PACK_FILE', 'PACK_PREFIX', 'PRAGMAS', 'PROJECTS_FILE',
+           'PairXPopup', 'QC_QueryContainer', 'QueryContainer', 'READMEPopup',
+           'REQUIRED_TABLES', 'ReIDThread', 'SCHEMA_VERSION',
+           'SequenceThread', 'StandardButton', 'StationFillPopup',
+           'StationPopup', 'SurveyFillPopup', 'SurveyPopup',
+           'THUMBNAIL_COLUMNS', 'THUMBNAIL_NOTFOUND', 'THUMBNAIL_SIZE',
+           'THUMBNAIL_STORES', 'TOUCH_INTERVAL', 'TZ_CONVERT_DICT',
+           'ThreePointSlider', 'ThumbnailCache', 'ThumbnailDelegate',
+           'ThumbnailLoaderThread', 'ThumbnailPack', 'ThumbnailThread',
            'VIDEO_EXT', 'VerticalSeparator', 'VideoPlayerBar', 'VideoViewer',
-           'VideoWidget', 'add', 'animl_thread', 'check_missing_thumbnails',
-           'config', 'database', 'delete', 'dialogs', 'display_base',
-           'display_compare', 'display_media', 'export_data',
-           'fetch_individual', 'fetch_media', 'fetch_media_thumbnails',
-           'fetch_regions', 'fetch_roi', 'fetch_roi_media',
-           'fetch_roi_thumbnails', 'fetch_station_names_from_id',
-           'fetch_stations', 'fetch_surveys', 'get_frame', 'get_logger',
-           'get_path', 'get_roi_bbox', 'get_roi_frame', 'get_sequence',
-           'get_sha256', 'gui', 'gui_assets', 'import_thread',
-           'individual_roi_dict', 'initiate', 'is_valid_reid_model',
-           'load_cfg', 'load_model', 'location', 'logging_config', 'main_gui',
-           'match_object', 'match_thread', 'media', 'media_count',
-           'media_table', 'model_download_thread', 'mpdb', 'popup_alert',
-           'popup_config', 'popup_import_csv', 'popup_import_folder',
-           'popup_individual', 'popup_media_edit', 'popup_ml', 'popup_pairx',
-           'popup_readme', 'popup_station', 'popup_survey', 'qc_query',
-           'query', 'reid_thread', 'resource_path', 'save_media_thumbnail',
-           'save_roi_thumbnail', 'sequence_roi_dict', 'sequence_thread',
-           'setup', 'setup_chromadb', 'setup_database', 'setup_logger',
-           'table_thread', 'threads', 'thumbnails', 'update',
-           'update_model_yml', 'widget_filterbar', 'widget_image_adjustment',
-           'widget_media', 'widgets']
+           'VideoWidget', 'add', 'add_file_hash', 'add_schema_version',
+           'add_thumbnail_stat', 'animl_thread', 'batch_filepaths',
+           'batch_roi_ids', 'check_missing_thumbnails', 'collect_thumbnails',
+           'config', 'connection', 'create_indexes', 'database', 'delete',
+           'dialogs', 'display_base', 'display_compare', 'display_media',
+           'draft_scale', 'emb_index', 'export_data', 'fetch_individual',
+           'fetch_media', 'fetch_media_thumbnails', 'fetch_regions',
+           'fetch_roi', 'fetch_roi_media', 'fetch_roi_thumbnails',
+           'fetch_station_names_from_id', 'fetch_stations', 'fetch_surveys',
+           'get_frame', 'get_frames', 'get_logger', 'get_pack', 'get_path',
+           'get_roi_bbox', 'get_roi_frame', 'get_schema_version',
+           'get_sequence', 'get_sha256', 'group_ids', 'gui', 'gui_assets',
+           'hash_files', 'import_thread', 'individual_roi_dict', 'initiate',
+           'is_key_file', 'is_valid_reid_model', 'key_path', 'load_cfg',
+           'load_model', 'load_thumbnail', 'location', 'logging_config',
+           'main_gui', 'match_object', 'match_thread', 'media', 'media_count',
+           'media_table', 'migrate', 'migrate_chunk', 'migrate_thumbnails',
+           'migrations', 'model_download_thread', 'mpdb', 'needs_migration',
+           'neighbor_graph', 'pixmap_bytes', 'popup_alert', 'popup_config',
+           'popup_import_csv', 'popup_import_folder', 'popup_individual',
+           'popup_media_edit', 'popup_ml', 'popup_pairx', 'popup_readme',
+           'popup_station', 'popup_survey', 'project_thumbnails', 'qc_query',
+           'query', 'rank_matches', 'read_image', 'read_projects',
+           'read_thumbnail', 'readable_image', 'referenced_thumbnails',
+           'register_project', 'reid_thread', 'resource_path',
+           'save_media_thumbnail', 'save_roi_thumbnail', 'save_thumbnail',
+           'save_thumbnails', 'scan_thumbnail_dir', 'select_removals',
+           'sequence_groups', 'sequence_roi_dict', 'sequence_thread', 'setup',
+           'setup_chromadb', 'setup_database', 'setup_logger', 'table_thread',
+           'threads', 'thumbnail_cache', 'thumbnail_exists', 'thumbnail_key',
+           'thumbnail_loader_thread', 'thumbnail_pack', 'thumbnail_path',
+           'thumbnail_stat', 'thumbnail_thread', 'thumbnails',
+           'touch_thumbnail', 'unreferenced_thumbnails', 'update',
+           'update_model_yml', 'verify_thumbnail', 'widget_filterbar',
+           'widget_image_adjustment', 'widget_media', 'widgets',
+           'write_thumbnail']
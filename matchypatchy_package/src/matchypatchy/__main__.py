@@ -5,6 +5,7 @@ Main entry point for MatchyPatchy application
 import os
 import sys
 import time
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 
 from matchypatchy.logging_config import setup_logger, get_logger
@@ -16,7 +17,10 @@ from matchypatchy import config
 os.environ["CHROMA_TELEMETRY"] = "FALSE"
 
 if __name__ == "__main__":
+    # dataloader workers are separate processes in frozen builds
+    multiprocessing.freeze_support()
     start_time = time.time()
+    mpDB = None
     
     # Setup application-wide logging
     root_logger = setup_logger()
@@ -56,6 +60,8 @@ if __name__ == "__main__":
         sys.exit(1)
     
     finally:
+        if mpDB is not None:
+            mpDB.close()
         logger.info("MatchyPatchy shutting down")
         logger.info("=" * 70)
         sys.exit(exit_code)
\ No newline at end of file
@@ -39,6 +39,16 @@ def initiate():
         'KNN': 100,
         'SEQUENCE_DURATION': 60,
         'SEQUENCE_N': 3,
+        'REID_BATCH_SIZE': 32,
+        'REID_WORKERS': 2,
+        'VIEWPOINT_BATCH_SIZE': 16,
+        'VIEWPOINT_WORKERS': 2,
+        'HASH_WORKERS': 8,
+        'FAST_HASH': False,
+        'THUMBNAIL_WORKERS': 4,
+        'THUMBNAIL_CACHE_MB': 2048,
+        'THUMBNAIL_STORE': 'files',
+        'THUMBNAIL_PIXMAP_MB': 64,
     }
 
     CONFIG_PATH = HOME_DIR / '.config.yml'
@@ -1,9 +1,16 @@
+from matchypatchy.database import connection
+from matchypatchy.database import emb_index
 from matchypatchy.database import location
 from matchypatchy.database import media
+from matchypatchy.database import migrations
 from matchypatchy.database import mpdb
+from matchypatchy.database import neighbor_graph
 from matchypatchy.database import setup
+from matchypatchy.database import thumbnail_pack
 from matchypatchy.database import thumbnails
 
+from matchypatchy.database.connection import (ConnectionPool, PRAGMAS,)
+from matchypatchy.database.emb_index import (EmbeddingIndex,)
 from matchypatchy.database.location import (TZ_CONVERT_DICT, fetch_regions,
                                             fetch_station_names_from_id,
                                             fetch_stations, fetch_surveys,)
@@ -12,26 +19,77 @@ from matchypatchy.database.media import (COLUMNS, IMAGE_EXT, VIDEO_EXT,
                                          fetch_media, fetch_roi,
                                          fetch_roi_media, get_roi_bbox,
                                          get_roi_frame, get_sequence,
-                                         get_sha256, individual_roi_dict,
-                                         media_count, sequence_roi_dict,)
+                                         get_sha256, group_ids, hash_files,
+                                         individual_roi_dict, media_count,
+                                         sequence_roi_dict,)
+from matchypatchy.database.migrations import (MIGRATIONS, REQUIRED_TABLES,
+                                              SCHEMA_VERSION, add_file_hash,
+                                              add_schema_version,
+                                              add_thumbnail_stat,
+                                              get_schema_version, migrate,)
 from matchypatchy.database.mpdb import (MatchyPatchyDB,)
-from matchypatchy.database.setup import (setup_chromadb, setup_database,)
-from matchypatchy.database.thumbnails import (THUMBNAIL_NOTFOUND,
+from matchypatchy.database.neighbor_graph import (NeighborGraph,)
+from matchypatchy.database.setup import (INDEXES, create_indexes,
+                                         setup_chromadb, setup_database,)
+from matchypatchy.database.thumbnail_pack import (INDEX_DTYPE, INDEX_FILE,
+                                                  PACK_FILE, TOUCH_INTERVAL,
+                                                  ThumbnailPack,)
+from matchypatchy.database.thumbnails import (DRAFT_SCALES, GC_GRACE,
+                                              PACK_PREFIX, PROJECTS_FILE,
+                                              THUMBNAIL_COLUMNS,
+                                              THUMBNAIL_NOTFOUND,
                                               THUMBNAIL_SIZE,
+                                              THUMBNAIL_STORES,
                                               check_missing_thumbnails,
+                                              collect_thumbnails, draft_scale,
                                               fetch_media_thumbnails,
                                               fetch_roi_thumbnails, get_frame,
+                                              get_frames, get_pack,
+                                              is_key_file, key_path,
+                                              load_thumbnail, migrate_chunk,
+                                              migrate_thumbnails,
+                                              needs_migration,
+                                              project_thumbnails, read_image,
+                                              read_projects, read_thumbnail,
+                                              referenced_thumbnails,
+                                              register_project,
                                               save_media_thumbnail,
-                                              save_roi_thumbnail,)
+                                              save_roi_thumbnail,
+                                              save_thumbnail, save_thumbnails,
+                                              scan_thumbnail_dir,
+                                              select_removals,
+                                              thumbnail_exists, thumbnail_key,
+                                              thumbnail_path, thumbnail_stat,
+                                              touch_thumbnail,
+                                              unreferenced_thumbnails,
+                                              verify_thumbnail,
+                                              write_thumbnail,)
 
-__all__ = ['COLUMNS', 'IMAGE_EXT', 'MatchyPatchyDB', 'THUMBNAIL_NOTFOUND',
-           'THUMBNAIL_SIZE', 'TZ_CONVERT_DICT', 'VIDEO_EXT',
-           'check_missing_thumbnails', 'export_data', 'fetch_individual',
-           'fetch_media', 'fetch_media_thumbnails', 'fetch_regions',
-           'fetch_roi', 'fetch_roi_media', 'fetch_roi_thumbnails',
-           'fetch_station_names_from_id', 'fetch_stations', 'fetch_surveys',
-           'get_frame', 'get_roi_bbox', 'get_roi_frame', 'get_sequence',
-           'get_sha256', 'individual_roi_dict', 'location', 'media',
-           'media_count', 'mpdb', 'save_media_thumbnail', 'save_roi_thumbnail',
-           'sequence_roi_dict', 'setup', 'setup_chromadb', 'setup_database',
-           'thumbnails']
+__all__ = ['COLUMNS', 'ConnectionPool', 'DRAFT_SCALES', 'EmbeddingIndex',
+           'GC_GRACE', 'IMAGE_EXT', 'INDEXES', 'INDEX_DTYPE', 'INDEX_FILE',
+           'MIGRATIONS', 'MatchyPatchyDB', 'NeighborGraph', 'PACK_FILE',
+           'PACK_PREFIX', 'PRAGMAS', 'PROJECTS_FILE', 'REQUIRED_TABLES',
+           'SCHEMA_VERSION', 'THUMBNAIL_COLUMNS', 'THUMBNAIL_NOTFOUND',
+           'THUMBNAIL_SIZE', 'THUMBNAIL_STORES', 'TOUCH_INTERVAL',
+           'TZ_CONVERT_DICT', 'ThumbnailPack', 'VIDEO_EXT', 'add_file_hash',
+           'add_schema_version', 'add_thumbnail_stat',
+           'check_missing_thumbnails', 'collect_thumbnails', 'connection',
+           'create_indexes', 'draft_scale', 'emb_index', 'export_data',
+           'fetch_individual', 'fetch_media', 'fetch_media_thumbnails',
+           'fetch_regions', 'fetch_roi', 'fetch_roi_media',
+           'fetch_roi_thumbnails', 'fetch_station_names_from_id',
+           'fetch_stations', 'fetch_surveys', 'get_frame', 'get_frames',
+           'get_pack', 'get_roi_bbox', 'get_roi_frame', 'get_schema_version',
+           'get_sequence', 'get_sha256', 'group_ids', 'hash_files',
+           'individual_roi_dict', 'is_key_file', 'key_path', 'load_thumbnail',
+           'location', 'media', 'media_count', 'migrate', 'migrate_chunk',
+           'migrate_thumbnails', 'migrations', 'mpdb', 'needs_migration',
+           'neighbor_graph', 'project_thumbnails', 'read_image',
+           'read_projects', 'read_thumbnail', 'referenced_thumbnails',
+           'register_project', 'save_media_thumbnail', 'save_roi_thumbnail',
+           'save_thumbnail', 'save_thumbnails', 'scan_thumbnail_dir',
+           'select_removals', 'sequence_roi_dict', 'setup', 'setup_chromadb',
+           'setup_database', 'thumbnail_exists', 'thumbnail_key',
+           'thumbnail_pack', 'thumbnail_path', 'thumbnail_stat', 'thumbnails',
+           'touch_thumbnail', 'unreferenced_thumbnails', 'verify_thumbnail',
+           'write_thumbnail']
@@ -0,0 +1,134 @@
+"""
+Persistent SQLite Connections for MatchyPatchyDB
+
+Each thread gets one long-lived connection, opened on first use
+and closed when the thread exits, the pool is released or the pool is closed
+"""
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,  # negative = KiB, ~64MB page cache
+    'mmap_size': 268435456,  # 256MB
+}
+
+
+class _ThreadConnection():
+    """Holder for one thread's connection, closes it when released"""
+    def __init__(self, connection, generation):
+        self.connection = connection
+        self.generation = generation  # pool generation the connection was opened in
+        self.depth = 0  # transaction nesting level
+
+    def close(self):
+        self.connection.close()
+
+    def __del__(self):
+        self.connection.close()
+
+
+class ConnectionPool():
+    def __init__(self, filepath, logger, timeout=10):
+        self.filepath = filepath
+        self.logger = logger
+        self.timeout = timeout
+        self.connects = 0
+        self.commits = 0
+        self._generation = 0  # bumped by close(), older connections are dropped on next checkout
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._holders = weakref.WeakSet()
+
+    def _holder(self):
+        """Return holder for the current thread, connecting if necessary"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None and holder.generation != self._generation and holder.depth == 0:
+            # pool was closed since this thread connected
+            holder.close()
+            holder = None
+        if holder is None:
+            # connections may be closed from the main thread by close_all()
+            connection = sqlite3.connect(self.filepath, timeout=self.timeout, check_same_thread=False)
+            for pragma, value in PRAGMAS.items():
+                connection.execute(f"PRAGMA {pragma}={value};")
+            holder = _ThreadConnection(connection, self._generation)
+            self._local.holder = holder
+            with self._lock:
+                self._holders.add(holder)
+                self.connects += 1
+        return holder
+
+    def connection(self):
+        """Return the current thread's connection"""
+        return self._holder().connection
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """
+        Yield a cursor inside a transaction on the current thread's connection
+        Commits on exit and rolls back on error, nested calls join the outer transaction
+
+        Args
+            - immediate (bool): take the write lock up front (BEGIN IMMEDIATE)
+        """
+        holder = self._holder()
+        cursor = holder.connection.cursor()
+        if holder.depth > 0:
+            holder.depth += 1
+            try:
+                yield cursor
+            finally:
+                holder.depth -= 1
+            return
+
+        holder.depth = 1
+        try:
+            if immediate:
+                cursor.execute("BEGIN IMMEDIATE;")
+            yield cursor
+            holder.connection.commit()
+            with self._lock:
+                self.commits += 1
+        except BaseException:
+            holder.connection.rollback()
+            raise
+        finally:
+            holder.depth = 0
+            cursor.close()
+
+    def in_transaction(self):
+        """True if the current thread is inside a transaction() block"""
+        holder = getattr(self._local, 'holder', None)
+        return holder is not None and holder.depth > 0
+
+    def close(self):
+        """
+        Close the current thread's connection
+        Other threads may be mid-query, they drop their connections on next checkout
+        or when the pool is released
+        """
+        with self._lock:
+            self._generation += 1
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None and holder.depth == 0:
+            holder.close()
+            self._local.holder = None
+
+    def close_all(self):
+        """Close connections for all threads, only once no other thread is using the pool"""
+        with self._lock:
+            holders = list(self._holders)
+            self._holders = weakref.WeakSet()
+        for holder in holders:
+            holder.close()
+        self._local = threading.local()
+
+    def log_stats(self):
+        """Report connection and commit counts"""
+        self.logger.info(f"SQLite connections opened: {self.connects}, commits: {self.commits}")
@@ -0,0 +1,248 @@
+"""
+In-Process Embedding Index
+
+Holds every ROI embedding in one normalized float32 matrix for batched
+cosine k-NN, saved as memory-mapped .npy files next to emb.db
+
+New embeddings are appended to the saved matrix in place and deleted ones are
+marked dead in the id file, so the index is only read from chroma when first built
+"""
+import io
+import os
+import numpy as np
+from pathlib import Path
+
+
+DEAD = -1  # id of a removed row, skipped until the matrix is compacted
+# header readers and writers by .npy format version, for growing the matrix in place
+HEADER_FORMATS = {(1, 0): (np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0),
+                  (2, 0): (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0)}
+
+
+class EmbeddingIndex():
+    PAGE_SIZE = 10000  # embeddings fetched from chroma per request
+    COMPACT_FRACTION = 0.25  # rewrite the matrix once this share of rows is dead
+
+    def __init__(self, DB_PATH, logger, block_size=256):
+        self.matrix_filepath = Path(DB_PATH) / 'emb_index.npy'
+        self.ids_filepath = Path(DB_PATH) / 'emb_index_ids.npy'
+        self.logger = logger
+        self.block_size = block_size  # queries per matrix multiply
+        self.matrix = None
+        self.ids = None  # id per matrix row, DEAD for removed rows
+        self.dead = np.zeros(0, dtype=np.int64)  # rows of removed embeddings
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def embedded_ids(self):
+        """Ids of live rows in matrix order"""
+        if self.ids is None:
+            return np.zeros(0, dtype=np.int64)
+        return self.ids[self.ids != DEAD]
+
+    def invalidate(self):
+        """Drop loaded index and remove saved files"""
+        self.matrix = None
+        self.ids = None
+        self.dead = np.zeros(0, dtype=np.int64)
+        self.rows = {}
+        for filepath in (self.matrix_filepath, self.ids_filepath):
+            try:
+                filepath.unlink(missing_ok=True)
+            except OSError as error:
+                self.logger.warning(f"Could not remove {filepath}: {error}")
+
+    def load(self, count):
+        """Load saved index, returns False if missing or not holding count embeddings"""
+        if self.ids is not None and len(self) == count:
+            return True
+        if not (self.matrix_filepath.is_file() and self.ids_filepath.is_file()):
+            return False
+        try:
+            ids = np.load(self.ids_filepath)
+            matrix = np.load(self.matrix_filepath, mmap_mode='r')
+        except (OSError, ValueError) as error:
+            self.logger.info(f"Could not load embedding index: {error}")
+            return False
+        if len(matrix) != len(ids) or np.count_nonzero(ids != DEAD) != count:
+            return False
+        self.matrix = matrix
+        self._set_ids(ids)
+        return True
+
+    def build(self, collection):
+        """Rebuild index from chroma collection page by page and save it"""
+        self.matrix = None
+        count = collection.count()
+        if count == 0:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self._set_ids(np.zeros(0, dtype=np.int64))
+            return
+
+        ids = np.zeros(count, dtype=np.int64)
+        matrix_tmp = self.matrix_filepath.with_suffix('.tmp.npy')
+        ids_tmp = self.ids_filepath.with_suffix('.tmp.npy')
+        matrix = None
+        for offset in range(0, count, self.PAGE_SIZE):
+            page = collection.get(include=['embeddings'], limit=self.PAGE_SIZE, offset=offset)
+            vectors = normalize(page['embeddings'])
+            if matrix is None:
+                matrix = np.lib.format.open_memmap(matrix_tmp, mode='w+', dtype=np.float32,
+                                                   shape=(count, vectors.shape[1]))
+            matrix[offset:offset + len(vectors)] = vectors
+            ids[offset:offset + len(vectors)] = [int(x) for x in page['ids']]
+        matrix.flush()
+        del matrix
+        np.save(ids_tmp, ids)
+        os.replace(matrix_tmp, self.matrix_filepath)
+        os.replace(ids_tmp, self.ids_filepath)
+
+        self.matrix = np.load(self.matrix_filepath, mmap_mode='r')
+        self._set_ids(ids)
+        self.logger.info(f"Built embedding index with {count} embeddings")
+
+    def add(self, ids, embeddings):
+        """
+        Append embeddings to the saved index, replacing any already held for the same ids
+        The index must be loaded, returns False if it could not be updated
+        """
+        if self.ids is None or len(ids) == 0:
+            return False
+        ids = np.asarray([int(id) for id in ids], dtype=np.int64)
+        vectors = normalize(embeddings)
+        if len(self.ids) and vectors.shape[1] != self.matrix.shape[1]:
+            return False
+        self._mark_dead(ids)
+        try:
+            if len(self.ids) == 0 or not self._append_rows(vectors):
+                self._write(np.concatenate([self.ids, ids]), [(self.matrix, None), (vectors, None)])
+                return True
+        except OSError as error:
+            self.logger.warning(f"Could not update embedding index: {error}")
+            return False
+        self._save_ids(np.concatenate([self.ids, ids]))
+        return True
+
+    def remove(self, ids):
+        """
+        Drop embeddings from the saved index, compacting once enough rows are dead
+        The index must be loaded, returns False if it could not be updated
+        """
+        if self.ids is None:
+            return False
+        if len(ids) == 0:
+            return True
+        self._mark_dead(np.asarray([int(id) for id in ids], dtype=np.int64))
+        try:
+            if len(self.dead) > self.COMPACT_FRACTION * len(self.ids):
+                live = np.flatnonzero(self.ids != DEAD)
+                self._write(self.ids[live], [(self.matrix, live)])
+            else:
+                self._save_ids(self.ids)
+        except OSError as error:
+            self.logger.warning(f"Could not update embedding index: {error}")
+            return False
+        return True
+
+    def _mark_dead(self, ids):
+        """Mark rows of ids as removed in memory"""
+        rows = [self.rows[int(id)] for id in ids if int(id) in self.rows]
+        if rows:
+            self.ids = np.array(self.ids)
+            self.ids[rows] = DEAD
+            self._set_ids(self.ids)
+
+    def _append_rows(self, vectors):
+        """
+        Append rows to the saved matrix and grow its header in place
+        Returns False if the header cannot grow without moving the data
+        """
+        shape = (self.matrix.shape[0] + len(vectors), self.matrix.shape[1])
+        # release the map before writing, mapped files cannot be extended on every platform
+        self.matrix = None
+        with open(self.matrix_filepath, 'r+b') as matrix_file:
+            version = np.lib.format.read_magic(matrix_file)
+            read_header, write_header = HEADER_FORMATS.get(version, (None, None))
+            header = io.BytesIO()
+            if read_header is not None:
+                read_header(matrix_file)
+                write_header(header, {'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                                      'fortran_order': False, 'shape': shape})
+            if read_header is None or header.tell() != matrix_file.tell():
+                self.matrix = np.load(self.matrix_filepath, mmap_mode='r')
+                return False
+            matrix_file.seek(0, os.SEEK_END)
+            matrix_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            matrix_file.flush()
+            matrix_file.seek(0)
+            matrix_file.write(header.getvalue())
+        self.matrix = np.load(self.matrix_filepath, mmap_mode='r')
+        return True
+
+    def _write(self, ids, blocks):
+        """
+        Rewrite the saved matrix page by page, then its ids
+        blocks: (array, rows to copy or None for all)
+        """
+        count = len(ids)
+        width = max([source.shape[1] for source, _ in blocks if len(source)], default=0)
+        matrix_tmp = self.matrix_filepath.with_suffix('.tmp.npy')
+        matrix = np.lib.format.open_memmap(matrix_tmp, mode='w+', dtype=np.float32, shape=(count, width))
+        offset = 0
+        for source, rows in blocks:
+            for start in range(0, len(source) if rows is None else len(rows), self.PAGE_SIZE):
+                page = source[start:start + self.PAGE_SIZE] if rows is None else source[rows[start:start + self.PAGE_SIZE]]
+                matrix[offset:offset + len(page)] = page
+                offset += len(page)
+        matrix.flush()
+        del matrix
+        self.matrix = None
+        os.replace(matrix_tmp, self.matrix_filepath)
+        self.matrix = np.load(self.matrix_filepath, mmap_mode='r')
+        self._save_ids(ids)
+
+    def _save_ids(self, ids):
+        """Write ids atomically, after the matrix rows they describe"""
+        ids_tmp = self.ids_filepath.with_suffix('.tmp.npy')
+        np.save(ids_tmp, ids)
+        os.replace(ids_tmp, self.ids_filepath)
+        self._set_ids(ids)
+
+    def _set_ids(self, ids):
+        self.ids = ids
+        self.dead = np.flatnonzero(ids == DEAD)
+        self.rows = {int(id): row for row, id in enumerate(ids) if id != DEAD}
+
+    def knn(self, query_ids, k=3):
+        """
+        Cosine k nearest neighbors for each query id, excluding itself
+
+        Returns
+            - dict of query id to list of (neighbor id, distance), nearest first
+        """
+        results = {query_id: [] for query_id in query_ids}
+        queries = [(query_id, self.rows[query_id]) for query_id in results if query_id in self.rows]
+        n = min(k + 1, len(self))
+        for start in range(0, len(queries), self.block_size):
+            block = queries[start:start + self.block_size]
+            similarity = self.matrix[[row for _, row in block]] @ self.matrix.T
+            similarity[:, self.dead] = -np.inf
+            # unordered top n per query, then sort only those
+            top = np.argpartition(-similarity, n - 1, axis=1)[:, :n]
+            top_similarity = np.take_along_axis(similarity, top, axis=1)
+            order = np.argsort(-top_similarity, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            distances = np.clip(1 - np.take_along_axis(top_similarity, order, axis=1), 0, 2)
+            for (query_id, row), neighbors, distance in zip(block, top, distances):
+                results[query_id] = [(int(self.ids[j]), float(d)) for j, d in zip(neighbors, distance) if j != row][:k]
+        return results
+
+
+def normalize(embeddings):
+    """float32 rows scaled to unit length, so cosine similarity is a dot product"""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
@@ -2,8 +2,11 @@
 Functions for Manipulating and Processing ROIs
 """
 import hashlib
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 IMAGE_EXT = ['.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff']
 VIDEO_EXT = ['.mp4', '.avi', '.mov', '.mkv', '.wmv']
@@ -24,6 +27,45 @@ def get_sha256(path: str | Path,
     return h.hexdigest()
 
 
+def hash_files(filepaths, workers: int = 8, known=None):
+    """
+    Hash files on a bounded thread pool ahead of the caller
+    Yields (sha256, size, mtime_ns) per filepath in input order, None if the file could not be read
+
+    Args
+        - filepaths (iterable): paths to hash
+        - workers (int): number of hashing threads
+        - known (dict): filepath to (size, mtime_ns, sha256) from earlier imports,
+                        files with unchanged size and modified time reuse their sha256 without being read
+    """
+    known = known or {}
+
+    def safe_hash(filepath):
+        try:
+            stat = Path(filepath).stat()
+            cached = known.get(str(filepath))
+            if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                return cached[2], stat.st_size, stat.st_mtime_ns
+            return get_sha256(filepath), stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return None
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for filepath in filepaths:
+                pending.append(pool.submit(safe_hash, filepath))
+                # keep a bounded number of files in flight
+                if len(pending) >= workers * 4:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # caller stopped early, drop queued work
+            for future in pending:
+                future.cancel()
+
+
 def fetch_media(mpDB, ids=None):
     """
     Fetches all media info, converts to dataframe
@@ -127,44 +169,54 @@ def get_roi_frame(roi):
     return None
 
 
-def get_sequence(id, roi_media):
+def group_ids(roi_media, column, sort_by=None):
+    """
+    Group index of roi_media by column in a single pass
+
+    Returns dict of column value to list of ids, groups in order of first appearance,
+    ids in frame order or by sort_by within each group, missing values are not grouped
+    """
+    codes, values = pd.factorize(roi_media[column])
+    if sort_by is None:
+        order = np.argsort(codes, kind='stable')
+    else:
+        order = np.lexsort((roi_media[sort_by].to_numpy(), codes))
+    # missing values are coded -1 and sort first
+    order = order[np.count_nonzero(codes < 0):]
+    ids = roi_media.index.to_numpy()[order].tolist()
+    bounds = np.cumsum(np.bincount(codes[order], minlength=len(values)))
+    return {value: ids[start:end] for value, start, end in zip(values.tolist(), np.r_[0, bounds[:-1]], bounds)}
+
+
+def get_sequence(id, roi_media, sequences=None):
     """
-    Return two lists of roi.ids
+    Return list of roi.ids in the same sequence as id
 
-    Group by capture, order by frame number
+    Ordered by timestamp
+    sequences is sequence_roi_dict(roi_media, sort_by='timestamp'), build it once
+    when looking up many rois so each lookup only touches its own sequence
     """
-    sequence_id = roi_media.loc[id, "sequence_id"]
-    sequence = roi_media[roi_media['sequence_id'] == sequence_id]
-    sequence = sequence.sort_values(by=['timestamp'])
-    return sequence.index.to_list()
+    if sequences is None:
+        sequences = sequence_roi_dict(roi_media, sort_by='timestamp')
+    return sequences.get(roi_media.at[id, "sequence_id"], [])
 
 
-def sequence_roi_dict(roi_media):
+def sequence_roi_dict(roi_media, sort_by=None):
     """
-    Return two lists of roi.ids
+    Return dict of sequence_id to list of roi.ids
 
-    Group by capture, order by frame number
+    Group by capture, in frame order or by sort_by
     """
-    sequence_dict = dict()
-    sequence_ids = roi_media["sequence_id"].to_list()
-    for s in sequence_ids:
-        sequence = roi_media[roi_media['sequence_id'] == s]
-        sequence_dict[s] = sequence.index.to_list()
-    return sequence_dict
+    return group_ids(roi_media, 'sequence_id', sort_by=sort_by)
 
 
 def individual_roi_dict(roi_media):
     """
-    Return two lists of roi.ids
+    Return dict of individual_id to list of roi.ids
 
-    Group by capture, order by frame number
+    Group by individual, in frame order
     """
-    individual_dict = dict()
-    individual_ids = roi_media["individual_id"].to_list()
-    for iid in individual_ids:
-        individual = roi_media[roi_media['individual_id'] == iid]
-        individual_dict[iid] = individual.index.to_list()
-    return individual_dict
+    return group_ids(roi_media, 'individual_id')
 
 
 def media_count(mpDB, survey_id):
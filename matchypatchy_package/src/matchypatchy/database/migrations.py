@@ -0,0 +1,88 @@
+"""
+Versioned Schema Migrations for matchypatchy Database
+
+The schema_version in the metadata table records which steps have run.
+New databases start from the baseline tables in setup_database and
+are brought up to date by the same steps as existing ones.
+"""
+import time
+import sqlite3
+
+from matchypatchy.database.setup import create_indexes
+
+
+# tables every matchypatchy database must have, regardless of version
+REQUIRED_TABLES = {'metadata', 'region', 'survey', 'station', 'media', 'roi',
+                   'individual', 'sequence', 'camera', 'media_thumbnails', 'roi_thumbnails'}
+
+
+def add_schema_version(cursor):
+    """Store schema version in metadata table"""
+    cursor.execute("ALTER TABLE metadata ADD COLUMN schema_version INTEGER NOT NULL DEFAULT 0;")
+
+
+def add_thumbnail_stat(cursor):
+    """Record thumbnail size and modified time at generation, to verify without opening"""
+    for table in ("media_thumbnails", "roi_thumbnails"):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN size INTEGER;")
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN mtime REAL;")
+
+
+def add_file_hash(cursor):
+    """Record size and modified time of hashed files, so unchanged files are not read again"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS file_hash (
+                        filepath TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        sha256 TEXT NOT NULL);''')
+
+
+# (version, description, step), in order
+# each step takes a cursor inside an open transaction
+MIGRATIONS = [
+    (1, "Add schema_version to metadata", add_schema_version),
+    (2, "Add indexes on join and filter columns", create_indexes),
+    (3, "Add size and mtime to thumbnail tables", add_thumbnail_stat),
+    (4, "Add file_hash table", add_file_hash),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    """Return schema version of database, 0 if unversioned"""
+    cursor.execute("PRAGMA table_info(metadata);")
+    columns = [row[1] for row in cursor.fetchall()]
+    if 'schema_version' not in columns:
+        return 0
+    cursor.execute("SELECT schema_version FROM metadata WHERE id=1;")
+    return cursor.fetchone()[0]
+
+
+def migrate(mpDB):
+    """
+    Apply pending migrations in order, each in its own transaction
+    Returns resulting schema version, None if the database cannot be migrated
+    """
+    try:
+        version = get_schema_version(mpDB.pool.connection().cursor())
+        if version > SCHEMA_VERSION:
+            mpDB.logger.error(f"Database schema version {version} is newer than supported version {SCHEMA_VERSION}.")
+            return None
+
+        for step_version, description, step in MIGRATIONS:
+            if step_version <= version:
+                continue
+            start = time.time()
+            with mpDB.transaction(immediate=True) as cursor:
+                # another instance may have migrated while waiting for the lock
+                if get_schema_version(cursor) < step_version:
+                    step(cursor)
+                    cursor.execute("UPDATE metadata SET schema_version=? WHERE id=1;", (step_version,))
+            version = step_version
+            mpDB.logger.info(f"Migrated database to schema version {version} ({description}) in {time.time() - start:.2f}s")
+        return version
+
+    except sqlite3.Error as error:
+        mpDB.logger.error(f"Failed to migrate database: {error}")
+        return None
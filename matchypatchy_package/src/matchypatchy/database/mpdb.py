@@ -1,6 +1,8 @@
 '''
 Class Definition for MatchyPatchyDB
 '''
+import os
+import json
 import datetime
 from typing import Optional
 import sqlite3
@@ -9,20 +11,35 @@ from pathlib import Path
 from random import randrange
 
 from matchypatchy.database.setup import setup_database, setup_chromadb
-from matchypatchy.config import resource_path
+from matchypatchy.database.connection import ConnectionPool
+from matchypatchy.database.emb_index import EmbeddingIndex
+from matchypatchy.database.neighbor_graph import NeighborGraph
+from matchypatchy.database.migrations import REQUIRED_TABLES, migrate
 from matchypatchy.database.location import TZ_CONVERT_DICT
 
 
+MEDIA_COLUMNS = ("filepath", "sha256", "ext", "timestamp", "station_id",
+                 "camera_id", "sequence_id", "external_id", "comment")
+ROI_COLUMNS = ("media_id", "frame", "bbox_x", "bbox_y", "bbox_w", "bbox_h",
+               "viewpoint", "reviewed", "favorite", "individual_id", "emb")
+
+
 class MatchyPatchyDB():
     def __init__(self, DB_PATH, logger):
         self.filepath = Path(DB_PATH) / 'matchypatchy.db'
         self.chroma_filepath = Path(DB_PATH) / 'emb.db'
         self.logger = logger
+        self.pool = ConnectionPool(self.filepath, logger)
+        self.emb_index = EmbeddingIndex(DB_PATH, logger)
+        self.neighbor_graph = NeighborGraph(DB_PATH, logger)
+        self._chroma_client = None
+        self._chroma_collection = None
         if self.filepath.is_file() and self.chroma_filepath.is_dir():
             self.key = self.validate()
         else:
             self.key = '{:05}'.format(randrange(1, 10 ** 5))
             setup_database(self.key, self.filepath)
+            migrate(self)
             setup_chromadb(self.key, self.chroma_filepath)
             # add default region and survey
             timezone = str(datetime.datetime.now().astimezone().tzname())
@@ -35,41 +52,84 @@ class MatchyPatchyDB():
         filepath = Path(DB_PATH) / 'matchypatchy.db'
         chroma_filepath = Path(DB_PATH) / 'emb.db'
         if filepath.is_file() and chroma_filepath.is_dir():
+            previous = (self.filepath, self.chroma_filepath, self.emb_index, self.neighbor_graph)
+            self.filepath = filepath
+            self.chroma_filepath = chroma_filepath
+            self.emb_index = EmbeddingIndex(DB_PATH, self.logger)
+            self.neighbor_graph = NeighborGraph(DB_PATH, self.logger)
+            self.reset_pool()
+            self.reset_chroma()
             valid = self.validate()
             if valid:
                 self.key = valid
-                self.filepath = filepath
-                self.chroma_filepath = chroma_filepath
                 return True
             else:
+                # keep using previous database
+                self.filepath, self.chroma_filepath, self.emb_index, self.neighbor_graph = previous
+                self.reset_pool()
+                self.reset_chroma()
                 return False
         else:
             # create new databases
             self.filepath = filepath
             self.chroma_filepath = chroma_filepath
+            self.emb_index = EmbeddingIndex(DB_PATH, self.logger)
+            self.neighbor_graph = NeighborGraph(DB_PATH, self.logger)
+            self.reset_pool()
+            self.reset_chroma()
             self.key = '{:05}'.format(randrange(1, 10 ** 5))
             setup_database(self.key, self.filepath)
+            migrate(self)
             setup_chromadb(self.key, self.chroma_filepath)
             return True
 
+    def reset_pool(self):
+        """Close this thread's connection and point the pool at the current filepath"""
+        self.pool.close()
+        self.pool = ConnectionPool(self.filepath, self.logger)
+
+    def reset_chroma(self):
+        """Drop cached chroma client and collection, reopened on next use"""
+        self._chroma_client = None
+        self._chroma_collection = None
+
+    def emb_collection(self):
+        """Return chroma embedding collection, opening client on first use"""
+        if self._chroma_collection is None:
+            self._chroma_client = chromadb.PersistentClient(str(self.chroma_filepath))
+            self._chroma_collection = self._chroma_client.get_collection(name="embedding_collection")
+        return self._chroma_collection
+
+    def transaction(self, immediate=False):
+        """
+        Context manager yielding a cursor inside a single transaction
+
+            with mpDB.transaction() as cursor:
+                cursor.execute(...)
+
+        Write methods called inside an outer transaction log and re-raise sqlite3.Error
+        instead of returning a failure value, so the whole block rolls back
+        """
+        return self.pool.transaction(immediate=immediate)
+
+    def close(self):
+        """Close all open connections and report connection statistics, after background threads stop"""
+        self.pool.log_stats()
+        self.pool.close_all()
+
     def retrieve_key(self):
         """Retrieve key from both databases to confirm match"""
-        db = sqlite3.connect(self.filepath)
-        cursor = db.cursor()
+        cursor = self.pool.connection().cursor()
         cursor.execute("SELECT key FROM metadata WHERE id=1;")
         mpdb_key = cursor.fetchone()[0]
-        db.close()
 
-        client = chromadb.PersistentClient(str(self.chroma_filepath))
-        collection = client.get_collection(name="embedding_collection")
-        chroma_key = collection.metadata['key']
+        chroma_key = self.emb_collection().metadata['key']
 
         return mpdb_key, chroma_key
 
     def info(self):
         """Get current counts of media and roi in database"""
-        db = sqlite3.connect(self.filepath)
-        cursor = db.cursor()
+        cursor = self.pool.connection().cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = cursor.fetchall()
         self.logger.info(tables)
@@ -81,35 +141,28 @@ class MatchyPatchyDB():
         roi = cursor.fetchone()[0]
         print(f"ROI: {roi}")
         self.logger.info(f"ROI: {roi}")
-        db.close()
+        self.pool.log_stats()
 
     def validate(self):
-        """Confirm that the database schema matches expected schema"""
-        db = sqlite3.connect(self.filepath)
-        cursor = db.cursor()
-        cursor.execute("SELECT name, type, sql FROM sqlite_master WHERE type IN ('table', 'index', 'view', 'trigger')")
-        schema = cursor.fetchall()
-        db.close()
-
-        s = ""
-        for name, obj_type, sql in schema:
-            s = s + (f"{obj_type.upper()}: {name}\n{sql}\n")
-
-        schema_path = resource_path('assets/schema.txt')
-        with open(schema_path, 'r') as file:
-            content = file.read()
-        match_schema = (content==s)
-        if match_schema:
-            # retrieve keys and confirm match
-            mpkey, chromakey = self.retrieve_key()
-            if mpkey == chromakey:
-                return mpkey
-            else:
-                self.logger.error("Key mismatch for Image DB and Emb DB.")
-                return False
-        else:
+        """Migrate database to current schema version, confirm keys match"""
+        cursor = self.pool.connection().cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        tables = {row[0] for row in cursor.fetchall()}
+        missing = REQUIRED_TABLES - tables
+        if missing:
+            self.logger.error(f"Schema of selected DB invalid, missing tables: {sorted(missing)}")
+            return False
+
+        if migrate(self) is None:
             self.logger.error("Schema of selected DB invalid.")
-            print(s)
+            return False
+
+        # retrieve keys and confirm match
+        mpkey, chromakey = self.retrieve_key()
+        if mpkey == chromakey:
+            return mpkey
+        else:
+            self.logger.error("Key mismatch for Image DB and Emb DB.")
             return False
 
     def _command(self, command, quiet=True):
@@ -120,23 +173,16 @@ class MatchyPatchyDB():
         try:
             if not quiet:
                 print(command)
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            cursor.execute(command)
-            self.logger.info(f"Executed command: {command}")
-            rows = cursor.fetchall()
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                cursor.execute(command)
+                self.logger.info(f"Executed command: {command}")
+                rows = cursor.fetchall()
             return rows
         except sqlite3.OperationalError as error:
-            self.logger.error("Operational error executing command.", error)
-            if db:
-                db.close()
+            self.logger.error(f"Operational error executing command: {error}")
             return None
         except sqlite3.Error as error:
-            self.logger.error("Failed to execute command.", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to execute command: {error}")
             return None
 
     # INSERT -------------------------------------------------------------------
@@ -149,22 +195,19 @@ class MatchyPatchyDB():
             - year_end (int)
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO survey
-                        (name, region_id, year_start, year_end)
-                        VALUES (?, ?, ?, ?);"""
-            data_tuple = (name, region_id, year_start, year_end)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO survey
+                            (name, region_id, year_start, year_end)
+                            VALUES (?, ?, ?, ?);"""
+                data_tuple = (name, region_id, year_start, year_end)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             self.logger.info(f"Added survey: {name} with region_id: {region_id}, year_start: {year_start}, year_end: {year_end}")
             return id
         except sqlite3.Error as error:
-            self.logger.error("Failed to add survey: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add survey: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_region(self, name: str, timezone: str):
@@ -174,20 +217,17 @@ class MatchyPatchyDB():
             - timezone (str) Optional
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO region (name, timezone) VALUES (?, ?);"""
-            data_tuple = (name, timezone)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO region (name, timezone) VALUES (?, ?);"""
+                data_tuple = (name, timezone)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             self.logger.info(f"Added region: {name} with timezone: {timezone}")
             return id
         except sqlite3.Error as error:
-            self.logger.error("Failed to add region: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add region: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_station(self, name: str, lat: float, long: float, survey_id: int):
@@ -199,22 +239,19 @@ class MatchyPatchyDB():
             - survey_id (int) NOT NULL
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO station
-                        (name, lat, long, survey_id)
-                        VALUES (?, ?, ?, ?);"""
-            data_tuple = (name, lat, long, survey_id)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO station
+                            (name, lat, long, survey_id)
+                            VALUES (?, ?, ?, ?);"""
+                data_tuple = (name, lat, long, survey_id)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             self.logger.info(f"Added station: {name} with lat: {lat}, long: {long}, survey_id: {survey_id}")
             return id
         except sqlite3.Error as error:
-            self.logger.error("Failed to add station: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add station: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_individual(self, name: str, sex: Optional[str] = None, age: Optional[str] = None):
@@ -225,21 +262,18 @@ class MatchyPatchyDB():
             - age (str)
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO individual
-                        (name, sex, age)
-                        VALUES (?, ?, ?);"""
-            data_tuple = (name, sex, age)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO individual
+                            (name, sex, age)
+                            VALUES (?, ?, ?);"""
+                data_tuple = (name, sex, age)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             return id
         except sqlite3.Error as error:
-            self.logger.error("Failed to add individual: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add individual: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_media(self,
@@ -266,38 +300,31 @@ class MatchyPatchyDB():
             comment TEXT,
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO media
-                        (filepath, sha256, ext, timestamp, station_id,
-                        camera_id, sequence_id, external_id, comment)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);"""
-            data_tuple = (filepath, sha256, ext, timestamp, station_id,
-                          camera_id, sequence_id, external_id, comment)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO media
+                            (filepath, sha256, ext, timestamp, station_id,
+                            camera_id, sequence_id, external_id, comment)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+                data_tuple = (filepath, sha256, ext, timestamp, station_id,
+                              camera_id, sequence_id, external_id, comment)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             return id
 
         # filepath already exists
         except sqlite3.IntegrityError as error:
             if 'UNIQUE constraint failed: media.filepath' in error.args[0]:
                 self.logger.error(f"Failed to add {filepath}, already exists in database.")
-                if db:
-                    db.close()
                 return "duplicate_error"
-            
+
             if 'UNIQUE constraint failed: media.sha256' in error.args[0]:
                 self.logger.error(f"Failed to add {filepath}, file is a duplicate.")
-                if db:
-                    db.close()
                 return "duplicate_error"
 
         except sqlite3.Error as error:
-            self.logger.error("Failed to add media: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add media: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_roi(self, media_id: int,
@@ -305,7 +332,7 @@ class MatchyPatchyDB():
                 viewpoint: Optional[str] = None,
                 reviewed: int = 0,
                 favorite: int = 0,
-                individual_id: Optional[int] = None, 
+                individual_id: Optional[int] = None,
                 emb: int = 0):
         """
         Add a roi with:
@@ -322,40 +349,52 @@ class MatchyPatchyDB():
             - emb (int) references chroma embedding id
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO roi
-                        (media_id, frame, bbox_x, bbox_y, bbox_w, bbox_h,
-                         viewpoint, reviewed, favorite, individual_id, emb)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
-            data_tuple = (media_id, frame, bbox_x, bbox_y, bbox_w, bbox_h,
-                          viewpoint, reviewed, favorite, individual_id, emb)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO roi
+                            (media_id, frame, bbox_x, bbox_y, bbox_w, bbox_h,
+                             viewpoint, reviewed, favorite, individual_id, emb)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+                data_tuple = (media_id, frame, bbox_x, bbox_y, bbox_w, bbox_h,
+                              viewpoint, reviewed, favorite, individual_id, emb)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             return id
         except sqlite3.Error as error:
-            self.logger.error(f"Failed to add roi for media: {media_id}.", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add roi for media {media_id}: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_sequence(self):
         """Increase sequence counter table, return value"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO sequence DEFAULT VALUES;"""
-            cursor.execute(command)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO sequence DEFAULT VALUES;"""
+                cursor.execute(command)
+                id = cursor.lastrowid
             return id
         except sqlite3.Error as error:
-            self.logger.error("Failed to add sequence: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add sequence: {error}")
+            if self.pool.in_transaction():
+                raise
+            return None
+
+    def add_sequences(self, n):
+        """
+        Allocate a block of n sequence ids in one transaction
+        Returns list of new ids, None on failure
+        """
+        try:
+            with self.transaction(immediate=True) as cursor:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sequence;")
+                last_id = cursor.fetchone()[0]
+                ids = list(range(last_id + 1, last_id + n + 1))
+                cursor.executemany("INSERT INTO sequence (id) VALUES (?);", [(id,) for id in ids])
+            return ids
+        except sqlite3.Error as error:
+            self.logger.error(f"Failed to add sequences: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_camera(self, name: str, station_id: int):
@@ -365,19 +404,16 @@ class MatchyPatchyDB():
             - station_id (int) NOT NULL
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = """INSERT INTO camera (name, station_id) VALUES (?, ?);"""
-            data_tuple = (name, station_id)
-            cursor.execute(command, data_tuple)
-            camera_id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = """INSERT INTO camera (name, station_id) VALUES (?, ?);"""
+                data_tuple = (name, station_id)
+                cursor.execute(command, data_tuple)
+                camera_id = cursor.lastrowid
             return camera_id
         except sqlite3.Error as error:
             self.logger.error(f"Failed to add camera: {error}")
-            if db:
-                db.close()
+            if self.pool.in_transaction():
+                raise
             return None
 
     def add_thumbnail(self, table, fid, filepath):
@@ -389,49 +425,194 @@ class MatchyPatchyDB():
             - filepath (str): path to thumbnail image
         """
         try:
-            db = sqlite3.connect(self.filepath, timeout=10)
-            cursor = db.cursor()
-            command = f"""INSERT INTO {table}_thumbnails (fid, filepath) VALUES (?, ?);"""
-            data_tuple = (fid, filepath)
-            cursor.execute(command, data_tuple)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = f"""INSERT INTO {table}_thumbnails (fid, filepath) VALUES (?, ?);"""
+                data_tuple = (fid, filepath)
+                cursor.execute(command, data_tuple)
+                id = cursor.lastrowid
             return id
-        
+
         # filepath already exists
         except sqlite3.IntegrityError as error:
             if 'UNIQUE constraint failed: media_thumbnails.fid' in error.args[0]:
                 self.logger.error("Failed to add thumbnail, already exists in database.")
-                if db:
-                    db.close()
                 return "duplicate_error"
             if 'UNIQUE constraint failed: roi_thumbnails.fid' in error.args[0]:
                 self.logger.error("Failed to add thumbnail, already exists in database.")
-                if db:
-                    db.close()
                 return "duplicate_error"
         except sqlite3.Error as error:
-            self.logger.error("Failed to add thumbnail: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to add thumbnail: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
+    # BULK INSERT --------------------------------------------------------------
+    def _insert_many(self, cursor, table, columns, rows):
+        """
+        executemany INSERT within an open immediate transaction
+        Returns new ids in insertion order
+        """
+        if not rows:
+            return []
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table};")
+        last_id = cursor.fetchone()[0]
+        command = f"""INSERT INTO {table} ({', '.join(columns)})
+                      VALUES ({', '.join('?' * len(columns))});"""
+        cursor.executemany(command, rows)
+        cursor.execute(f"SELECT id FROM {table} WHERE id > ? ORDER BY id;", (last_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def add_media_many(self, rows, chunk_size=500):
+        """
+        Add many media rows, one transaction per chunk
+
+        Args
+            - rows (list): tuples in MEDIA_COLUMNS order, as for add_media()
+            - chunk_size (int): rows per transaction
+
+        Returns list aligned with rows: new id, "duplicate_error" if the
+        filepath or sha256 already exists, or None if the chunk failed
+        """
+        ids = []
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                with self.transaction(immediate=True) as cursor:
+                    filepaths = [row[0] for row in chunk]
+                    hashes = [row[1] for row in chunk]
+                    placeholders = ', '.join('?' * len(chunk))
+                    cursor.execute(f"""SELECT filepath, sha256 FROM media
+                                       WHERE filepath IN ({placeholders}) OR sha256 IN ({placeholders});""",
+                                   filepaths + hashes)
+                    existing = cursor.fetchall()
+                    seen_filepaths = {row[0] for row in existing}
+                    seen_hashes = {row[1] for row in existing}
+
+                    # report duplicates per row, including repeats within the chunk
+                    new_rows = []
+                    is_new = []
+                    for row in chunk:
+                        if row[0] in seen_filepaths:
+                            self.logger.error(f"Failed to add {row[0]}, already exists in database.")
+                            is_new.append(False)
+                        elif row[1] in seen_hashes:
+                            self.logger.error(f"Failed to add {row[0]}, file is a duplicate.")
+                            is_new.append(False)
+                        else:
+                            seen_filepaths.add(row[0])
+                            seen_hashes.add(row[1])
+                            new_rows.append(row)
+                            is_new.append(True)
+
+                    new_ids = iter(self._insert_many(cursor, "media", MEDIA_COLUMNS, new_rows))
+                    ids.extend(next(new_ids) if new else "duplicate_error" for new in is_new)
+            return ids
+        except sqlite3.Error as error:
+            self.logger.error(f"Failed to add media: {error}")
+            if self.pool.in_transaction():
+                raise
+            return ids + [None] * (len(rows) - len(ids))
+
+    def add_roi_many(self, rows, chunk_size=5000):
+        """
+        Add many roi rows, one transaction per chunk
+
+        Args
+            - rows (list): tuples in ROI_COLUMNS order, as for add_roi()
+            - chunk_size (int): rows per transaction
+
+        Returns list of new ids aligned with rows, None where the chunk failed
+        """
+        ids = []
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                with self.transaction(immediate=True) as cursor:
+                    ids.extend(self._insert_many(cursor, "roi", ROI_COLUMNS, chunk))
+            return ids
+        except sqlite3.Error as error:
+            self.logger.error(f"Failed to add rois: {error}")
+            if self.pool.in_transaction():
+                raise
+            return ids + [None] * (len(rows) - len(ids))
+
+    def add_thumbnail_many(self, table, rows, chunk_size=5000, replace=False):
+        """
+        Add many thumbnail entries to media_thumbnails or roi_thumbnails
+
+        Args
+            - table (str): "media" or "roi"
+            - rows (list): (fid, filepath) or (fid, filepath, size, mtime) tuples
+            - chunk_size (int): rows per transaction
+            - replace (bool): remove existing entries for these fids first
+
+        Returns list aligned with rows: new id, "duplicate_error" if the fid
+        already has a thumbnail, or None if the chunk failed
+        """
+        ids = []
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                with self.transaction(immediate=True) as cursor:
+                    placeholders = ', '.join('?' * len(chunk))
+                    if replace:
+                        cursor.execute(f"DELETE FROM {table}_thumbnails WHERE fid IN ({placeholders});",
+                                       [row[0] for row in chunk])
+                    cursor.execute(f"SELECT fid FROM {table}_thumbnails WHERE fid IN ({placeholders});",
+                                   [row[0] for row in chunk])
+                    seen = {row[0] for row in cursor.fetchall()}
+
+                    new_rows = []
+                    is_new = []
+                    for row in chunk:
+                        if row[0] in seen:
+                            self.logger.error("Failed to add thumbnail, already exists in database.")
+                            is_new.append(False)
+                        else:
+                            seen.add(row[0])
+                            new_rows.append(row)
+                            is_new.append(True)
+
+                    columns = ("fid", "filepath", "size", "mtime")[:len(chunk[0])]
+                    new_ids = iter(self._insert_many(cursor, f"{table}_thumbnails", columns, new_rows))
+                    ids.extend(next(new_ids) if new else "duplicate_error" for new in is_new)
+            return ids
+        except sqlite3.Error as error:
+            self.logger.error(f"Failed to add thumbnails: {error}")
+            if self.pool.in_transaction():
+                raise
+            return ids + [None] * (len(rows) - len(ids))
+
+    def add_file_hashes(self, rows):
+        """
+        Record sha256, size and modified time of hashed files, replacing earlier records
+
+        Args
+            - rows (list): (filepath, size, mtime_ns, sha256) tuples
+        """
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany("""INSERT OR REPLACE INTO file_hash (filepath, size, mtime_ns, sha256)
+                                      VALUES (?, ?, ?, ?);""", rows)
+            return True
+        except sqlite3.Error as error:
+            self.logger.error(f"Failed to add file hashes: {error}")
+            if self.pool.in_transaction():
+                raise
+            return False
+
     def copy(self, table, id):
         """Copy a row from a table by id"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = f"""INSERT INTO {table} SELECT * FROM table WHERE id={id};"""
-            cursor.execute(command)
-            id = cursor.lastrowid
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = f"""INSERT INTO {table} SELECT * FROM table WHERE id={id};"""
+                cursor.execute(command)
+                id = cursor.lastrowid
             return id
         except sqlite3.Error as error:
-            self.logger.error("Failed to copy row: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to copy row: {error}")
+            if self.pool.in_transaction():
+                raise
             return None
 
     # EDIT ---------------------------------------------------------------------
@@ -447,8 +628,6 @@ class MatchyPatchyDB():
             - quiet (bool): if False, prints the executed command
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
             # convert empty values to SQL NULL
             for key, value in replace.items():
                 if value in (None, ''):
@@ -461,21 +640,44 @@ class MatchyPatchyDB():
             command = f"UPDATE {table} SET {replace_values} WHERE id={id}"
             if not quiet:
                 print(command)
-            cursor.execute(command)
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                cursor.execute(command)
+            return True
+        except sqlite3.Error as error:
+            self.logger.error(f"Failed to update table: {error}")
+            if self.pool.in_transaction():
+                raise
+            return False
+
+    def edit_rows(self, table: str, column: str, values: dict, quiet=True):
+        """
+        Edit one column for many rows in a single transaction
+
+        Args
+            - table (str):
+            - column (str): column to update
+            - values (dict): id:value captures to update, empty values become NULL
+            - quiet (bool): if False, prints the executed command
+        """
+        try:
+            command = f"UPDATE {table} SET {column}=? WHERE id=?;"
+            params = [(None if value == '' else value, id) for id, value in values.items()]
+            if not quiet:
+                print(f"{command} x {len(params)}")
+            with self.transaction() as cursor:
+                cursor.executemany(command, params)
             return True
         except sqlite3.Error as error:
-            self.logger.error("Failed to update table: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to update table: {error}")
+            if self.pool.in_transaction():
+                raise
             return False
 
     def select(self, table: str, columns: str = "*", row_cond: Optional[str] = None, quiet=True):
         """
         Select columns based on optional row_cond
         Returns each row as a tuple
-        
+
         Args
             - table (str): table name
             - columns (str): columns to select, default "*"
@@ -483,8 +685,7 @@ class MatchyPatchyDB():
             - quiet (bool): if False, prints the executed command
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
+            cursor = self.pool.connection().cursor()
             if row_cond:
                 command = f'SELECT {columns} FROM {table} WHERE {row_cond};'
             else:
@@ -493,12 +694,9 @@ class MatchyPatchyDB():
                 print(command)
             cursor.execute(command)
             rows = cursor.fetchall()
-            db.close()
             return rows
         except sqlite3.Error as error:
-            self.logger.error("Failed fetch: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed fetch: {error}")
             return None
 
     def select_join(self, table, join_table, join_cond, columns="*", row_cond: Optional[str] = None, quiet=True):
@@ -515,8 +713,7 @@ class MatchyPatchyDB():
             - quiet (bool): if False, prints the executed command
         """
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
+            cursor = self.pool.connection().cursor()
             if row_cond:
                 command = f'SELECT {columns} FROM {table} INNER JOIN {join_table} ON {join_cond} WHERE {row_cond};'
             else:
@@ -526,19 +723,15 @@ class MatchyPatchyDB():
             cursor.execute(command)
             column_names = [description[0] for description in cursor.description]
             rows = cursor.fetchall()  # returns in tuple
-            db.close()
             return rows, column_names
         except sqlite3.Error as error:
-            self.logger.error("Failed fetch: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed fetch: {error}")
             return None, None
 
     def all_media(self, row_cond: Optional[str] = None):
         """Return joined roi and media info for Media Table"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
+            cursor = self.pool.connection().cursor()
             columns = """roi.id, frame, bbox_x ,bbox_y, bbox_w, bbox_h, viewpoint, reviewed,
                          roi.media_id, roi.individual_id, emb, filepath, ext, timestamp,
                          station_id, sequence_id, camera_id, external_id, comment, favorite, name, sex, age"""
@@ -552,19 +745,15 @@ class MatchyPatchyDB():
             cursor.execute(command)
             column_names = [description[0] for description in cursor.description]
             rows = cursor.fetchall()  # returns in tuple
-            db.close()
             return rows, column_names
         except sqlite3.Error as error:
-            self.logger.error("Failed all_media fetch:", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed all_media fetch: {error}")
             return None, None
 
     def stations(self, row_cond=None):
         """Return joined station, survey, region info"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
+            cursor = self.pool.connection().cursor()
             columns = """station.id, station.name, lat, long, station.survey_id, survey.name, region.name"""
             if row_cond:
                 command = f"""SELECT {columns} FROM station LEFT JOIN survey ON station.survey_id = survey.id
@@ -576,92 +765,166 @@ class MatchyPatchyDB():
             cursor.execute(command)
             column_names = columns.split(", ")
             rows = cursor.fetchall()  # returns in tuple
-            db.close()
             return rows, column_names
         except sqlite3.Error as error:
-            self.logger.error("Failed all_media fetch:", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed all_media fetch: {error}")
             return None, None
 
+    def file_hashes(self):
+        """
+        Recorded hashes of previously imported files
+
+        Returns
+            - dict of filepath to (size, mtime_ns, sha256)
+        """
+        rows = self.select("file_hash", columns="filepath, size, mtime_ns, sha256")
+        return {row[0]: tuple(row[1:]) for row in rows or []}
+
     def count(self, table):
         """Return the number of entries in a given table"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
+            cursor = self.pool.connection().cursor()
             cursor.execute(f"SELECT COUNT(*) FROM {table}")
             row_count = cursor.fetchone()[0]
-            db.close()
             return row_count
         except sqlite3.Error as error:
-            self.logger.error(f"Failed to count for {table}:", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to count for {table}: {error}")
             return None
 
     # DELETE -------------------------------------------------------------------
     def delete(self, table, cond):
         """Delete Entries From table Given condition"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = f'DELETE FROM {table} WHERE {cond};'
-            print(command)
-            cursor.execute(command)
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = f'DELETE FROM {table} WHERE {cond};'
+                print(command)
+                cursor.execute(command)
             self.logger.info(f"Deleted from {table} where {cond}")
             return True
         except sqlite3.Error as error:
-            self.logger.error("Failed delete: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed delete: {error}")
+            if self.pool.in_transaction():
+                raise
             return False
 
     def clear(self, table):
         """Clear a table without dropping it"""
         try:
-            db = sqlite3.connect(self.filepath)
-            cursor = db.cursor()
-            command = f'DELETE FROM {table};'
-            cursor.execute(command)
-            db.commit()
-            db.close()
+            with self.transaction() as cursor:
+                command = f'DELETE FROM {table};'
+                cursor.execute(command)
             self.logger.info(f"Cleared table {table}")
             return True
         except sqlite3.Error as error:
-            self.logger.error(f"Failed to clear {table}: ", error)
-            if db:
-                db.close()
+            self.logger.error(f"Failed to clear {table}: {error}")
+            if self.pool.in_transaction():
+                raise
             return False
 
     # EMBEDDINGS ===============================================================
     def add_emb(self, id, embedding):
         """Add embedding to chroma vector database"""
-        client = chromadb.PersistentClient(str(self.chroma_filepath))
-        collection = client.get_collection(name="embedding_collection")
-        collection.add(embeddings=[embedding], ids=[str(id)])
+        self.add_embs([id], [embedding])
+
+    def add_embs(self, ids, embeddings, model_key=None):
+        """
+        Add or replace many embeddings in chroma vector database in one call
+        The saved index is updated in place rather than rebuilt from chroma,
+        model_key of the reid model is recorded to stamp the neighbor graph with
+        """
+        if len(ids) == 0:
+            return
+        collection = self.emb_collection()
+        count = collection.count()
+        collection.upsert(embeddings=list(embeddings), ids=[str(id) for id in ids])
+        if model_key is not None:
+            self.set_emb_model_key(model_key)
+        # ids may be reused after a delete, so any of them can hide a changed vector
+        self.neighbor_graph.mark_dirty(ids)
+        updated = self.emb_index.load(count) and self.emb_index.add(ids, embeddings)
+        if not (updated and len(self.emb_index) == collection.count()):
+            self.emb_index.invalidate()
+
+    def get_embs(self, ids):
+        """
+        Get embeddings for many ROIs from chroma vector database
+
+        Returns
+            - dict of id to embedding, ids without an embedding are omitted
+        """
+        if len(ids) == 0:
+            return {}
+        result = self.emb_collection().get(ids=[str(id) for id in ids], include=['embeddings'])
+        return {int(id): emb for id, emb in zip(result['ids'], result['embeddings'])}
 
     def delete_emb(self, id):
         """Delete embedding from chroma vector database"""
-        client = chromadb.PersistentClient(str(self.chroma_filepath))
-        collection = client.get_collection(name="embedding_collection")
-        collection.delete(ids=[str(id)])
-
-    def knn(self, query_id, k=3):
-        """Get k nearest neighbors of a query ROI from chroma vector database"""
-        client = chromadb.PersistentClient(str(self.chroma_filepath))
-        collection = client.get_collection(name="embedding_collection")
-        query = collection.get(ids=[str(query_id)], include=['embeddings'])['embeddings']
-        # Check if query is empty, ie false positives
-        if len(query) == 0:
-            return {'ids': [[]], 'distances': [[]]}
-        knn = collection.query(query_embeddings=query, n_results=k + 1)
-        return knn
+        self.delete_embs([id])
+
+    def delete_embs(self, ids):
+        """Delete many embeddings from chroma vector database and the saved index"""
+        if len(ids) == 0:
+            return
+        collection = self.emb_collection()
+        count = collection.count()
+        collection.delete(ids=[str(id) for id in ids])
+        self.neighbor_graph.mark_dirty(ids)
+        updated = self.emb_index.load(count) and self.emb_index.remove(ids)
+        if not (updated and len(self.emb_index) == collection.count()):
+            self.emb_index.invalidate()
+
+    def emb_model_filepath(self):
+        """Record of the reid model key, next to emb.db"""
+        return self.chroma_filepath.with_name('emb_model.json')
+
+    def emb_model_key(self):
+        """Model key recorded by add_embs, None if embeddings were added without one"""
+        try:
+            with open(self.emb_model_filepath(), 'r') as model_file:
+                return json.load(model_file).get('model_key')
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def set_emb_model_key(self, model_key):
+        """Record the reid model of the embeddings, the neighbor graph is dropped if it cannot be saved"""
+        if self.emb_model_key() == model_key:
+            return
+        filepath = self.emb_model_filepath()
+        try:
+            tmp = filepath.with_suffix('.tmp.json')
+            with open(tmp, 'w') as model_file:
+                json.dump({'model_key': model_key}, model_file)
+            os.replace(tmp, filepath)
+        except OSError as error:
+            self.logger.warning(f"Could not record embedding model: {error}")
+            self.neighbor_graph.invalidate()
+
+    def knn_many(self, query_ids, k=3):
+        """
+        Get k nearest neighbors of many query ROIs at once from the persisted neighbor graph
+        Builds the index from the chroma vector database if missing or out of date,
+        then queries only ROIs embedded since the graph was saved with the recorded model key
+
+        Returns
+            - dict of query id to list of (neighbor id, distance), nearest first, excluding self
+        """
+        collection = self.emb_collection()
+        if not self.emb_index.load(collection.count()):
+            self.emb_index.build(collection)
+        self.neighbor_graph.update(self.emb_index, k, model_key=self.emb_model_key())
+        return self.neighbor_graph.knn(query_ids, k=k)
 
     def clear_emb(self):
         """Clear vector database and rebuild (no way to delete)"""
-        client = chromadb.PersistentClient(str(self.chroma_filepath))
-        client.delete_collection(name="embedding_collection")
+        if self._chroma_client is None:
+            self._chroma_client = chromadb.PersistentClient(str(self.chroma_filepath))
+        self._chroma_client.delete_collection(name="embedding_collection")
+        self.reset_chroma()
+        self.emb_index.invalidate()
+        self.neighbor_graph.invalidate()
+        try:
+            self.emb_model_filepath().unlink(missing_ok=True)
+        except OSError as error:
+            self.logger.warning(f"Could not remove embedding model record: {error}")
         setup_chromadb(self.key, self.chroma_filepath)
         self.logger.info("Chroma vector database cleared and rebuilt.")
@@ -0,0 +1,204 @@
+"""
+Persisted Neighbor Graph
+
+Stores the top k neighbors and distances of every embedded ROI as memory-mapped
+.npy files next to emb.db, stamped with the embedding model key, so matching
+only runs k-NN for ROIs embedded or left with a deleted neighbor since the last run
+
+Ids whose embedding was replaced or deleted are listed as dirty in the stamp,
+since sqlite reuses ids a changed vector can hide behind an id the graph already holds
+"""
+import os
+import json
+import numpy as np
+from pathlib import Path
+
+
+class NeighborGraph():
+    def __init__(self, DB_PATH, logger, block_size=1024):
+        self.ids_filepath = Path(DB_PATH) / 'emb_graph_ids.npy'
+        self.neighbors_filepath = Path(DB_PATH) / 'emb_graph_neighbors.npy'
+        self.distances_filepath = Path(DB_PATH) / 'emb_graph_distances.npy'
+        self.stamp_filepath = Path(DB_PATH) / 'emb_graph.json'
+        self.logger = logger
+        self.block_size = block_size  # rows merged with new embeddings per matrix multiply
+        self.stamp = None  # {'model_key', 'k', 'dirty'} the graph was built with, and ids changed since
+        self.ids = None
+        self.neighbors = None  # neighbor ids per row, nearest first, -1 if fewer than k
+        self.distances = None  # cosine distance per neighbor, inf if fewer than k
+        self.rows = {}
+
+    def __len__(self):
+        return 0 if self.ids is None else len(self.ids)
+
+    def invalidate(self):
+        """Drop loaded graph and remove saved files"""
+        self.stamp = None
+        self.ids = None
+        self.neighbors = None
+        self.distances = None
+        self.rows = {}
+        for filepath in (self.ids_filepath, self.neighbors_filepath, self.distances_filepath, self.stamp_filepath):
+            try:
+                filepath.unlink(missing_ok=True)
+            except OSError as error:
+                self.logger.warning(f"Could not remove {filepath}: {error}")
+
+    def load(self):
+        """Load saved graph, returns False if missing or incomplete"""
+        if self.ids is not None:
+            return True
+        try:
+            with open(self.stamp_filepath, 'r') as stamp_file:
+                stamp = json.load(stamp_file)
+            ids = np.load(self.ids_filepath)
+            neighbors = np.load(self.neighbors_filepath, mmap_mode='r')
+            distances = np.load(self.distances_filepath, mmap_mode='r')
+        except (OSError, ValueError) as error:
+            self.logger.info(f"No saved neighbor graph: {error}")
+            return False
+        if not (len(ids) == len(neighbors) == len(distances)):
+            return False
+        self.stamp = stamp
+        self._set(ids, neighbors, distances)
+        return True
+
+    def mark_dirty(self, ids):
+        """
+        Record ids whose embedding changed, their rows and rows listing them are queried again
+        The graph is dropped if the record cannot be saved
+        """
+        if len(ids) == 0 or not self.stamp_filepath.is_file():
+            return
+        try:
+            with open(self.stamp_filepath, 'r') as stamp_file:
+                stamp = json.load(stamp_file)
+            stamp['dirty'] = sorted(set(stamp.get('dirty', [])) | {int(id) for id in ids})
+            self._save_stamp(stamp)
+        except (OSError, ValueError) as error:
+            self.logger.warning(f"Could not mark neighbor graph ids as changed: {error}")
+            self.invalidate()
+            return
+        if self.ids is not None:
+            self.stamp = stamp
+
+    def _save_stamp(self, stamp):
+        stamp_tmp = self.stamp_filepath.with_suffix('.tmp.json')
+        with open(stamp_tmp, 'w') as stamp_file:
+            json.dump(stamp, stamp_file)
+        os.replace(stamp_tmp, self.stamp_filepath)
+
+    def _set(self, ids, neighbors, distances):
+        self.ids = ids
+        self.neighbors = neighbors
+        self.distances = distances
+        self.rows = {int(id): row for row, id in enumerate(ids)}
+
+    def save(self, ids, neighbors, distances, stamp):
+        """Write graph atomically and reload it memory-mapped"""
+        self.neighbors = None
+        self.distances = None
+        tmp_files = []
+        for filepath, array in ((self.ids_filepath, ids), (self.neighbors_filepath, neighbors),
+                                (self.distances_filepath, distances)):
+            tmp = filepath.with_suffix('.tmp.npy')
+            np.save(tmp, array)
+            tmp_files.append((tmp, filepath))
+        for tmp, filepath in tmp_files:
+            os.replace(tmp, filepath)
+        # stamp last, a graph without a matching stamp is rebuilt
+        self._save_stamp(stamp)
+        self.stamp = stamp
+        self._set(ids, np.load(self.neighbors_filepath, mmap_mode='r'),
+                  np.load(self.distances_filepath, mmap_mode='r'))
+
+    def update(self, index, k, model_key=None):
+        """
+        Bring graph up to date with a loaded EmbeddingIndex
+
+        Rebuilt in full if the model key changed or it holds fewer than k neighbors,
+        otherwise only new or changed rois and rois that lost or listed a changed neighbor
+        are queried, and existing rows are merged with the new embeddings
+        """
+        stamp = {'model_key': model_key, 'k': int(k)}
+        if not self.load() or self.stamp.get('model_key') != model_key or self.stamp.get('k', 0) < k:
+            self.rebuild(index, stamp)
+            return
+        stamp['k'] = self.stamp['k']  # keep the deeper graph
+        k = stamp['k']
+        dirty = np.asarray(self.stamp.get('dirty', []), dtype=np.int64)
+        index_ids = index.embedded_ids()
+        # changed rows are dropped and treated as new embeddings
+        present = np.isin(self.ids, index_ids) & ~np.isin(self.ids, dirty)
+        new_ids = index_ids[~np.isin(index_ids, self.ids[present])]
+        if present.all() and len(new_ids) == 0:
+            if len(dirty):
+                # only deleted ids changed, none of them were neighbors
+                self._save_stamp(stamp)
+                self.stamp = stamp
+            return
+
+        # rows with a neighbor no longer embedded or changed are queried again
+        removed = self.ids[~present]
+        stale = present & np.isin(self.neighbors, removed).any(axis=1) if len(removed) else np.zeros_like(present)
+        keep = present & ~stale
+        ids = self.ids[keep]
+        neighbors = np.array(self.neighbors[keep])
+        distances = np.array(self.distances[keep])
+        if len(new_ids):
+            neighbors, distances = self.merge(index, ids, neighbors, distances, new_ids, k)
+
+        query_ids = np.concatenate([self.ids[stale], new_ids])
+        query_neighbors, query_distances = self.query(index, query_ids, k)
+        self.save(np.concatenate([ids, query_ids]), np.concatenate([neighbors, query_neighbors]),
+                  np.concatenate([distances, query_distances]), stamp)
+        self.logger.info(f"Updated neighbor graph, queried {len(query_ids)} of {len(self)} rois")
+
+    def rebuild(self, index, stamp):
+        """Query every embedding in the index"""
+        ids = index.embedded_ids()
+        neighbors, distances = self.query(index, ids, stamp['k'])
+        self.save(ids, neighbors, distances, stamp)
+        self.logger.info(f"Built neighbor graph with {len(ids)} rois")
+
+    def query(self, index, query_ids, k):
+        """Nearest k of query ids from the index, as padded arrays"""
+        neighbors = np.full((len(query_ids), k), -1, dtype=np.int64)
+        distances = np.full((len(query_ids), k), np.inf, dtype=np.float32)
+        results = index.knn([int(id) for id in query_ids], k=k)
+        for row, id in enumerate(query_ids):
+            result = results[int(id)]
+            neighbors[row, :len(result)] = [neighbor for neighbor, _ in result]
+            distances[row, :len(result)] = [distance for _, distance in result]
+        return neighbors, distances
+
+    def merge(self, index, ids, neighbors, distances, new_ids, k):
+        """Add new embeddings to the neighbors of existing rows where they are nearer"""
+        new_matrix = index.matrix[[index.rows[int(id)] for id in new_ids]]
+        for start in range(0, len(ids), self.block_size):
+            block = slice(start, start + self.block_size)
+            similarity = index.matrix[[index.rows[int(id)] for id in ids[block]]] @ new_matrix.T
+            candidate_distances = np.concatenate([distances[block], np.clip(1 - similarity, 0, 2)], axis=1)
+            candidate_ids = np.concatenate([neighbors[block], np.broadcast_to(new_ids, similarity.shape)], axis=1)
+            order = np.argsort(candidate_distances, axis=1, kind='stable')[:, :k]
+            neighbors[block] = np.take_along_axis(candidate_ids, order, axis=1)
+            distances[block] = np.take_along_axis(candidate_distances, order, axis=1)
+        return neighbors, distances
+
+    def knn(self, query_ids, k=3):
+        """
+        Stored k nearest neighbors for each query id
+
+        Returns
+            - dict of query id to list of (neighbor id, distance), nearest first
+        """
+        results = {query_id: [] for query_id in query_ids}
+        for query_id in results:
+            row = self.rows.get(query_id)
+            if row is None:
+                continue
+            neighbors = self.neighbors[row, :k].tolist()
+            distances = self.distances[row, :k].tolist()
+            results[query_id] = [(neighbor, distance) for neighbor, distance in zip(neighbors, distances)
+                                 if neighbor >= 0]
+        return results
@@ -6,8 +6,23 @@ import chromadb
 from datetime import datetime
 
 
+# Secondary indexes on hot join and filter columns
+# media_thumbnails.fid and roi_thumbnails.fid are UNIQUE and already indexed
+INDEXES = {
+    'idx_roi_media_id': 'roi (media_id)',
+    'idx_roi_individual_id': 'roi (individual_id)',
+    'idx_media_station_id': 'media (station_id)',
+    'idx_media_sequence_id': 'media (sequence_id)',
+    'idx_media_camera_id': 'media (camera_id)',
+    'idx_station_survey_id': 'station (survey_id)',
+}
+
+
 def setup_database(key, filepath):
-    """Set up SQLite database with required tables"""
+    """
+    Set up SQLite database with baseline tables
+    Brought up to the current schema version by migrations.migrate
+    """
     # Connect to SQLite database
     db = sqlite3.connect(filepath)
     cursor = db.cursor()
@@ -113,6 +128,12 @@ def setup_database(key, filepath):
     return True
 
 
+def create_indexes(cursor):
+    """Create secondary indexes, skipping any that already exist"""
+    for name, target in INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target};")
+
+
 def setup_chromadb(key, filepath):
     """Set up ChromaDB vector database for embeddings"""
     client = chromadb.PersistentClient(str(filepath))
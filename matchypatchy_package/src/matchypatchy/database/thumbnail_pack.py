@@ -0,0 +1,161 @@
+"""
+Single-File Thumbnail Store
+
+Thumbnails are appended to one pack file with a fixed-size record index,
+and read back through a memory map instead of one open() per thumbnail
+"""
+import os
+import mmap
+import time
+import threading
+import numpy as np
+from pathlib import Path
+
+
+PACK_FILE = 'thumbnails.pack'
+INDEX_FILE = 'thumbnails.idx'
+# one record per write or touch, the last record for a key wins
+INDEX_DTYPE = np.dtype([('key', 'u1', (32,)), ('offset', '<u8'), ('length', '<u4'), ('time', '<u8')])
+TOUCH_INTERVAL = 24 * 3600  # seconds between index records for a reused thumbnail
+
+
+class ThumbnailPack():
+    def __init__(self, thumbnail_dir):
+        self.pack_filepath = Path(thumbnail_dir) / PACK_FILE
+        self.index_filepath = Path(thumbnail_dir) / INDEX_FILE
+        self.lock = threading.RLock()
+        self.entries = {}  # key bytes to (offset, length, time)
+        self.index_size = 0  # bytes of index file read so far
+        self.pack_id = None  # (device, inode) of pack the entries refer to
+        self.map = None
+
+    def __len__(self):
+        with self.lock:
+            self.refresh()
+            return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.entry(key) is not None
+
+    def close(self):
+        """Release memory map"""
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+
+    def refresh(self):
+        """Read index records appended since last refresh, reload if the pack was replaced"""
+        try:
+            stat = self.pack_filepath.stat()
+            pack_size = stat.st_size
+            pack_id = (stat.st_dev, stat.st_ino)
+        except OSError:
+            pack_size, pack_id = 0, None
+        if pack_id != self.pack_id:
+            # compacted by another instance, offsets no longer valid
+            self.close()
+            self.entries = {}
+            self.index_size = 0
+            self.pack_id = pack_id
+        try:
+            with open(self.index_filepath, 'rb') as index_file:
+                index_file.seek(self.index_size)
+                data = index_file.read()
+        except OSError:
+            return
+        # ignore a partially written record at the end
+        n = len(data) // INDEX_DTYPE.itemsize
+        records = np.frombuffer(data[:n * INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        for key, offset, length, written in zip(map(bytes, records['key']), records['offset'].tolist(),
+                                                records['length'].tolist(), records['time'].tolist()):
+            if offset + length <= pack_size:
+                self.entries[key] = (offset, length, written)
+        self.index_size += n * INDEX_DTYPE.itemsize
+
+    def entry(self, key):
+        key = bytes.fromhex(key)
+        if key not in self.entries:
+            self.refresh()
+        return self.entries.get(key)
+
+    def read(self, key):
+        """Thumbnail bytes for hex key, None if not in pack"""
+        with self.lock:
+            entry = self.entry(key)
+            if entry is None:
+                return None
+            offset, length, _ = entry
+            if self.map is None or len(self.map) < offset + length:
+                # pack grew since it was mapped
+                self.close()
+                with open(self.pack_filepath, 'rb') as pack_file:
+                    self.map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+            return bytes(self.map[offset:offset + length])
+
+    def write(self, key, data):
+        """Append thumbnail bytes under hex key"""
+        with self.lock:
+            self.refresh()
+            self.pack_filepath.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.pack_filepath, 'ab') as pack_file:
+                offset = pack_file.tell()
+                pack_file.write(data)
+            if self.pack_id is None:
+                stat = self.pack_filepath.stat()
+                self.pack_id = (stat.st_dev, stat.st_ino)
+            self.append_record(bytes.fromhex(key), offset, len(data))
+
+    def touch(self, key):
+        """Mark thumbnail as recently used, returns False if not in pack"""
+        with self.lock:
+            entry = self.entry(key)
+            if entry is None:
+                return False
+            offset, length, written = entry
+            if time.time() - written > TOUCH_INTERVAL:
+                self.append_record(bytes.fromhex(key), offset, length)
+            return True
+
+    def append_record(self, key, offset, length):
+        now = int(time.time())
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record[0] = (np.frombuffer(key, dtype=np.uint8), offset, length, now)
+        with open(self.index_filepath, 'ab') as index_file:
+            # drop a partial record left by an interrupted write so records stay aligned
+            size = index_file.tell()
+            if size % INDEX_DTYPE.itemsize:
+                index_file.truncate(size - size % INDEX_DTYPE.itemsize)
+            index_file.write(record.tobytes())
+        # index_size is left for refresh, other instances may have appended before this record
+        self.entries[key] = (offset, length, now)
+
+    def items(self):
+        """(hex key, length, last used time) of every thumbnail in pack"""
+        with self.lock:
+            self.refresh()
+            return [(key.hex(), length, written) for key, (_, length, written) in self.entries.items()]
+
+    def compact(self, keys):
+        """Rewrite pack with only the given hex keys, dropping everything else"""
+        with self.lock:
+            self.refresh()
+            keep = [bytes.fromhex(key) for key in keys if bytes.fromhex(key) in self.entries]
+            pack_tmp = self.pack_filepath.with_suffix('.pack.tmp')
+            index_tmp = self.index_filepath.with_suffix('.idx.tmp')
+            records = np.zeros(len(keep), dtype=INDEX_DTYPE)
+            with open(pack_tmp, 'wb') as pack_file:
+                offset = 0
+                for i, key in enumerate(keep):
+                    data = self.read(key.hex())
+                    pack_file.write(data)
+                    records[i] = (np.frombuffer(key, dtype=np.uint8), offset, len(data), self.entries[key][2])
+                    offset += len(data)
+            records.tofile(index_tmp)
+
+            self.close()
+            os.replace(pack_tmp, self.pack_filepath)
+            os.replace(index_tmp, self.index_filepath)
+            self.pack_id = None
+            self.refresh()
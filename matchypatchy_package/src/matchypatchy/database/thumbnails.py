@@ -1,58 +1,140 @@
 """
-QThread for saving thumbnails to temp dir for media table
+Content-addressed thumbnail store for media table
 """
+import os
 import cv2
-import random
+import json
+import time
+import sqlite3
+import hashlib
+import threading
 import pandas as pd
 from pathlib import Path
 
-from PyQt6.QtGui import QImage
-from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QImage, QImageReader
+from PyQt6.QtCore import Qt, QRect, QSize, QBuffer, QIODevice
 
-from matchypatchy.config import resource_path
+from matchypatchy.config import resource_path, load_cfg
+from matchypatchy.database.media import VIDEO_EXT
+from matchypatchy.database.thumbnail_pack import ThumbnailPack
 
 
 THUMBNAIL_NOTFOUND = "assets/graphics/thumbnail_notfound.png"
 THUMBNAIL_SIZE = 150
 
+DRAFT_SCALES = [8, 4, 2]  # reduced JPEG decode factors supported by libjpeg
+# unreferenced thumbnails used within this many seconds are kept
+GC_GRACE = 7 * 24 * 3600
+# databases sharing the store, their thumbnails are never collected while they exist
+PROJECTS_FILE = 'projects.json'
 
-def save_media_thumbnail(thumbnail_dir, filepath, ext):
-    """Save thumbnail for full media file"""
-    if ext in ['.mp4', '.avi', '.mov', '.mkv', '.wmv']:
-        # use first frame for video
-        original = get_frame(filepath, frame=0)
+# THUMBNAIL_STORE options: one jpg per thumbnail, or a single pack file
+THUMBNAIL_STORES = ['files', 'pack']
+PACK_PREFIX = "pack:"  # thumbnail paths in the pack store are "pack:<key>"
+# columns of fetched thumbnail tables, merged into media and roi tables by id
+THUMBNAIL_COLUMNS = ["id", "thumbnail_path", "thumbnail_size", "thumbnail_mtime"]
+
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+def get_pack(thumbnail_dir):
+    """Shared ThumbnailPack for thumbnail_dir"""
+    thumbnail_dir = os.path.abspath(thumbnail_dir)
+    with _packs_lock:
+        if thumbnail_dir not in _packs:
+            _packs[thumbnail_dir] = ThumbnailPack(thumbnail_dir)
+        return _packs[thumbnail_dir]
+
+
+def thumbnail_key(sha256, frame=None, bbox=None, size=THUMBNAIL_SIZE):
+    """Content key of a thumbnail: hash of media hash, size, frame and bbox"""
+    if frame is None:
+        source = f"{sha256}:{size}"
     else:
-        original = QImage(filepath)
+        source = f"{sha256}:{size}:{int(frame)}:" + ",".join(f"{float(v):.6f}" for v in bbox)
+    return hashlib.sha256(source.encode()).hexdigest()
 
-    if not original.isNull():
-        # crop for rois
-        image = original.copy()
-        # scale it to 150x150
-        scaled_image = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE,
-                                    Qt.AspectRatioMode.KeepAspectRatio,
-                                    Qt.TransformationMode.SmoothTransformation)
-
-        # create a temporary file to hold thumbnail
-        rand = random.randint(1000, 9999)
-        newpath = Path(thumbnail_dir) / Path(filepath).stem
-        thumbnail_filepath = f"{str(newpath)}_{rand}.jpg"
-        # save the image
-        scaled_image.save(thumbnail_filepath, format="JPG")
+
+def key_path(thumbnail_dir, key, store='files'):
+    """Thumbnail path for key, files are sharded two levels deep by key prefix"""
+    if store == 'pack':
+        return PACK_PREFIX + key
+    return str(Path(thumbnail_dir) / key[:2] / key[2:4] / f"{key}.jpg")
+
+
+def thumbnail_path(thumbnail_dir, sha256, frame=None, bbox=None, size=THUMBNAIL_SIZE, store='files'):
+    """
+    Content-addressed thumbnail path, keyed by media hash, frame, bbox and size
+    The same thumbnail always maps to the same path
+    """
+    return key_path(thumbnail_dir, thumbnail_key(sha256, frame, bbox, size), store)
+
+
+def save_thumbnails(thumbnail_dir, filepath, ext, sha256, media=True, rois=(), store='files'):
+    """
+    Save media thumbnail and ROI thumbnails of one file from a single decode
+    Thumbnails already in the store are reused, the file is only decoded if one is missing
+
+    Args
+        - sha256 (str): media hash, key for the thumbnail store
+        - media (bool): save thumbnail for the full media file
+        - rois (list): (frame, bbox_x, bbox_y, bbox_w, bbox_h) for each ROI
+        - store (str): "files" or "pack"
+    Returns media thumbnail path (None if media is False) and list of ROI thumbnail paths
+    """
+    rois = list(rois)
+    media_target = thumbnail_path(thumbnail_dir, sha256, store=store) if media else None
+    roi_targets = [thumbnail_path(thumbnail_dir, sha256, roi[0], roi[1:], store=store) for roi in rois]
+
+    # reuse existing thumbnails, mark them used for eviction
+    missing_rois = []
+    for roi, target in zip(rois, roi_targets):
+        if not touch_thumbnail(thumbnail_dir, target):
+            missing_rois.append((roi, target))
+    missing_media = media and not touch_thumbnail(thumbnail_dir, media_target)
+    if not missing_rois and not missing_media:
+        return media_target, roi_targets
+
+    if ext in VIDEO_EXT:
+        # one pass through the video for every frame needed
+        frames = get_frames(filepath, {int(roi[0]) for roi, _ in missing_rois} | ({0} if missing_media else set()))
+        originals = [frames[int(roi[0])] for roi, _ in missing_rois]
+        media_original = frames.get(0)
     else:
-        thumbnail_filepath = str(resource_path(THUMBNAIL_NOTFOUND))
+        # crop boxes as fractions of the image, full image for media
+        boxes = [roi[3:] for roi, _ in missing_rois] + ([(1, 1)] if missing_media else [])
+        media_original = read_image(filepath, boxes)
+        originals = [media_original] * len(missing_rois)
 
-    return thumbnail_filepath
+    media_path = media_target
+    if missing_media:
+        media_path = save_thumbnail(thumbnail_dir, media_original, media_target)
+    saved = {target: save_thumbnail(thumbnail_dir, original, target, *roi)
+             for original, (roi, target) in zip(originals, missing_rois)}
+    roi_paths = [saved.get(target, target) for target in roi_targets]
+    return media_path, roi_paths
 
 
-def save_roi_thumbnail(thumbnail_dir, filepath, ext, frame, bbox_x, bbox_y, bbox_w, bbox_h):
+def save_media_thumbnail(thumbnail_dir, filepath, ext, sha256, store='files'):
+    """Save thumbnail for full media file"""
+    return save_thumbnails(thumbnail_dir, filepath, ext, sha256, store=store)[0]
+
+
+def save_roi_thumbnail(thumbnail_dir, filepath, ext, sha256, frame, bbox_x, bbox_y, bbox_w, bbox_h, store='files'):
     """Save thumbnail for ROI given bbox coordinates"""
-    original = QImage(filepath)
-    if ext in ['.mp4', '.avi', '.mov', '.mkv', '.wmv']:
-        original = get_frame(filepath, frame=frame)
-    else:
-        original = QImage(filepath)
+    return save_thumbnails(thumbnail_dir, filepath, ext, sha256, media=False,
+                           rois=[(frame, bbox_x, bbox_y, bbox_w, bbox_h)], store=store)[1][0]
 
-    if not original.isNull():
+
+def save_thumbnail(thumbnail_dir, original, thumbnail_filepath, frame=None, bbox_x=0, bbox_y=0, bbox_w=1, bbox_h=1):
+    """Crop bbox from decoded image, scale to thumbnail size and save it to the store"""
+    if original is None or original.isNull():
+        return str(resource_path(THUMBNAIL_NOTFOUND))
+
+    if frame is None:
+        image = original
+    else:
         # crop for rois
         left = original.width() * bbox_x
         top = original.height() * bbox_y
@@ -61,64 +143,425 @@ def save_roi_thumbnail(thumbnail_dir, filepath, ext, frame, bbox_x, bbox_y, bbox
         crop_rect = QRect(int(left), int(top), int(right), int(bottom))
         image = original.copy(crop_rect)
 
-        # scale it to 150x150
-        scaled_image = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE,
-                                    Qt.AspectRatioMode.KeepAspectRatio,
-                                    Qt.TransformationMode.SmoothTransformation)
+    # scale it to 150x150
+    scaled_image = image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE,
+                                Qt.AspectRatioMode.KeepAspectRatio,
+                                Qt.TransformationMode.SmoothTransformation)
 
-        # create a temporary file to hold thumbnail
-        rand = random.randint(1000, 9999)
-        newpath = Path(thumbnail_dir) / Path(filepath).stem
-        thumbnail_filepath = f"{str(newpath)}_{frame}_{rand}.jpg"
+    buffer = QBuffer()
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    if not scaled_image.save(buffer, "JPG"):
+        return str(resource_path(THUMBNAIL_NOTFOUND))
+    write_thumbnail(thumbnail_dir, thumbnail_filepath, bytes(buffer.data()))
+    return thumbnail_filepath
 
-        # save the image
-        scaled_image.save(thumbnail_filepath, format="JPG")
-    else:
-        thumbnail_filepath = str(resource_path(THUMBNAIL_NOTFOUND))
 
-    return thumbnail_filepath
+def write_thumbnail(thumbnail_dir, thumbnail_filepath, data):
+    """Write encoded thumbnail to the store"""
+    if thumbnail_filepath.startswith(PACK_PREFIX):
+        get_pack(thumbnail_dir).write(thumbnail_filepath[len(PACK_PREFIX):], data)
+        return
+    # write to a temporary file and move into place so readers never see a partial thumbnail
+    thumbnail_filepath = Path(thumbnail_filepath)
+    thumbnail_filepath.parent.mkdir(parents=True, exist_ok=True)
+    temp_filepath = thumbnail_filepath.with_name(f"{thumbnail_filepath.stem}.{threading.get_ident()}.tmp")
+    temp_filepath.write_bytes(data)
+    os.replace(temp_filepath, thumbnail_filepath)
 
 
-def get_frame(video_path, frame=0):
-    """Extract a given frame from video as QImage"""
+def read_thumbnail(thumbnail_dir, thumbnail_filepath):
+    """Encoded thumbnail bytes from either store, None if missing"""
+    if thumbnail_filepath.startswith(PACK_PREFIX):
+        return get_pack(thumbnail_dir).read(thumbnail_filepath[len(PACK_PREFIX):])
+    try:
+        return Path(thumbnail_filepath).read_bytes()
+    except OSError:
+        return None
+
+
+def load_thumbnail(thumbnail_filepath, thumbnail_dir=None):
+    """Thumbnail as QImage from either store, THUMBNAIL_NOTFOUND image if missing"""
+    image = QImage()
+    if isinstance(thumbnail_filepath, str) and thumbnail_filepath:
+        if thumbnail_filepath.startswith(PACK_PREFIX):
+            data = read_thumbnail(thumbnail_dir or load_cfg('THUMBNAIL_DIR'), thumbnail_filepath)
+            if data is not None:
+                image.loadFromData(data)
+        else:
+            image = QImage(thumbnail_filepath)
+    if image.isNull():
+        image = QImage(str(resource_path(THUMBNAIL_NOTFOUND)))
+    return image
+
+
+def thumbnail_exists(thumbnail_dir, thumbnail_filepath):
+    """Check thumbnail is in the store"""
+    if thumbnail_filepath.startswith(PACK_PREFIX):
+        return thumbnail_filepath[len(PACK_PREFIX):] in get_pack(thumbnail_dir)
+    return Path(thumbnail_filepath).is_file()
+
+
+def touch_thumbnail(thumbnail_dir, thumbnail_filepath):
+    """
+    Mark thumbnail as recently used, returns False if it does not exist
+    Only the access time changes, modified time is recorded to verify the thumbnail
+    """
+    if thumbnail_filepath.startswith(PACK_PREFIX):
+        return get_pack(thumbnail_dir).touch(thumbnail_filepath[len(PACK_PREFIX):])
+    try:
+        stat = os.stat(thumbnail_filepath)
+        os.utime(thumbnail_filepath, ns=(time.time_ns(), stat.st_mtime_ns))
+        return True
+    except OSError:
+        return False
+
+
+def thumbnail_stat(thumbnail_dir, thumbnail_filepath):
+    """Size and modified time to record for a thumbnail, (None, None) if it does not exist"""
+    if thumbnail_filepath.startswith(PACK_PREFIX):
+        entry = get_pack(thumbnail_dir).entry(thumbnail_filepath[len(PACK_PREFIX):])
+        return (entry[1], None) if entry is not None else (None, None)
+    try:
+        stat = os.stat(thumbnail_filepath)
+        return stat.st_size, stat.st_mtime
+    except OSError:
+        return None, None
+
+
+def verify_thumbnail(thumbnail_dir, thumbnail_filepath, size=None, mtime=None):
+    """
+    Check thumbnail exists and matches the size and modified time recorded at generation
+    Unrecorded (None or NaN) values are not compared
+    """
+    if not isinstance(thumbnail_filepath, str) or not thumbnail_filepath:
+        return False
+    current_size, current_mtime = thumbnail_stat(thumbnail_dir, thumbnail_filepath)
+    if current_size is None:
+        return False
+    if size is not None and not pd.isna(size) and int(size) != current_size:
+        return False
+    if mtime is not None and not pd.isna(mtime) and current_mtime is not None and float(mtime) != current_mtime:
+        return False
+    return True
+
+
+def draft_scale(width, height, boxes):
+    """
+    Largest JPEG decode reduction that keeps every crop at least THUMBNAIL_SIZE
+    on its long side, boxes are (bbox_w, bbox_h) fractions of the image
+    """
+    for scale in DRAFT_SCALES:
+        if all(max(width * w, height * h) / scale >= THUMBNAIL_SIZE for w, h in boxes):
+            return scale
+    return 1
+
+
+def read_image(filepath, boxes=((1, 1),)):
+    """
+    Decode image as QImage, JPEGs are decoded at reduced resolution
+    when all thumbnails cropped from it would still be full size
+    """
+    reader = QImageReader(str(filepath))
+    size = reader.size()
+    if size.isValid() and bytes(reader.format()) in (b'jpeg', b'jpg') and boxes:
+        scale = draft_scale(size.width(), size.height(), boxes)
+        if scale > 1:
+            # libjpeg rounds scaled dimensions up, match so no resampling follows
+            reader.setScaledSize(QSize(-(-size.width() // scale), -(-size.height() // scale)))
+    return reader.read()
+
+
+def get_frames(video_path, frames):
+    """Extract given frames from video as QImages, reading the video once"""
+    images = {}
     cap = cv2.VideoCapture(video_path)
-    cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
-    ret, still = cap.read()  # Read the first frame
+    for frame in sorted(frames):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        ret, still = cap.read()
+        if ret:
+            rgb_frame = cv2.cvtColor(still, cv2.COLOR_BGR2RGB)
+            h, w, ch = rgb_frame.shape
+            bytes_per_line = ch * w
+            # copy so the image does not reference the numpy buffer
+            images[frame] = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format.Format_RGB888).copy()
+        else:
+            images[frame] = QImage()
     cap.release()
+    return images
+
+
+def get_frame(video_path, frame=0):
+    """Extract a given frame from video as QImage"""
+    return get_frames(video_path, {frame})[frame]
+
+
+def scan_thumbnail_dir(thumbnail_dir):
+    """
+    Yield os.DirEntry of every thumbnail file in the sharded store
+
+    Only <key>.jpg files two levels under their key prefix are listed, files
+    named before content addressing may belong to databases that have not
+    registered with the store yet and are never collected
+    """
+    stack = [(str(thumbnail_dir), '')]
+    while stack:
+        top, prefix = stack.pop()
+        try:
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    if len(prefix) < 4:
+                        if len(entry.name) == 2 and entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, prefix + entry.name))
+                    elif is_key_file(entry.name, prefix) and entry.is_file(follow_symlinks=False):
+                        yield entry
+        except OSError:
+            continue
+
+
+def is_key_file(name, prefix):
+    """True if name is a thumbnail file of the sharded store under key prefix"""
+    key, ext = os.path.splitext(name)
+    return ext == '.jpg' and len(key) == 64 and key.startswith(prefix) and all(c in '0123456789abcdef' for c in key)
+
+
+def read_projects(thumbnail_dir):
+    """Databases registered with the thumbnail store"""
+    try:
+        with open(Path(thumbnail_dir) / PROJECTS_FILE, 'r') as projects_file:
+            return list(json.load(projects_file))
+    except (OSError, ValueError):
+        return []
+
+
+def register_project(thumbnail_dir, db_filepath):
+    """Record a database as using the thumbnail store, so collect_thumbnails keeps its thumbnails"""
+    db_filepath = os.path.normcase(os.path.abspath(db_filepath))
+    projects = read_projects(thumbnail_dir)
+    if db_filepath in projects:
+        return
+    projects.append(db_filepath)
+    projects_filepath = Path(thumbnail_dir) / PROJECTS_FILE
+    tmp = projects_filepath.with_suffix('.tmp.json')
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    with open(tmp, 'w') as projects_file:
+        json.dump(projects, projects_file)
+    os.replace(tmp, projects_filepath)
+
+
+def project_thumbnails(db_filepath):
+    """Thumbnail paths referenced by another database, read only, None if it cannot be read"""
+    try:
+        connection = sqlite3.connect(f"{Path(db_filepath).as_uri()}?mode=ro", uri=True)
+        try:
+            return connection.execute("""SELECT filepath FROM media_thumbnails
+                                         UNION SELECT filepath FROM roi_thumbnails;""").fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+
+
+def referenced_thumbnails(mpDB, thumbnail_dir):
+    """
+    Thumbnails referenced by the open database and every other database registered with the store
+
+    Returns normalized file paths and pack keys, None if any database could not be read
+    """
+    referenced = mpDB._command("SELECT filepath FROM media_thumbnails UNION SELECT filepath FROM roi_thumbnails;")
+    if referenced is None:
+        return None
+    own = os.path.normcase(os.path.abspath(mpDB.filepath))
+    for db_filepath in read_projects(thumbnail_dir):
+        if db_filepath == own or not os.path.isfile(db_filepath):
+            continue
+        rows = project_thumbnails(db_filepath)
+        if rows is None:
+            mpDB.logger.warning(f"Could not read thumbnails of {db_filepath}, skipping cleanup")
+            return None
+        referenced += rows
+    paths = [row[0] for row in referenced if row[0]]
+    keys = {path[len(PACK_PREFIX):] for path in paths if path.startswith(PACK_PREFIX)}
+    files = {os.path.normcase(os.path.abspath(path)) for path in paths if not path.startswith(PACK_PREFIX)}
+    return files, keys
+
+
+def unreferenced_thumbnails(thumbnail_dir, pack_items, files, keys, interrupted=None):
+    """
+    Size of the store and its unreferenced thumbnails as (last used, size, path)
+    Returns None if interrupted
+    """
+    total = 0
+    unreferenced = []
+    for entry in scan_thumbnail_dir(thumbnail_dir):
+        if interrupted is not None and interrupted():
+            return None
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        total += stat.st_size
+        if os.path.normcase(os.path.abspath(entry.path)) not in files:
+            unreferenced.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+    for key, length, used in pack_items:
+        total += length
+        if key not in keys:
+            unreferenced.append((used, length, PACK_PREFIX + key))
+    return total, unreferenced
+
+
+def select_removals(total, unreferenced, max_bytes=None, grace=GC_GRACE):
+    """
+    Unreferenced thumbnails unused past the grace period,
+    then least recently used ones until the store is under max_bytes
+
+    Returns paths to remove and how many of them were evicted for size
+    """
+    cutoff = time.time() - grace
+    removed = []
+    evicted = 0
+    for used, size, path in sorted(unreferenced):  # oldest first
+        if used > cutoff:
+            if max_bytes is None or total <= max_bytes:
+                break
+            evicted += 1
+        removed.append(path)
+        total -= size
+    return removed, evicted
+
+
+def collect_thumbnails(mpDB, thumbnail_dir, max_bytes=None, grace=GC_GRACE, interrupted=None):
+    """
+    Garbage collect the thumbnail store, sharded files and pack
+
+    Thumbnails referenced by the open database or by any other database
+    registered with the store are always kept. Unreferenced thumbnails are
+    removed once unused for grace seconds, then if the store is still larger
+    than max_bytes the least recently used unreferenced ones are removed too.
+    interrupted is polled per thumbnail, the collection stops early once it returns True
+
+    Returns number of thumbnails removed as unused and number evicted for size
+    """
+    referenced = referenced_thumbnails(mpDB, thumbnail_dir)
+    if referenced is None:  # never remove thumbnails if references could not be read
+        return 0, 0
+    pack = get_pack(thumbnail_dir)
+    pack_items = pack.items() if pack.pack_filepath.exists() else []
+    usage = unreferenced_thumbnails(thumbnail_dir, pack_items, *referenced, interrupted=interrupted)
+    if usage is None:
+        return 0, 0
+    removed, evicted = select_removals(*usage, max_bytes=max_bytes, grace=grace)
+
+    for path in removed:
+        if interrupted is not None and interrupted():
+            # files removed so far were unreferenced, leave the pack as is
+            return len(removed) - evicted, evicted
+        if path.startswith(PACK_PREFIX):
+            continue
+        try:
+            os.remove(path)
+        except OSError as error:
+            mpDB.logger.warning(f"Could not remove thumbnail {path}: {error}")
+
+    # rewrite pack without removed thumbnails
+    removed_keys = {path[len(PACK_PREFIX):] for path in removed if path.startswith(PACK_PREFIX)}
+    if removed_keys:
+        pack.compact([key for key, _, _ in pack_items if key not in removed_keys])
 
-    if ret:
-        rgb_frame = cv2.cvtColor(still, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_frame.shape
-        bytes_per_line = ch * w
-        qimg = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-    return qimg
+    mpDB.logger.info(f"Thumbnail store: removed {len(removed) - evicted} unused, evicted {evicted} for size")
+    return len(removed) - evicted, evicted
 
 
-def check_missing_thumbnails(mpDB, data_type):
+def migrate_thumbnails(mpDB, thumbnail_dir, store, chunk_size=1000, interrupted=None):
+    """
+    Move thumbnails referenced by the database into the given store ("files" or "pack")
+    Files of the previous store are left in place, sharded files and pack entries
+    are removed by collect_thumbnails once no database references them
+    Stops after the current chunk once interrupted returns True
+
+    Returns number of thumbnails moved
+    """
+    moved = 0
+    for table in ("media_thumbnails", "roi_thumbnails"):
+        rows = mpDB.select(table, columns="id, filepath")
+        pending = [(id, path) for id, path in rows or [] if needs_migration(thumbnail_dir, path, store)]
+        for start in range(0, len(pending), chunk_size):
+            if interrupted is not None and interrupted():
+                break
+            updates = migrate_chunk(thumbnail_dir, pending[start:start + chunk_size], store)
+            if updates:
+                mpDB.edit_rows(table, "filepath", updates)
+                moved += len(updates)
+
+    if moved:
+        mpDB.logger.info(f"Moved {moved} thumbnails to {store} store")
+    return moved
+
+
+def needs_migration(thumbnail_dir, path, store):
+    """True if a thumbnail path of the database is held outside store"""
+    if not path:
+        return False
+    if store == 'pack':
+        return not path.startswith(PACK_PREFIX) and Path(path).is_relative_to(thumbnail_dir)
+    return path.startswith(PACK_PREFIX)
+
+
+def migrate_chunk(thumbnail_dir, rows, store):
+    """
+    Copy thumbnails of (id, path) rows into store
+    Returns new path by id, missing thumbnails are left for check_missing_thumbnails
+    """
+    updates = {}
+    for id, path in rows:
+        data = read_thumbnail(thumbnail_dir, path)
+        if data is None:
+            continue
+        if path.startswith(PACK_PREFIX):
+            key = path[len(PACK_PREFIX):]
+        else:
+            key = Path(path).stem
+            if len(key) != 64:  # named before content addressing
+                key = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+        target = key_path(thumbnail_dir, key, store)
+        write_thumbnail(thumbnail_dir, target, data)
+        updates[id] = target
+    return updates
+
+
+def check_missing_thumbnails(mpDB, data_type, thumbnail_dir=None, verify=False, interrupted=None):
     """
     Check for missing thumbnails in roi or media table
+
+    Rows without a thumbnail entry are found with one query. Entries are only
+    checked against the store with verify=True, a full scan meant for
+    background use; rows being displayed are verified lazily as they load.
+    The scan stops early, returning what it found so far, once interrupted returns True
     """
     if data_type == 1:
         table = "roi_thumbnails"
         fid_col = "fid"
         source_table = "roi"
-        thumbnails = fetch_roi_thumbnails(mpDB)
     else:
         table = "media_thumbnails"
         fid_col = "fid"
         source_table = "media"
-        thumbnails = fetch_media_thumbnails(mpDB)
 
     # Find ids in source_table that do not have entries in thumbnails table
     missing = mpDB._command(f"""SELECT {source_table}.id FROM {source_table}
                             LEFT JOIN {table} ON {source_table}.id = {table}.{fid_col}
                             WHERE {table}.{fid_col} IS NULL;""", quiet=True)
-    missing_ids = [row[0] for row in missing]
+    missing_ids = [row[0] for row in missing] if missing else []
 
-    # Also check for files that are listed but the file is missing
-    for t, row in thumbnails.iterrows():
-        if not Path(row['thumbnail_path']).is_file():
-            missing_ids.append(row['id'])
+    # Also check for thumbnails that are listed but missing or changed since generation
+    if verify:
+        if thumbnail_dir is None:
+            thumbnail_dir = load_cfg('THUMBNAIL_DIR')
+        thumbnails = fetch_roi_thumbnails(mpDB) if data_type == 1 else fetch_media_thumbnails(mpDB)
+        for row in thumbnails.itertuples(index=False):
+            if interrupted is not None and interrupted():
+                break
+            if not verify_thumbnail(thumbnail_dir, row.thumbnail_path, row.thumbnail_size, row.thumbnail_mtime):
+                missing_ids.append(row.id)
 
     return missing_ids
 
@@ -127,11 +570,11 @@ def fetch_roi_thumbnails(mpDB):
     """
     Get roi thumbnail paths
     """
-    thumbnails = mpDB.select("roi_thumbnails", columns="fid, filepath")
+    thumbnails = mpDB.select("roi_thumbnails", columns="fid, filepath, size, mtime")
     if thumbnails:
-        thumbnails = pd.DataFrame(thumbnails, columns=["id", "thumbnail_path"])
+        thumbnails = pd.DataFrame(thumbnails, columns=THUMBNAIL_COLUMNS)
     else:
-        thumbnails = pd.DataFrame(columns=["id", "thumbnail_path"])
+        thumbnails = pd.DataFrame(columns=THUMBNAIL_COLUMNS)
     thumbnails = thumbnails.replace({float('nan'): None})
     return thumbnails
 
@@ -140,10 +583,10 @@ def fetch_media_thumbnails(mpDB):
     """
     Get media thumbnail paths
     """
-    thumbnails = mpDB.select("media_thumbnails", columns="fid, filepath")
+    thumbnails = mpDB.select("media_thumbnails", columns="fid, filepath, size, mtime")
     if thumbnails:
-        thumbnails = pd.DataFrame(thumbnails, columns=["id", "thumbnail_path"])
+        thumbnails = pd.DataFrame(thumbnails, columns=THUMBNAIL_COLUMNS)
     else:
-        thumbnails = pd.DataFrame(columns=["id", "thumbnail_path"])
+        thumbnails = pd.DataFrame(columns=THUMBNAIL_COLUMNS)
     thumbnails = thumbnails.replace({float('nan'): None})
     return thumbnails
@@ -6,6 +6,7 @@ from matchypatchy.gui import main_gui
 from matchypatchy.gui import media_table
 from matchypatchy.gui import qc_query
 from matchypatchy.gui import query
+from matchypatchy.gui import thumbnail_cache
 from matchypatchy.gui import widgets
 
 from matchypatchy.gui.dialogs import (AboutPopup, AlertPopup, ConfigPopup,
@@ -25,33 +26,38 @@ from matchypatchy.gui.display_base import (DisplayBase,)
 from matchypatchy.gui.display_compare import (DisplayCompare,)
 from matchypatchy.gui.display_media import (DisplayMedia,)
 from matchypatchy.gui.main_gui import (MainWindow,)
-from matchypatchy.gui.media_table import (MediaTable,)
+from matchypatchy.gui.media_table import (MediaTable, MediaTableModel,
+                                          ThumbnailDelegate,)
 from matchypatchy.gui.qc_query import (QC_QueryContainer,)
 from matchypatchy.gui.query import (QueryContainer,)
+from matchypatchy.gui.thumbnail_cache import (ThumbnailCache, pixmap_bytes,)
 from matchypatchy.gui.widgets import (ClickableSlider, ComboBoxDelegate,
                                       ComboBoxSeparator, FilterBar, FilterBox,
                                       HorizontalSeparator, ImageAdjustBar,
-                                      ImageWidget, MediaWidget, StandardButton,
-                                      ThreePointSlider, VerticalSeparator,
-                                      VideoPlayerBar, VideoViewer, VideoWidget,
-                                      gui_assets, widget_filterbar,
+                                      ImageWidget, MediaWidget,
+                                      StandardButton, ThreePointSlider,
+                                      VerticalSeparator, VideoPlayerBar,
+                                      VideoViewer, VideoWidget, gui_assets,
+                                      widget_filterbar,
                                       widget_image_adjustment, widget_media,)
 
 __all__ = ['AboutPopup', 'AlertPopup', 'ClickableSlider', 'ComboBoxDelegate',
-           'ComboBoxSeparator', 'ConfigPopup', 'DisplayBase', 'DisplayCompare',
-           'DisplayMedia', 'FilterBar', 'FilterBox', 'HorizontalSeparator',
-           'ImageAdjustBar', 'ImageWidget', 'ImportCSVPopup',
-           'ImportFolderPopup', 'IndividualFillPopup', 'IndividualPopup',
-           'LicensePopup', 'MLDownloadPopup', 'MLOptionsPopup', 'MainWindow',
-           'MediaEditPopup', 'MediaTable', 'MediaWidget', 'MetadataPanel',
-           'PairXPopup', 'QC_QueryContainer', 'QueryContainer', 'READMEPopup',
+           'ComboBoxSeparator', 'ConfigPopup', 'DisplayBase',
+           'DisplayCompare', 'DisplayMedia', 'FilterBar', 'FilterBox',
+           'HorizontalSeparator', 'ImageAdjustBar', 'ImageWidget',
+           'ImportCSVPopup', 'ImportFolderPopup', 'IndividualFillPopup',
+           'IndividualPopup', 'LicensePopup', 'MLDownloadPopup',
+           'MLOptionsPopup', 'MainWindow', 'MediaEditPopup', 'MediaTable',
+           'MediaTableModel', 'MediaWidget', 'MetadataPanel', 'PairXPopup',
+           'QC_QueryContainer', 'QueryContainer', 'READMEPopup',
            'StandardButton', 'StationFillPopup', 'StationPopup',
            'SurveyFillPopup', 'SurveyPopup', 'ThreePointSlider',
-           'VerticalSeparator', 'VideoPlayerBar', 'VideoViewer', 'VideoWidget',
-           'dialogs', 'display_base', 'display_compare', 'display_media',
-           'gui_assets', 'main_gui', 'media_table', 'popup_alert',
+           'ThumbnailCache', 'ThumbnailDelegate', 'VerticalSeparator',
+           'VideoPlayerBar', 'VideoViewer', 'VideoWidget', 'dialogs',
+           'display_base', 'display_compare', 'display_media', 'gui_assets',
+           'main_gui', 'media_table', 'pixmap_bytes', 'popup_alert',
            'popup_config', 'popup_import_csv', 'popup_import_folder',
            'popup_individual', 'popup_media_edit', 'popup_ml', 'popup_pairx',
            'popup_readme', 'popup_station', 'popup_survey', 'qc_query',
-           'query', 'widget_filterbar', 'widget_image_adjustment',
-           'widget_media', 'widgets']
+           'query', 'thumbnail_cache', 'widget_filterbar',
+           'widget_image_adjustment', 'widget_media', 'widgets']
@@ -189,6 +189,9 @@ class ConfigPopup(QDialog):
             valid = self.mpDB.update_paths(new_db)
 
             if valid:
+                # pending thumbnails belong to the previous database
+                self.parent().thumbnail_service.clear()
+
                 # Update home dir
                 global HOME_DIR
                 HOME_DIR = Path(new_project)
@@ -207,6 +210,8 @@ class ConfigPopup(QDialog):
                 new_thumb = Path(new_project) / "Thumbnails"
                 Path.mkdir(new_thumb, exist_ok=True)
                 self.cfg['THUMBNAIL_DIR'] = str(new_thumb)
+                # cached pixmaps and pack paths belong to the previous project
+                self.parent().thumbnail_cache.set_thumbnail_dir(new_thumb)
 
                 new_frame = Path(new_project) / "Frames"
                 Path.mkdir(new_frame, exist_ok=True)
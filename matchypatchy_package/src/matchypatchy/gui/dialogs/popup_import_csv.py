@@ -16,6 +16,7 @@ class ImportCSVPopup(QDialog):
         super().__init__(parent)
         self.mpDB = parent.mpDB
         self.logger = parent.logger
+        self.thumbnail_service = parent.parent.thumbnail_service
         self.data = pd.read_csv(manifest)
         self.columns = ["None"] + list(self.data.columns)
         self.survey_columns = [str(parent.active_survey[1])] + list(self.data.columns)
@@ -302,5 +303,11 @@ class ImportCSVPopup(QDialog):
 
         self.import_thread = CSVImportThread(self.mpDB, unique_images, selected_columns, self.logger)
         self.import_thread.progress_update.connect(self.progress_bar.setValue)
+        self.import_thread.finished.connect(self.queue_thumbnails)
         self.import_thread.finished.connect(self.close)
         self.import_thread.start()
+
+    def queue_thumbnails(self):
+        """Generate thumbnails for imported media and rois in the background"""
+        self.thumbnail_service.queue_missing(0)
+        self.thumbnail_service.queue_missing(1)
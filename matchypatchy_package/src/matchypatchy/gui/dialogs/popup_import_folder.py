@@ -20,6 +20,7 @@ class ImportFolderPopup(QDialog):
         super().__init__(parent)
         self.logger = parent.logger
         self.mpDB = parent.mpDB
+        self.thumbnail_service = parent.parent.thumbnail_service
         self.active_survey = parent.active_survey
         self.timezone = self.mpDB.select_join("survey", "region", "survey.region_id=region.id",
                                         columns="region.timezone",
@@ -127,5 +128,10 @@ class ImportFolderPopup(QDialog):
                                                 self.data, station_level, camera_level, self.logger)
         self.rejected.connect(self.import_thread.requestInterruption)
         self.import_thread.progress_update.connect(self.progress_bar.setValue)
+        self.import_thread.finished.connect(self.queue_thumbnails)
         self.import_thread.finished.connect(self.accept)
         self.import_thread.start()
+
+    def queue_thumbnails(self):
+        """Generate thumbnails for imported media in the background"""
+        self.thumbnail_service.queue_missing(0)
@@ -161,6 +161,12 @@ class MLOptionsPopup(QDialog):
         self.sequence.setStyleSheet("""QCheckBox {padding: 5px;}
                                        QCheckBox::indicator {width: 25px; height: 25px;}""")
         layout.addWidget(self.sequence)
+        self.sequence_new_only = QCheckBox("Only Sequence New Media")
+        self.sequence_new_only.setStyleSheet("""QCheckBox {padding: 5px 5px 5px 30px;}
+                                                QCheckBox::indicator {width: 25px; height: 25px;}""")
+        self.sequence_new_only.setEnabled(False)
+        self.sequence.toggled.connect(self.sequence_new_only.setEnabled)
+        layout.addWidget(self.sequence_new_only)
 
         # Detector
         self.detector_label = QLabel("Select Detector Model:")
@@ -221,6 +227,10 @@ class MLOptionsPopup(QDialog):
         """Return whether sequence is checked"""
         return self.sequence.isChecked()
 
+    def select_sequence_new_only(self):
+        """Return whether only media without a sequence are sequenced"""
+        return self.sequence.isChecked() and self.sequence_new_only.isChecked()
+
     def select_detector(self):
         """Return the selected detector model"""
         if len(self.available_detectors) == 0:
@@ -247,10 +257,12 @@ class MLOptionsPopup(QDialog):
 
     def return_selections(self):
         sequence_checked = self.select_sequence()
+        sequence_new_only = self.select_sequence_new_only()
         DETECTOR_KEY = self.select_detector()
         REID_KEY = self.select_reid()
         VIEWPOINT_KEY = self.select_viewpoint()
         return {"sequence_checked": sequence_checked,
+                "sequence_new_only": sequence_new_only,
                 "DETECTOR_KEY": DETECTOR_KEY,
                 "REID_KEY": REID_KEY,
                 "VIEWPOINT_KEY": VIEWPOINT_KEY}
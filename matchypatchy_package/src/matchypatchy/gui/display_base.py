@@ -270,13 +270,14 @@ class DisplayBase(QWidget):
 
             # 1. SEQUENCE
             dialog.set_max(0)
-            self.sequence_thread = SequenceThread(self.mpDB, mloptions['sequence_checked'])
+            self.sequence_thread = SequenceThread(self.mpDB, mloptions['sequence_checked'],
+                                                  incremental=mloptions['sequence_new_only'])
             self.sequence_thread.prompt_update.connect(dialog.update_prompt)
             self.sequence_thread.start()
             # 2. ANIML (BBOX)
             dialog.set_max(100)
             dialog.set_counter(0)
-            self.animl_thread = AnimlThread(self.mpDB, mloptions['DETECTOR_KEY'])
+            self.animl_thread = AnimlThread(self.mpDB, mloptions['DETECTOR_KEY'], self.parent.thumbnail_service)
             self.animl_thread.prompt_update.connect(dialog.update_prompt)
             self.animl_thread.progress_update.connect(dialog.set_value)
             # 3. REID AND VIEWPOINT
@@ -350,4 +351,5 @@ class DisplayBase(QWidget):
             self.mpDB.clear("sequence")
             self.mpDB.clear("individual")
             self.mpDB.clear_emb()
+            self.parent.thumbnail_service.clear()
         del dialog
@@ -427,11 +427,8 @@ class DisplayCompare(QWidget):
         # Match has a name
         else:
             self.QueryContainer.merge()
-            # update data
-        self.QueryContainer.load_data()
-        self.QueryContainer.filter()
-        self.load_query()
-        self.load_match()
+        # update data
+        self.refresh_matches()
 
     def unmatch(self):
         """If already matched, unmatch current query from IID"""
@@ -443,10 +440,28 @@ class DisplayCompare(QWidget):
             self.QueryContainer.unmatch()
             del dialog
         # reload data
+        self.refresh_matches()
+
+    def refresh_matches(self):
+        """
+        Reload data after a match edit, re-query only the sequences of rois that changed individual
+        and re-rank queries, QC mode has no neighbors and reloads the current query
+        """
+        if self.qc:
+            self.QueryContainer.load_data()
+            self.QueryContainer.filter()
+            self.load_query()
+            self.load_match()
+            return
+        individuals = self.QueryContainer.data['individual_id']
         self.QueryContainer.load_data()
-        self.QueryContainer.filter()
-        self.load_query()
-        self.load_match()
+        self.QueryContainer.filter(filter_dict=self.filters, valid_stations=self.valid_stations)
+        if self.QueryContainer.rematch(self.QueryContainer.changed_individuals(individuals)):
+            # matched query drops out of the queue, stay at the same position
+            self.change_query(min(self.QueryContainer.current_query, self.QueryContainer.n_queries - 1))
+        else:
+            self.warn(prompt="All queries have been matched.")
+            self.home()
 
     # ==========================================================================
     # LOAD FUNCTIONS
@@ -212,10 +212,8 @@ class DisplayMedia(QWidget):
         self.update_count_label()
 
     def handle_table_change(self, edit):
-        """Slot to receive updates from QTableWidget"""
-        row = edit[0]
+        """Slot to receive updates from MediaTable"""
         column = edit[1]
-        item = self.media_table.table.item(row, column)
         # select checkbox column, update selected rows and count label
         if column == 0:
             self.check_selected_rows()
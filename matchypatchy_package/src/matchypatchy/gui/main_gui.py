@@ -25,7 +25,10 @@ from matchypatchy.gui.dialogs.popup_survey import SurveyPopup
 from matchypatchy.gui.dialogs.popup_station import StationPopup
 
 from matchypatchy import __version__
+from matchypatchy import config
 from matchypatchy.database.media import export_data
+from matchypatchy.threads.thumbnail_thread import ThumbnailThread
+from matchypatchy.gui.thumbnail_cache import ThumbnailCache
 
 
 class MainWindow(QMainWindow):
@@ -33,6 +36,14 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.mpDB = mpDB
         self.logger = logger
+        # background thumbnail generation shared by all views
+        self.thumbnail_service = ThumbnailThread(mpDB, workers=int(config.load_cfg('THUMBNAIL_WORKERS')))
+        self.thumbnail_service.start()
+        # verify every thumbnail against the store in the background
+        self.thumbnail_service.queue_missing(0, verify=True)
+        self.thumbnail_service.queue_missing(1, verify=True)
+        # decoded thumbnails for display, loaded as they scroll into view
+        self.thumbnail_cache = ThumbnailCache(self, max_mb=config.load_cfg('THUMBNAIL_PIXMAP_MB'))
         self.setWindowTitle(f"MatchyPatchy v{__version__}")
         screen_resolution = QGuiApplication.primaryScreen().availableGeometry()
         minimum_height = 768
@@ -64,6 +75,13 @@ class MainWindow(QMainWindow):
         self._set_base_view()
         self.setCentralWidget(container)
 
+    def closeEvent(self, event):
+        """Stop background thumbnail generation and loading before closing"""
+        self.thumbnail_service.requestInterruption()
+        self.thumbnail_service.wait()
+        self.thumbnail_cache.stop()
+        super().closeEvent(event)
+
     # MENU BAR -----------------------------------------------------------------
     def _createMenuBar(self):
         menuBar = QMenuBar(self)
@@ -105,12 +123,15 @@ class MainWindow(QMainWindow):
         edit_media.triggered.connect(self.manage_media)
         edit_configuration = QAction("Configuration", self)
         edit_configuration.triggered.connect(self.edit_config)
+        edit_thumbnails = QAction("Clean Up Thumbnails", self)
+        edit_thumbnails.triggered.connect(self.thumbnail_service.queue_cleanup)
 
         edit.addAction(edit_survey)
         edit.addAction(edit_station)
         edit.addAction(edit_media)
         edit.addSeparator()
         edit.addAction(edit_configuration)
+        edit.addAction(edit_thumbnails)
 
         # VIEW
 
@@ -1,16 +1,16 @@
 """
 Widget for displaying list of Media
 """
+import sqlite3
 import pandas as pd
 
-from PyQt6.QtWidgets import (QTableWidget, QVBoxLayout, QWidget, QLabel, QHeaderView)
-from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtWidgets import (QTableView, QVBoxLayout, QWidget, QHeaderView, QStyledItemDelegate)
+from PyQt6.QtCore import Qt, pyqtSignal, QAbstractTableModel, QModelIndex, QSize, QTimer
 
 from matchypatchy.database.media import fetch_individual
 from matchypatchy.threads.model_download_thread import load_model
 from matchypatchy.config import load_cfg
-from matchypatchy.threads.table_thread import FetchTableThread, LoadTableThread
+from matchypatchy.threads.table_thread import FetchTableThread
 
 from matchypatchy.gui.dialogs.popup_alert import AlertPopup
 from matchypatchy.gui.widgets.gui_assets import ComboBoxDelegate
@@ -19,6 +19,12 @@ from matchypatchy.gui.widgets.gui_assets import ComboBoxDelegate
 class MediaTable(QWidget):
     update_signal = pyqtSignal(list)
     loaded_data = pyqtSignal()
+    # editable columns stored as INTEGER, cached as numbers
+    INTEGER_COLUMNS = {'station_id', 'camera_id', 'sequence_id', 'external_id',
+                       'viewpoint', 'reviewed', 'favorite', 'individual_id'}
+    # roi view columns saved to the media or individual of the roi
+    MEDIA_COLUMNS = {'station_id', 'camera_id', 'sequence_id', 'external_id', 'comment'}
+    INDIVIDUAL_COLUMNS = {'sex', 'age'}
 
     def __init__(self, parent):
         super().__init__(parent)
@@ -27,42 +33,49 @@ class MediaTable(QWidget):
         self.data = pd.DataFrame()
         self.data_filtered = pd.DataFrame()
         self.individual_list = pd.DataFrame()
-        self.thumbnails = dict()
         self.data_type = 1
+        self.columns = dict()
+        self.headers = []
+        self.valid_stations = dict()
+        self.valid_cameras = dict()
         self.VIEWPOINTS = load_model('VIEWPOINTS')
         self.thumbnail_size = 150
         self.thumbnail_dir = load_cfg('THUMBNAIL_DIR')
+        self.thumbnail_service = parent.parent.thumbnail_service
+        self.thumbnail_service.thumbnails_ready.connect(self.update_thumbnails)
+        self.thumbnail_cache = parent.parent.thumbnail_cache
+        self.thumbnail_cache.thumbnail_loaded.connect(self.show_thumbnail)
 
-        self.edit_stack = []
+        self.edit_stack = []  # edits in the order made, for undo
+        self.edits = dict()  # (id, reference) to edits of that cell, latest last
+        self.row_index = pd.Series(dtype=int)  # id to row of data_filtered
 
         # Set up layout
         layout = QVBoxLayout()
-        # Create QTableWidget
-        self.table = QTableWidget()
-        self.table.setColumnCount(17)  # Columns: Thumbnail, Name, and Description
-        self.table.setHorizontalHeaderLabels(["Select", "Thumbnail", "Filepath", "Timestamp",
-                                              "Station", "Camera", "Sequence ID", "External ID",
-                                              "Viewpoint", "Individual", "Sex", "Age",
-                                              "Reviewed", "Favorite", "Comment"])
-        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
-        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectItems)
+        # Create QTableView, cells are drawn from self.data_filtered by the model
+        self.model = MediaTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setItemDelegateForColumn(1, ThumbnailDelegate(self.thumbnail_size, self))
+        self.table.verticalHeader().setDefaultSectionSize(self.thumbnail_size)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectItems)
         # Connect sorting
-        self.sort_order = dict(zip(range(self.table.columnCount()),
-                                   [Qt.SortOrder.AscendingOrder]*self.table.columnCount()))
+        self.sort_order = dict()
         self.table.setSortingEnabled(False)
         self.table.horizontalHeader().setSortIndicatorShown(True)
         self.table.horizontalHeader().setSectionsClickable(True)
         self.table.horizontalHeader().sectionClicked.connect(self.sort)
         # Connect double click to edit row
         self.table.verticalHeader().sectionDoubleClicked.connect(self.edit_row)
-        self.table.cellChanged.connect(self.update_entry)  # allow user editing
-        self.table.cellChanged.connect(self.handle_checkbox_change)  # select change
+        # Load thumbnails for rows in view as the table scrolls or resizes
+        self.table.verticalScrollBar().valueChanged.connect(self.request_thumbnails)
+        self.table.verticalScrollBar().rangeChanged.connect(self.request_thumbnails)
 
         # Add table to the layout
         layout.addWidget(self.table)
         self.setLayout(layout)
 
-        # Connect table.cellchanged to Media View
+        # Connect table changes to Media View
         self.update_signal.connect(parent.handle_table_change)
         self.loaded_data.connect(parent.handle_loaded_data)
 
@@ -75,9 +88,14 @@ class MediaTable(QWidget):
         """
         # clear old view
         self.data_type = data_type
-        self.table.clearContents()
-        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.model.beginResetModel()
+        self.data_filtered = pd.DataFrame()
+        self.index_rows()
+        self.model.selected.clear()
         self.format_table()
+        self.model.endResetModel()
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.adjust_widths()
 
         # fetch data
         self.individual_list = fetch_individual(self.mpDB)
@@ -86,12 +104,17 @@ class MediaTable(QWidget):
         self.dataloader.loaded_data.connect(lambda data: setattr(self, 'data', data))
         self.dataloader.loaded_data.connect(self.loaded_data.emit)
         self.dataloader.start()
+        # fill in missing thumbnails in the background
+        self.thumbnail_service.queue_missing(data_type)
 
     # STEP 2 - CALLED BY load_data()
     def format_table(self):
         """
-        Format table for media or roi display, add delegates for combos, and load thumbnails
+        Format table for media or roi display, add delegates for combos
         """
+        for column in range(2, self.model.columnCount()):
+            self.table.setItemDelegateForColumn(column, None)
+
         if self.data_type == 1:
             # corresponding mpDB column names
             self.columns = {0: "select",
@@ -110,11 +133,10 @@ class MediaTable(QWidget):
                             13: "favorite",
                             14: "comment"}
 
-            self.table.setColumnCount(len(self.columns))  # Columns: Thumbnail, Name, and Description
-            self.table.setHorizontalHeaderLabels(["Select", "Thumbnail", "Filepath", "Timestamp",
-                                                  "Station", "Camera", "Sequence ID", "External ID",
-                                                  "Viewpoint", "Individual", "Sex", "Age",
-                                                  "Reviewed", "Favorite", "Comment"])
+            self.headers = ["Select", "Thumbnail", "Filepath", "Timestamp",
+                            "Station", "Camera", "Sequence ID", "External ID",
+                            "Viewpoint", "Individual", "Sex", "Age",
+                            "Reviewed", "Favorite", "Comment"]
             VIEWPOINT_COLUMN = 8
             SEX_COLUMN = 10
             AGE_COLUMN = 11
@@ -140,26 +162,31 @@ class MediaTable(QWidget):
                             6: "sequence_id",
                             7: "external_id",
                             8: "comment"}
-            self.table.setColumnCount(len(self.columns))  # Columns: Thumbnail, Name, and Description
-            self.table.setHorizontalHeaderLabels(["Select", "Thumbnail", "Filepath", "Timestamp",
-                                                  "Station", "Camera", "Sequence ID",
-                                                  "External ID", "Comment"])
-        # adjust widths
+            self.headers = ["Select", "Thumbnail", "Filepath", "Timestamp",
+                            "Station", "Camera", "Sequence ID",
+                            "External ID", "Comment"]
+
+        self.sort_order = dict(zip(range(len(self.columns)),
+                                   [Qt.SortOrder.AscendingOrder]*len(self.columns)))
+
+        # increase checkbox size
+        self.table.setStyleSheet(""" QTableView::indicator {
+                                 width: 25px;
+                                 height: 25px;}
+                                 """)
+
+    def adjust_widths(self):
+        """Fit columns to header labels, thumbnails at full size"""
         self.table.resizeColumnsToContents()
-        for col in range(self.table.columnCount()):
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        for col in range(self.model.columnCount()):
             if col == 0:  # select
                 self.table.setColumnWidth(0, 40)
             elif col == 1:  # thumbnail
                 self.table.setColumnWidth(col, max(self.table.columnWidth(col), self.thumbnail_size))
-            else:
+            elif col != 2:
                 self.table.setColumnWidth(col, max(self.table.columnWidth(col), 80))
 
-        # increase checkbox size
-        self.table.setStyleSheet(""" QTableWidget::indicator {
-                                 width: 25px;
-                                 height: 25px;}
-                                 """)
-
     # Step 3 - Filter and Display ------------------------------------------------------
     def filter(self):
         """
@@ -172,12 +199,14 @@ class MediaTable(QWidget):
         """
         # create new copy of full dataset
         self.data_filtered = self.data.copy()
+        self.index_rows()
 
         # if no media, skip
         if self.data_filtered.empty:
+            self.refresh_table()
             return
 
-        # include user edits to current data_filtered:
+        # include user edits to current data_filter:
         self.apply_edits()
 
         # map parent filters and valid stations/cameras to local variables
@@ -218,52 +247,44 @@ class MediaTable(QWidget):
             self.data_filtered = self.data_filtered[self.data_filtered['favorite'] == 1]
 
         self.data_filtered.reset_index(inplace=True)
+        self.index_rows()
 
         # refresh table contents
         self.refresh_table()
 
     # triggered by filter() finishing
-    def refresh_table(self, popup=True):
+    def refresh_table(self):
         """
-        Add rows to table by creating LoadTableThread to generate QTableWidgetItems
+        Point the view at the new data_filtered
+        Rows are formatted by MediaTableModel as they are scrolled into view
         """
-        # clear old contents and prep for filtered data
-        self.table.clearContents()
-        # if there are any left
-        n_rows = self.data_filtered.shape[0]
-        if n_rows:
-            # disconnect edit function while refreshing to prevent needless calls
-            self.table.setRowCount(n_rows)
-            for row in range(n_rows):
-                self.table.setRowHeight(row, self.thumbnail_size)
-
-            # set station delegate post filter
-            station_delegate = ComboBoxDelegate(list(self.valid_stations.values()), self)
-            self.table.setItemDelegateForColumn(4, station_delegate)
-
-            self.table_loader_thread = LoadTableThread(self)
-            self.table_loader_thread.loaded_cell.connect(self.add_cell)
-            self.table_loader_thread.done.connect(lambda: self.table.blockSignals(False))
-            self.table_loader_thread.done.connect(self.loaded_data.emit)
-
-            if popup:
-                loading_bar = AlertPopup(self, "Loading data...", progressbar=True, cancel_only=True)
-                loading_bar.set_max(n_rows)
-                self.table_loader_thread.progress_update.connect(loading_bar.set_counter)
-                loading_bar.rejected.connect(self.table_loader_thread.requestInterruption)
-                loading_bar.show()
-
-            self.table_loader_thread.start()
+        # set station delegate post filter
+        station_delegate = ComboBoxDelegate(list(self.valid_stations.values()), self)
+        self.table.setItemDelegateForColumn(4, station_delegate)
+        self.model.reset()
+        # after the view has laid out the new rows
+        QTimer.singleShot(0, self.request_thumbnails)
+        self.loaded_data.emit()
 
     def sort(self, column):
         """
         Sort table by column and order
         """
         reference = self.columns[column]
-        ascending = self.sort_order[column] == Qt.SortOrder.AscendingOrder
-        self.data_filtered.sort_values(by=reference, ascending=ascending, inplace=True)
+        if reference == 'thumbnail':
+            return
+        if reference == 'select':
+            # checked rows first
+            key = self.data_filtered['id'].isin(self.model.selected)
+            order = key.sort_values(ascending=self.sort_order[column] != Qt.SortOrder.AscendingOrder, kind='stable').index
+            self.data_filtered = self.data_filtered.loc[order]
+        else:
+            ascending = self.sort_order[column] == Qt.SortOrder.AscendingOrder
+            self.data_filtered.sort_values(by=reference, ascending=ascending, inplace=True)
         self.data_filtered.reset_index(inplace=True, drop=True)
-        self.refresh_table()
+        self.index_rows()
+        self.model.reset()
+        self.request_thumbnails()
 
         # invert sort order for next click
         self.sort_order[column] = (Qt.SortOrder.DescendingOrder
@@ -273,53 +294,128 @@ class MediaTable(QWidget):
         self.table.horizontalHeader().setSortIndicator(column, self.sort_order[column])
 
     # Set Table Entries --------------------------------------------------------
-    def add_cell(self, row, column, qtw):
+    def visible_rows(self):
+        """First and last row in the viewport"""
+        n_rows = self.model.rowCount()
+        first = self.table.rowAt(0)
+        if first < 0:
+            return 0, n_rows - 1
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        return first, last if last >= 0 else n_rows - 1
+
+    def request_thumbnails(self, *args):
         """
-        Connect LoadTableThread signal to add cell to table
+        Load thumbnails for rows in view, then prefetch a page below and above
+        Rows scrolled past since the last request are cancelled
         """
-        self.table.blockSignals(True)
-        if column == 1:
-            pixmap = QPixmap.fromImage(qtw)
-            qtw = QLabel()
-            qtw.setPixmap(pixmap)
-            self.table.setCellWidget(row, column, qtw)
+        n_rows = self.model.rowCount()
+        if not n_rows:
+            self.thumbnail_cache.request([])
+            return
+        first, last = self.visible_rows()
+        page = last - first + 1
+        rows = list(range(first, last + 1)) + \
+            list(range(last + 1, min(last + 1 + page, n_rows))) + \
+            list(range(first - 1, max(first - 1 - page, -1), -1))
+        data = self.data_filtered.loc[rows, ['thumbnail_path', 'thumbnail_size', 'thumbnail_mtime']]
+        self.thumbnail_cache.request([(path if isinstance(path, str) else "", size, mtime)
+                                      for path, size, mtime in data.itertuples(index=False)])
+
+    def show_thumbnail(self, path, valid):
+        """Repaint once a requested thumbnail is loaded, regenerate it if missing or changed"""
+        if self.data_filtered.empty:
+            return
+        # rows without a thumbnail entry are found by queue_missing
+        if not valid and path:
+            rows = self.data_filtered.index[self.data_filtered['thumbnail_path'] == path]
+            for row in rows:
+                self.queue_thumbnail(self.data_filtered.loc[row])
+        self.table.viewport().update()
+
+    def queue_thumbnail(self, roi):
+        """Queue thumbnail of a displayed row to be regenerated"""
+        if self.data_type == 1:
+            self.thumbnail_service.queue_roi(roi['id'], roi['filepath'], roi['ext'], roi['sha256'], roi['frame'],
+                                             roi['bbox_x'], roi['bbox_y'], roi['bbox_w'], roi['bbox_h'])
         else:
-            self.table.setItem(row, column, qtw)
+            self.thumbnail_service.queue_media(roi['id'], roi['filepath'], roi['ext'], roi['sha256'])
 
-    def get_checkstate_int(self, item):
-        """Get integer value from checkstate of checkbox item"""
-        if (item == Qt.CheckState.Checked):
-            return 1
-        else:
-            return 0
+    def update_thumbnails(self, table, ids):
+        """Show thumbnails generated in the background for loaded rows"""
+        if table != ("roi" if self.data_type == 1 else "media") or self.data.empty:
+            return
+        rows = self.mpDB.select(f"{table}_thumbnails", columns="fid, filepath, size, mtime",
+                                row_cond=f"fid IN ({', '.join(map(str, ids))})")
+        thumbnails = {row[0]: row[1:] for row in rows} if rows else {}
+        if not thumbnails:
+            return
+        columns = ['thumbnail_path', 'thumbnail_size', 'thumbnail_mtime']
+        updated = self.data['id'].isin(thumbnails.keys())
+        for i, column in enumerate(columns):
+            self.data.loc[updated, column] = self.data.loc[updated, 'id'].map(lambda id: thumbnails[id][i])
+        if self.data_filtered.empty:
+            return
+        changed = self.data_filtered.index[self.data_filtered['id'].isin(thumbnails.keys())]
+        for row in changed:
+            thumbnail = thumbnails[self.data_filtered.at[row, 'id']]
+            # drop the stale pixmap, regenerated thumbnails can reuse the same path
+            self.thumbnail_cache.remove([self.data_filtered.at[row, 'thumbnail_path'], thumbnail[0]])
+            for column, value in zip(columns, thumbnail):
+                self.data_filtered.at[row, column] = value
+        self.model.refresh_rows(changed, column=1)
+        self.request_thumbnails()
 
-    def invert_checkstate(self, item):
-        """Invert checkstate of checkbox item"""
-        if item.checkState() == Qt.CheckState.Checked:
-            item.setCheckState(Qt.CheckState.Unchecked)
+    # UPDATE ENTRIES -----------------------------------------------------------
+    def index_rows(self):
+        """Map ids to rows of data_filtered, rebuilt whenever rows move"""
+        if self.data_filtered.empty:
+            self.row_index = pd.Series(dtype=int)
         else:
-            item.setCheckState(Qt.CheckState.Checked)
+            self.row_index = pd.Series(self.data_filtered.index, index=self.data_filtered['id'].astype(int))
+
+    def row_of(self, id):
+        """Row of data_filtered for id, None if filtered out"""
+        return self.row_index.get(int(id))
 
-    # UPDATE ENTRIES -----------------------------------------------------------
     def apply_edits(self):
         """
-        Applies all previous edits to the current data_filter if the row is present
+        Applies the latest edit of every edited cell to the current data_filter if the row is present
         """
-        for edit in self.edit_stack:
-            self.data_filtered.loc[edit['row'], edit['reference']] = edit['new_value']
+        values = dict()
+        for (id, reference), edits in self.edits.items():
+            values.setdefault(reference, dict())[id] = edits[-1]['new_value']
+        for reference, updates in values.items():
+            rows = self.row_index.reindex(list(updates.keys()))
+            present = rows.notna().tolist()
+            if any(present):
+                self.data_filtered.loc[rows[present].astype(int).values, reference] = \
+                    [value for value, keep in zip(updates.values(), present) if keep]
+
+    def record_edit(self, id, column, reference, previous_value, new_value):
+        """Add edit to the undo stack and to the journal of its cell"""
+        edit = {'column': column,
+                'id': int(id),
+                'reference': reference,
+                'previous_value': previous_value,
+                'new_value': new_value}
+        self.edit_stack.append(edit)
+        self.edits.setdefault((edit['id'], reference), []).append(edit)
+
+    def set_cell(self, row, reference, value):
+        """Write value to data_filtered and redraw the row"""
+        self.data_filtered.at[row, reference] = value
+        if reference == 'station_id':
+            self.data_filtered.at[row, 'station'] = self.valid_stations[value]
+        self.model.refresh_rows([row])
 
     def handle_checkbox_change(self, row, column):
         """ Detect when a checkbox is checked or unchecked """
         if column == 0:
-            item = self.table.item(row, column)
-            if item is not None:
-                checked = item.checkState() == Qt.CheckState.Checked
-                self.select_row(row, overwrite=checked)
-                self.parent.check_selected_rows()
+            self.parent.check_selected_rows()
 
-    def update_entry(self, row, column):
+    def update_entry(self, row, column, value):
         """
-        Allows user to edit entry in table
+        Allows user to edit entry in table, called by MediaTableModel.setData
 
         Save edits in queue, allow undo
         prompt user to save edits
@@ -332,17 +428,17 @@ class MediaTable(QWidget):
         # checked items
         elif reference == 'reviewed' or reference == 'favorite':
             previous_value = int(self.data_filtered.at[row, reference])
-            new_value = self.get_checkstate_int(self.table.item(row, column).checkState())
+            new_value = value
         # station
         elif reference == 'station':
             reference = 'station_id'
             previous_value = int(self.data_filtered.at[row, reference])
-            new_value = [k for k, v in self.valid_stations.items() if v == self.table.item(row, column).text()][0]
+            new_value = [k for k, v in self.valid_stations.items() if v == value][0]
         # viewpoint
         elif reference == 'viewpoint':
             previous_value = self.data_filtered.at[row, reference]
             # i hate this
-            key = [k for k, v in self.VIEWPOINTS.items() if v == self.table.item(row, column).text()][0]
+            key = [k for k, v in self.VIEWPOINTS.items() if v == value][0]
             if key == 'None':
                 new_value = None
             else:
@@ -350,53 +446,42 @@ class MediaTable(QWidget):
 
         # individual
         elif reference == 'individual_id' or reference == 'sex' or reference == 'age':
-            rid = self.data_filtered.at[row, 'individual_id']
-            if rid is None:
+            if pd.isna(self.data_filtered.at[row, 'individual_id']):
                 dialog = AlertPopup(self, "Please tag the ROI with an individual first.")
-                if dialog.exec():
-                    del dialog
-                    self.apply_edits()
-                    self.refresh_table(popup=False)
-                    return
+                dialog.exec()
+                del dialog
+                return
             else:
                 previous_value = self.data_filtered.at[row, reference]
-                new_value = self.table.item(row, column).text()
+                new_value = value
 
         else:
             previous_value = self.data_filtered.at[row, reference]
-            new_value = self.table.item(row, column).text()
+            new_value = value
 
         # add edit to stack
-        edit = {'row': row,
-                'column': column,
-                'id': rid,
-                'reference': reference,
-                'previous_value': previous_value,
-                'new_value': new_value}
-        self.edit_stack.append(edit)
+        self.record_edit(rid, column, reference, previous_value, new_value)
         self.update_signal.emit([row, column])
-        self.apply_edits()
-        self.refresh_table(popup=False)
+        # only the edited cell changes, earlier edits are already in data_filtered
+        self.set_cell(row, reference, new_value)
 
     def transpose_edit_stack(self, edit_stack):
         """
         Transpose edit stack from popup_roi to media_table format
         """
+        columns = {reference: column for column, reference in self.columns.items()}
+        # comments are edited per media, applied to each of its rois
+        media_rois = dict()
+        if self.data_type == 1 and any(edit['reference'] == 'comment' for edit in edit_stack):
+            media_rois = self.data.groupby('media_id')['id'].apply(list).to_dict()
         for edit in edit_stack:
-            print(edit)
-            id = edit['id']
-            row = self.data_filtered.index[self.data_filtered['id'] == id].tolist()
-            column = list(self.columns.keys())[list(self.columns.values()).index(edit['reference'])]
-            if row:
-                row = row[0]
-                new_edit = {'row': row,
-                            'column': column,
-                            'id': id,
-                            'reference': edit['reference'],
-                            'previous_value': edit['previous_value'],
-                            'new_value': edit['new_value']}
-                print(new_edit)
-                self.edit_stack.append(new_edit)
+            if self.data_type == 1 and edit['reference'] == 'comment':
+                ids = media_rois.get(edit['id'], [])
+            else:
+                ids = [edit['id']]
+            for id in ids:
+                self.record_edit(id, columns.get(edit['reference']), edit['reference'],
+                                 edit['previous_value'], edit['new_value'])
 
     def undo(self):
         """
@@ -404,56 +489,288 @@ class MediaTable(QWidget):
         """
         if len(self.edit_stack) > 0:
             last = self.edit_stack.pop()
-            self.data_filtered.loc[last['row'], last['reference']] = last['previous_value']
-            self.refresh_table(popup=False)
+            key = (last['id'], last['reference'])
+            cell = self.edits[key]
+            cell.pop()
+            # back to the previous edit of the same cell, or its original value
+            value = cell[-1]['new_value'] if cell else last['previous_value']
+            if not cell:
+                del self.edits[key]
+            row = self.row_of(last['id'])
+            if row is not None:
+                self.set_cell(row, last['reference'], value)
 
     def save_changes(self):
-        # commit all changes in self.edit_stack to database
-        while len(self.edit_stack) > 0:
-            edit = self.edit_stack.pop()
-            id = edit['id']
-            replace_dict = {edit['reference']: edit['new_value']}
-            if self.data_type == 1:
-                if edit['reference'] in {'station_id', 'sequence_id', 'external_id'}:
-                    self.mpDB.edit_row("media", id, replace_dict, allow_none=False, quiet=False)
-                elif edit['reference'] in {'age', 'sex'}:
-                    iid = self.data_filtered.loc[self.data_filtered['id'] == id, 'individual_id'].values[0]
-                    iid = int(iid) if pd.notna(iid) else None
-                    if iid is not None:
-                        self.mpDB.edit_row("individual", iid, replace_dict, allow_none=False, quiet=False)
-                elif edit['reference'] in {'comment'}:
-                    self.mpDB.edit_row("media", id, replace_dict, allow_none=True, quiet=False)
-                else:
-                    self.mpDB.edit_row("roi", id, replace_dict, allow_none=False, quiet=False)
-            else:
-                self.mpDB.edit_row("media", id, replace_dict, allow_none=False, quiet=False)
+        updates, cells = self.group_edits()
+        failed = self.write_edits(updates)
+
+        # keep the journal of cells that could not be saved, so they can be saved again or undone
+        unsaved = {cell for table in failed for cell in cells[table]}
+        self.edit_stack = [edit for edit in self.edit_stack if (edit['id'], edit['reference']) in unsaved]
+        self.edits = {cell: edits for cell, edits in self.edits.items() if cell in unsaved}
+        if failed:
+            dialog = AlertPopup(self, "Some edits could not be saved, they are kept so you can try again.")
+            dialog.exec()
+            del dialog
+            # database may differ from the cache, reload and reapply unsaved edits
+            self.load_data(self.data_type)
+            return
+        # patch cached data with saved values instead of fetching again
+        for table, columns in updates.items():
+            for column, values in columns.items():
+                if not self.patch_data(table, column, values):
+                    self.load_data(self.data_type)
+                    return
+        self.filter()
 
-        # reload data and refresh table
-        self.edit_stack = []
-        self.load_data(self.data_type)
+    def edit_target(self, lookup, id, reference):
+        """
+        Table and row id an edit of a cell is saved to
+        Returns (None, None) for individual columns of an roi without an individual
+        """
+        if self.data_type != 1:
+            return "media", id
+        if reference in self.MEDIA_COLUMNS:
+            return "media", lookup.at[id, 'media_id']
+        if reference in self.INDIVIDUAL_COLUMNS:
+            individual_id = lookup.at[id, 'individual_id']
+            return (None, None) if pd.isna(individual_id) else ("individual", individual_id)
+        return "roi", id
+
+    def group_edits(self):
+        """
+        Latest edit of each cell grouped by table and column
 
-    def select_row(self, row, overwrite=None):
-        select = self.table.item(row, 0)
-        if overwrite is not None:
-            if overwrite is True:
-                select.setCheckState(Qt.CheckState.Checked)
-            else:
-                select.setCheckState(Qt.CheckState.Unchecked)
+        Returns table to column to {row id: value}, and table to the (id, reference) cells it saves
+        """
+        lookup = self.data.set_index('id') if self.data_type == 1 else None
+        updates = dict()
+        cells = dict()
+        for (id, reference), edits in self.edits.items():
+            table, target = self.edit_target(lookup, id, reference)
+            if table is None:
+                continue
+            updates.setdefault(table, dict()).setdefault(reference, dict())[int(target)] = edits[-1]['new_value']
+            cells.setdefault(table, []).append((id, reference))
+        return updates, cells
+
+    def write_edits(self, updates):
+        """Commit grouped edits, one transaction per table, returns the tables that were rolled back"""
+        failed = []
+        for table, columns in updates.items():
+            try:
+                with self.mpDB.transaction():
+                    for column, values in columns.items():
+                        self.mpDB.edit_rows(table, column, values, quiet=False)
+            except sqlite3.Error:
+                # already logged
+                failed.append(table)
+        return failed
+
+    def patch_data(self, table, column, values):
+        """
+        Write saved values into self.data, matching every row that shares the edited entry
+        ie all rois of an edited media or individual
+
+        Values are converted to the cached column type, returns False if they
+        cannot be and the data must be fetched again
+        """
+        if table == "individual":
+            key = 'individual_id'
+        elif table == "media" and self.data_type == 1:
+            key = 'media_id'
         else:
-            self.invert_checkstate(select)
+            key = 'id'
+        # empty values are saved as NULL
+        values = pd.Series(values, dtype=object).mask(lambda value: value.eq(''))
+        if column in self.INTEGER_COLUMNS or pd.api.types.is_numeric_dtype(self.data[column]):
+            # sqlite stores numeric text in INTEGER columns as numbers, anything else is refetched
+            numbers = pd.to_numeric(values, errors='coerce')
+            cached = pd.to_numeric(self.data[column], errors='coerce')
+            if (numbers.isna() & values.notna()).any() or (cached.isna() & self.data[column].notna()).any():
+                return False
+            self.data[column] = cached
+            values = numbers
+        rows = self.data[key].isin(values.index)
+        self.data.loc[rows, column] = self.data.loc[rows, key].map(values)
+        return True
+
+    def select_row(self, row, overwrite=None):
+        if overwrite is None:
+            overwrite = not self.model.is_checked(row, 'select')
+        self.model.set_selected([row], overwrite)
+        self.parent.check_selected_rows()
 
     def select_all(self, overwrite=False):
         """Select all rows in the media table"""
-        for row in range(self.table.rowCount()):
-            self.select_row(row, overwrite=overwrite)
+        self.model.set_selected(list(range(self.model.rowCount())), overwrite)
+        self.parent.check_selected_rows()
 
     def selectedRows(self):
-        selected_rows = []
-        for row in range(self.table.rowCount()):
-            item = self.table.item(row, 0)
-            if item is not None and item.checkState() == Qt.CheckState.Checked:
-                selected_rows.append(row)
-        return selected_rows
+        return self.model.selected_rows()
 
     def edit_row(self, row):
         self.parent.edit_row(row)
+
+
+class MediaTableModel(QAbstractTableModel):
+    """
+    Table model backed directly by MediaTable.data_filtered
+    Cells are formatted when the view asks for them, so only visible rows are materialized
+    """
+    CHECKABLE = {'select', 'reviewed', 'favorite'}
+    READ_ONLY = {'thumbnail', 'filepath', 'timestamp', 'individual_id'}
+
+    def __init__(self, media_table):
+        super().__init__(media_table)
+        self.media_table = media_table
+        self.selected = set()  # ids of rows checked in select column
+
+    @property
+    def data_filtered(self):
+        return self.media_table.data_filtered
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.data_filtered)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.media_table.columns)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            if orientation == Qt.Orientation.Horizontal:
+                return self.media_table.headers[section]
+            return str(section + 1)
+        return None
+
+    def flags(self, index):
+        reference = self.media_table.columns[index.column()]
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if reference in self.CHECKABLE:
+            return flags | Qt.ItemFlag.ItemIsUserCheckable
+        if reference not in self.READ_ONLY:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        reference = self.media_table.columns[index.column()]
+        if reference in self.CHECKABLE:
+            if role == Qt.ItemDataRole.CheckStateRole:
+                return Qt.CheckState.Checked if self.is_checked(row, reference) else Qt.CheckState.Unchecked
+            return None
+        if reference == 'thumbnail':
+            if role == Qt.ItemDataRole.DecorationRole:
+                return self.thumbnail(row)
+            return None
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return self.display_text(self.data_filtered.iloc[row], reference)
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        row = index.row()
+        reference = self.media_table.columns[index.column()]
+        if reference == 'select' and role == Qt.ItemDataRole.CheckStateRole:
+            self.set_selected([row], Qt.CheckState(value) == Qt.CheckState.Checked)
+            self.media_table.handle_checkbox_change(row, index.column())
+            return True
+        if reference in self.CHECKABLE and role == Qt.ItemDataRole.CheckStateRole:
+            self.media_table.update_entry(row, index.column(), int(Qt.CheckState(value) == Qt.CheckState.Checked))
+            return True
+        if role == Qt.ItemDataRole.EditRole:
+            self.media_table.update_entry(row, index.column(), str(value))
+            return True
+        return False
+
+    def reset(self):
+        """Data_filtered replaced, sorted or edited, redraw everything"""
+        self.beginResetModel()
+        self.endResetModel()
+
+    def refresh_rows(self, rows, column=None):
+        """Redraw given rows, or one column of them"""
+        if not len(rows):
+            return
+        first = 0 if column is None else column
+        last = self.columnCount() - 1 if column is None else column
+        self.dataChanged.emit(self.index(min(rows), first), self.index(max(rows), last))
+
+    # Selection ---------------------------------------------------------------
+    def is_checked(self, row, reference):
+        if reference == 'select':
+            return int(self.data_filtered.at[row, 'id']) in self.selected
+        return bool(self.data_filtered.at[row, reference])
+
+    def set_selected(self, rows, checked):
+        if not len(rows):
+            return
+        ids = self.data_filtered.loc[rows, 'id'].astype(int)
+        if checked:
+            self.selected.update(ids)
+        else:
+            self.selected.difference_update(ids)
+        self.refresh_rows(rows, column=0)
+
+    def selected_rows(self):
+        if not self.selected or self.data_filtered.empty:
+            return []
+        return self.data_filtered.index[self.data_filtered['id'].isin(self.selected)].tolist()
+
+    # Formatting --------------------------------------------------------------
+    def display_text(self, roi, column):
+        """Text for a cell, from a row of data_filtered"""
+        # Station
+        if column == 'station':
+            return self.media_table.valid_stations[roi["station_id"]]
+        # Camera
+        elif column == 'camera_id':
+            if pd.notna(roi["camera_id"]) and roi["camera_id"]:
+                return self.media_table.valid_cameras[int(roi["camera_id"])]
+            return ""  # can be null
+        # Viewpoint
+        elif column == 'viewpoint':
+            vp_raw = roi["viewpoint"]
+            if pd.isna(vp_raw) or vp_raw is None or str(vp_raw) == "None":
+                vp_key = "None"
+            else:
+                vp_key = str(int(vp_raw))  # convert float 1.0 → int 1 → str "1"
+            return self.media_table.VIEWPOINTS.get(vp_key, "None")
+        # name not editable here
+        elif column == "individual_id":
+            if pd.notna(roi['individual_id']):
+                return str(self.media_table.individual_list.loc[roi['individual_id'], 'name'])
+            return "Unknown"
+        elif column == "sex" or column == 'age':
+            if pd.notna(roi['individual_id']):
+                return str(roi[column])
+            return "Unknown"
+        return str(roi[column])
+
+    def thumbnail(self, row):
+        """Cached thumbnail pixmap for a row, None until loaded by the viewport request"""
+        path = self.data_filtered.at[row, 'thumbnail_path']
+        return self.media_table.thumbnail_cache.get(path if isinstance(path, str) else "")
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    """Paints the thumbnail pixmap of a cell centered, at full thumbnail size"""
+    def __init__(self, size, parent=None):
+        super().__init__(parent)
+        self.size = size
+
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        pixmap = index.data(Qt.ItemDataRole.DecorationRole)
+        if pixmap is None or pixmap.isNull():
+            return
+        pixmap = pixmap.scaled(option.rect.size(), Qt.AspectRatioMode.KeepAspectRatio,
+                               Qt.TransformationMode.SmoothTransformation) \
+            if pixmap.width() > option.rect.width() or pixmap.height() > option.rect.height() else pixmap
+        x = option.rect.x() + (option.rect.width() - pixmap.width()) // 2
+        y = option.rect.y() + (option.rect.height() - pixmap.height()) // 2
+        painter.drawPixmap(x, y, pixmap)
+
+    def sizeHint(self, option, index):
+        return QSize(self.size, self.size)
@@ -1,6 +1,7 @@
 """
 Class Definition for Query Object
 """
+import sqlite3
 import pandas as pd
 from PyQt6.QtCore import QObject, pyqtSignal
 
@@ -251,10 +252,15 @@ class QC_QueryContainer(QObject):
         """
         Update records for roi after confirming a match
         """
-        for roi in self.current_query_rois:
-            self.mpDB.edit_row('roi', roi, {"individual_id": individual_id, "reviewed": 1})
-
-        self.mpDB.edit_row('roi', self.current_match_rid, {"individual_id": individual_id, "reviewed": 1})
+        rois = list(self.current_query_rois) + [self.current_match_rid]
+        try:
+            with self.mpDB.transaction():
+                self.mpDB.edit_rows('roi', 'individual_id', {roi: individual_id for roi in rois})
+                self.mpDB.edit_rows('roi', 'reviewed', {roi: 1 for roi in rois})
+        except sqlite3.Error:
+            # already logged, neither column was changed
+            return False
+        return True
 
     def unmatch(self):
         # Set current match id to none
@@ -1,6 +1,7 @@
 """
 Class Definition for Query Object
 """
+import sqlite3
 import pandas as pd
 from PyQt6.QtCore import QObject, pyqtSignal
 
@@ -8,7 +9,7 @@ import matchypatchy.database.media as db_roi
 from matchypatchy.database.location import fetch_station_names_from_id
 
 from matchypatchy.threads.model_download_thread import load_model
-from matchypatchy.threads.match_thread import MatchEmbeddingThread
+from matchypatchy.threads.match_thread import MatchEmbeddingThread, rank_matches
 
 
 class QueryContainer(QObject):
@@ -26,6 +27,7 @@ class QueryContainer(QObject):
         self.VIEWPOINT_DICT = load_model('VIEWPOINTS')
 
         self.neighbor_dict = dict()
+        self.match_objects = []
         self.ranked_sequences = []
 
         self.current_match_object = None
@@ -113,10 +115,42 @@ class QueryContainer(QObject):
 
     def capture_ranked_sequences(self, ranked_sequences):
         """Capture ranked_sequences from MatchEmbeddingThread"""
+        # keep every match object so queries unmatched later can be ranked again
+        self.match_objects = ranked_sequences
         self.ranked_sequences = ranked_sequences
         # set number of queries to validate
         self.n_queries = len(self.ranked_sequences)
 
+    def rerank(self):
+        """
+        Re-rank match objects against the reloaded data after a match edit,
+        without recomputing neighbors
+
+        Returns True if any queries remain to validate
+        """
+        self.ranked_sequences = rank_matches(self.match_objects, self.data.reset_index(), self.sequences)
+        self.n_queries = len(self.ranked_sequences)
+        return self.n_queries > 0
+
+    def changed_individuals(self, previous):
+        """Ids of rois whose individual differs from previous, a Series of individual_id by roi id"""
+        current = self.data['individual_id'].reindex(previous.index)
+        same = (current == previous) | (current.isna() & previous.isna())
+        return previous.index[~same].tolist()
+
+    def rematch(self, roi_ids):
+        """
+        Refresh match objects of the sequences of edited rois from the saved neighbor graph,
+        instead of running the match thread again, then re-rank
+
+        Returns True if any queries remain to validate
+        """
+        refreshed = self.match_thread.rematch(self.data, self.sequences, roi_ids)
+        self.match_objects = [match_object for match_object in self.match_objects
+                              if match_object.sequence_id not in refreshed]
+        self.match_objects.extend(match_object for match_object in refreshed.values() if match_object is not None)
+        return self.rerank()
+
     def finish_calculating(self):
         """
         Finish calculating neighbors, signal to DisplayCompare to update with gui
@@ -265,10 +299,15 @@ class QueryContainer(QObject):
     # MATCH FUNCTIONS ----------------------------------------------------------
     def new_iid(self, individual_id):
         """Update records for roi after confirming a match"""
-        for roi in self.current_query_rois:
-            self.mpDB.edit_row('roi', roi, {"individual_id": individual_id, "reviewed": 1})
-
-        self.mpDB.edit_row('roi', self.current_match_rid, {"individual_id": individual_id, "reviewed": 1})
+        rois = list(self.current_query_rois) + [self.current_match_rid]
+        try:
+            with self.mpDB.transaction():
+                self.mpDB.edit_rows('roi', 'individual_id', {roi: individual_id for roi in rois})
+                self.mpDB.edit_rows('roi', 'reviewed', {roi: 1 for roi in rois})
+        except sqlite3.Error:
+            # already logged, neither column was changed
+            return False
+        return True
 
     def merge(self):
         """Merge two individuals after match"""
@@ -298,8 +337,7 @@ class QueryContainer(QObject):
         # find all rois with newer name
         to_merge = self.data[self.data["sequence_id"].isin(sequence)]
 
-        for i in to_merge.index:
-            self.mpDB.edit_row('roi', i, {'individual_id': int(keep_id)}, quiet=False)
+        self.mpDB.edit_rows('roi', 'individual_id', {int(i): int(keep_id) for i in to_merge.index}, quiet=False)
 
     def unmatch(self):
         """Unmatch the current query ROI from the matched ROI"""
@@ -0,0 +1,86 @@
+"""
+Thumbnail Pixmap Cache
+
+Bounded LRU of decoded thumbnails shared by all views,
+misses are loaded in the background by ThumbnailLoaderThread
+"""
+from collections import OrderedDict
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QPixmap
+
+from matchypatchy.config import load_cfg
+from matchypatchy.threads.thumbnail_loader_thread import ThumbnailLoaderThread
+
+
+class ThumbnailCache(QObject):
+    thumbnail_loaded = pyqtSignal(str, bool)  # thumbnail path, valid against the store
+
+    def __init__(self, parent=None, max_mb=64):
+        super().__init__(parent)
+        self.max_bytes = int(max_mb) * 1024 * 1024
+        self.size = 0  # bytes of pixmaps held
+        self.pixmaps = OrderedDict()  # path to QPixmap, least recently used first
+        self.thumbnail_dir = str(load_cfg('THUMBNAIL_DIR'))
+        self.loader = ThumbnailLoaderThread(self.thumbnail_dir)
+        self.loader.loaded.connect(self.insert)
+        self.loader.start()
+
+    def __contains__(self, path):
+        return path in self.pixmaps
+
+    def get(self, path):
+        """Cached pixmap for thumbnail path, None if not loaded yet"""
+        pixmap = self.pixmaps.get(path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(path)
+        return pixmap
+
+    def request(self, jobs):
+        """
+        Load thumbnails not yet cached, highest priority first
+        Replaces the previous request, anything it still had pending is cancelled
+        jobs: (thumbnail path, recorded size, recorded mtime)
+        """
+        self.loader.request([job for job in jobs if job[0] not in self.pixmaps])
+
+    def insert(self, path, image, valid, thumbnail_dir):
+        """Convert a loaded image on the gui thread and evict down to max_bytes"""
+        if thumbnail_dir != self.thumbnail_dir:  # loaded before a project switch
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.remove([path])
+        self.pixmaps[path] = pixmap
+        self.size += pixmap_bytes(pixmap)
+        while self.size > self.max_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.size -= pixmap_bytes(evicted)
+        self.thumbnail_loaded.emit(path, valid)
+
+    def remove(self, paths):
+        """Drop pixmaps, ie when a thumbnail is regenerated"""
+        for path in paths:
+            pixmap = self.pixmaps.pop(path, None)
+            if pixmap is not None:
+                self.size -= pixmap_bytes(pixmap)
+
+    def clear(self):
+        self.loader.cancel()
+        self.pixmaps.clear()
+        self.size = 0
+
+    def set_thumbnail_dir(self, thumbnail_dir):
+        """Load thumbnails from thumbnail_dir from now on, ie after switching projects"""
+        self.thumbnail_dir = str(thumbnail_dir)
+        self.loader.set_thumbnail_dir(self.thumbnail_dir)
+        self.clear()
+
+    def stop(self):
+        """Stop the loader thread, before closing"""
+        self.loader.requestInterruption()
+        self.loader.wait()
+
+
+def pixmap_bytes(pixmap):
+    """Approximate memory held by a pixmap"""
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
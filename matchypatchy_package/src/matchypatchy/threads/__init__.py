@@ -6,6 +6,8 @@ from matchypatchy.threads import model_download_thread
 from matchypatchy.threads import reid_thread
 from matchypatchy.threads import sequence_thread
 from matchypatchy.threads import table_thread
+from matchypatchy.threads import thumbnail_loader_thread
+from matchypatchy.threads import thumbnail_thread
 
 from matchypatchy.threads.animl_thread import (AnimlThread,
                                                BuildManifestThread,
@@ -13,21 +15,29 @@ from matchypatchy.threads.animl_thread import (AnimlThread,
 from matchypatchy.threads.import_thread import (CSVImportThread,
                                                 FolderImportThread,)
 from matchypatchy.threads.match_object import (MatchObject,)
-from matchypatchy.threads.match_thread import (MatchEmbeddingThread,)
+from matchypatchy.threads.match_thread import (MatchEmbeddingThread,
+                                               rank_matches,)
 from matchypatchy.threads.model_download_thread import (DownloadMLThread,
-                                                        delete, get_path, 
-                                                        is_valid_reid_model, 
-                                                        load_model, update_model_yml,)
-from matchypatchy.threads.reid_thread import (ReIDThread,)
-from matchypatchy.threads.sequence_thread import (SequenceThread,)
-from matchypatchy.threads.table_thread import (FetchTableThread,
-                                               LoadTableThread,)
+                                                        delete, get_path,
+                                                        is_valid_reid_model,
+                                                        load_model,
+                                                        update_model_yml,)
+from matchypatchy.threads.reid_thread import (ReIDThread, batch_filepaths,
+                                              batch_roi_ids, readable_image,)
+from matchypatchy.threads.sequence_thread import (SequenceThread,
+                                                  sequence_groups,)
+from matchypatchy.threads.table_thread import (FetchTableThread,)
+from matchypatchy.threads.thumbnail_loader_thread import (ThumbnailLoaderThread,)
+from matchypatchy.threads.thumbnail_thread import (ThumbnailThread,)
 
 __all__ = ['AnimlThread', 'BuildManifestThread', 'CSVImportThread',
            'DownloadMLThread', 'FetchTableThread', 'FolderImportThread',
-           'LoadTableThread', 'MEGADETECTORv1000_SIZE', 'MatchEmbeddingThread',
-           'MatchObject', 'ReIDThread', 'SequenceThread', 'animl_thread',
-           'delete', 'get_path', 'import_thread', 'is_valid_reid_model',
-           'load_model', 'match_object', 'match_thread',
-           'model_download_thread', 'reid_thread', 'sequence_thread',
-           'table_thread', 'update_model_yml']
\ No newline at end of file
+           'MEGADETECTORv1000_SIZE', 'MatchEmbeddingThread', 'MatchObject',
+           'ReIDThread', 'SequenceThread', 'ThumbnailLoaderThread',
+           'ThumbnailThread', 'animl_thread', 'batch_filepaths',
+           'batch_roi_ids', 'delete', 'get_path', 'import_thread',
+           'is_valid_reid_model', 'load_model', 'match_object',
+           'match_thread', 'model_download_thread', 'rank_matches',
+           'readable_image', 'reid_thread', 'sequence_groups',
+           'sequence_thread', 'table_thread', 'thumbnail_loader_thread',
+           'thumbnail_thread', 'update_model_yml']
@@ -8,7 +8,6 @@ from pathlib import Path
 
 from PyQt6.QtCore import QThread, pyqtSignal
 
-from matchypatchy.database.thumbnails import save_roi_thumbnail
 from matchypatchy.database.media import fetch_roi_media
 from matchypatchy.threads.model_download_thread import get_path
 from matchypatchy import config
@@ -37,12 +36,12 @@ class AnimlThread(QThread):
     prompt_update = pyqtSignal(str)  # Signal to update the alert prompt
     progress_update = pyqtSignal(int)  # Signal to update the progress bar
 
-    def __init__(self, mpDB, DETECTOR_KEY):
+    def __init__(self, mpDB, DETECTOR_KEY, thumbnail_service=None):
         super().__init__()
         self.mpDB = mpDB
         self.ml_dir = Path(config.load_cfg('ML_DIR'))
         self.n_frames = config.load_cfg('VIDEO_FRAMES')
-        self.thumbnail_dir = config.load_cfg('THUMBNAIL_DIR')
+        self.thumbnail_service = thumbnail_service  # ThumbnailThread to queue new roi thumbnails
         self.confidence_threshold = 0.1
         self.DETECTOR_KEY = DETECTOR_KEY
         self.md_filepath = get_path(self.ml_dir, DETECTOR_KEY)
@@ -113,11 +112,10 @@ class AnimlThread(QThread):
                                                viewpoint=viewpoint,
                                                individual_id=individual_id,
                                                emb=0)
-                    # save thumbnails
-                    roi_thumbnail = save_roi_thumbnail(self.thumbnail_dir,
-                                                       image['filepath'], image['ext'], frame,
-                                                       bbox_x, bbox_y, bbox_w, bbox_h)
-                    self.mpDB.add_thumbnail("roi", roi_id, roi_thumbnail)
+                    # queue thumbnails
+                    if self.thumbnail_service is not None and roi_id is not None:
+                        self.thumbnail_service.queue_roi(roi_id, image['filepath'], image['ext'], image['sha256'], frame,
+                                                         bbox_x, bbox_y, bbox_w, bbox_h)
             self.progress_update.emit(round(100 * (i + 1) / self.to_process))
 
         # Process existing rois without bbox
@@ -150,4 +148,8 @@ class AnimlThread(QThread):
                         "bbox_w": bbox_w,
                         "bbox_h": bbox_h
                     })
+                    # replace full-frame thumbnail with crop
+                    if self.thumbnail_service is not None:
+                        self.thumbnail_service.queue_roi(image['id'], image['filepath'], image['ext'], image['sha256'], frame,
+                                                         bbox_x, bbox_y, bbox_w, bbox_h)
             self.progress_update.emit(round(100 * (i + 1) / self.to_process))
@@ -1,17 +1,18 @@
 """
 QThreads for Importing Data
 
+Thumbnails are generated afterwards by the background ThumbnailThread
 """
 from pathlib import Path
 from PyQt6.QtCore import QThread, pyqtSignal
 
 from matchypatchy.config import load_cfg
-from matchypatchy.database.thumbnails import save_media_thumbnail, save_roi_thumbnail
-from matchypatchy.database.media import get_sha256
+from matchypatchy.database.media import hash_files
 
 
 class CSVImportThread(QThread):
     progress_update = pyqtSignal(int)  # Signal to update the progress bar
+    BATCH_SIZE = 500  # files written per bulk insert
 
     def __init__(self, mpDB, unique_images, selected_columns, logger):
         super().__init__()
@@ -19,104 +20,129 @@ class CSVImportThread(QThread):
         self.logger = logger
         self.unique_images = unique_images
         self.selected_columns = selected_columns
-        self.thumbnail_dir = load_cfg('THUMBNAIL_DIR')
 
     def run(self):
         roi_counter = 0  # progressbar counter
-        for filepath, group in self.unique_images:
-
-            if not self.isInterruptionRequested():
-                # check to see if file exists
-                if not Path(filepath).exists():
-                    self.logger.warning(f"File {filepath} does not exist, skipping import...")
-                    continue
-
-                # get file extension
-                ext = Path(filepath).suffix.lower()
-
-                # get remaining information
-                exemplar = group.head(1)
-                # timestamp
-                timestamp = exemplar[self.selected_columns["timestamp"]].item()
-
-                survey_id = self.survey(exemplar)
-                station_id = self.station(exemplar, survey_id)
-                camera_id = self.camera(exemplar, station_id)
-
-                # Optional data
-                sequence_id = int(exemplar[self.selected_columns["sequence_id"]].item()) if self.selected_columns["sequence_id"] != "None" else None
-                external_id = int(exemplar[self.selected_columns["external_id"]].item()) if self.selected_columns["external_id"] != "None" else None
-                comment = exemplar[self.selected_columns["comment"]].item() if self.selected_columns["comment"] != "None" else None
-
-                hash = get_sha256(filepath)  # Calculate the SHA256 hash of the file
-
-                # insert into table
-                media_id = self.mpDB.add_media(filepath,
-                                               hash,
-                                               ext,
-                                               timestamp,
-                                               station_id=station_id,
-                                               camera_id=camera_id,
-                                               sequence_id=sequence_id,
-                                               external_id=external_id,
-                                               comment=comment)
-                # image already added, get correct media_id
-                if media_id == "duplicate_error":
-                    media_id = self.mpDB.select("media", columns="id", row_cond=f'filepath="{filepath}"')[0][0]
-                # save thumbnail for new media
-                else:
-                    media_thumbnail = save_media_thumbnail(self.thumbnail_dir, filepath, ext)
-                    self.mpDB.add_thumbnail("media", media_id, media_thumbnail)
-
-                for i, roi in group.iterrows():
-                    # frame number for videos, else 1 if image
-                    frame = roi["frame"] if "frame" in group.columns else 0
-
-                    # convert old md bbox format if present, else look for new bbox format, else add filterable empties
-                    if "bbox1" in roi:
-                        bbox_x = roi["bbox1"]
-                        bbox_y = roi["bbox2"]
-                        bbox_w = roi["bbox3"]
-                        bbox_h = roi["bbox4"]
-                    elif "bbox_x" in roi:
-                        bbox_x = roi["bbox_x"]
-                        bbox_y = roi["bbox_y"]
-                        bbox_w = roi["bbox_w"]
-                        bbox_h = roi["bbox_h"]
-                    else:  # add filterable empties
-                        bbox_x = -1
-                        bbox_y = -1
-                        bbox_w = -1
-                        bbox_h = -1
-
-                    # individual
-                    individual_id = self.individual(roi)
-
-                    # viewpoint
-                    viewpoint = int(roi[self.selected_columns["viewpoint"]]) if self.selected_columns["viewpoint"] != "None" else None
-
-                    # set reviewed to 1 for named images
-                    reviewed = 1 if individual_id is not None else 0
-
-                    # do not add emb_id, to be determined later
-                    roi_id = self.mpDB.add_roi(media_id,
-                                               frame,
-                                               bbox_x, bbox_y, bbox_w, bbox_h,
-                                               viewpoint=viewpoint,
-                                               reviewed=reviewed,
-                                               individual_id=individual_id,
-                                               emb=0)
-                    # save thumbnails
-                    roi_thumbnail = save_roi_thumbnail(self.thumbnail_dir, filepath, ext, frame, bbox_x, bbox_y, bbox_w, bbox_h)
-                    self.mpDB.add_thumbnail("roi", roi_id, roi_thumbnail)
-
-                    roi_counter += 1
-                    self.progress_update.emit(roi_counter)
+        batch = []
+        file_hashes = []
+        images = list(self.unique_images)
+        # hash files in the background ahead of the database writes
+        hashes = hash_files([filepath for filepath, _ in images], workers=int(load_cfg('HASH_WORKERS')),
+                            known=self.mpDB.file_hashes() if load_cfg('FAST_HASH') else None)
+        for (filepath, group), hashed in zip(images, hashes):
+            if self.isInterruptionRequested():
+                break
+            media = self.prepare_media(filepath, group, None if hashed is None else hashed[0])
+            if hashed is not None:
+                file_hashes.append((filepath, hashed[1], hashed[2], hashed[0]))
+            if media is not None:
+                batch.append((media, group))
+            # write rows in bulk
+            if len(batch) >= self.BATCH_SIZE:
+                roi_counter = self.import_batch(batch, roi_counter)
+                self.mpDB.add_file_hashes(file_hashes)
+                batch = []
+                file_hashes = []
+        hashes.close()
+
+        if batch and not self.isInterruptionRequested():
+            roi_counter = self.import_batch(batch, roi_counter)
+        self.mpDB.add_file_hashes(file_hashes)
 
         if not self.isInterruptionRequested():
             # finished adding media
             self.finished.emit()
 
+    def prepare_media(self, filepath, group, hash):
+        """Return media row for a file in MEDIA_COLUMNS order, None if file is missing"""
+        # check to see if file exists
+        if hash is None or not Path(filepath).exists():
+            self.logger.warning(f"File {filepath} does not exist, skipping import...")
+            return None
+
+        # get file extension
+        ext = Path(filepath).suffix.lower()
+
+        # get remaining information
+        exemplar = group.head(1)
+        # timestamp
+        timestamp = exemplar[self.selected_columns["timestamp"]].item()
+
+        survey_id = self.survey(exemplar)
+        station_id = self.station(exemplar, survey_id)
+        camera_id = self.camera(exemplar, station_id)
+
+        # Optional data
+        sequence_id = int(exemplar[self.selected_columns["sequence_id"]].item()) if self.selected_columns["sequence_id"] != "None" else None
+        external_id = int(exemplar[self.selected_columns["external_id"]].item()) if self.selected_columns["external_id"] != "None" else None
+        comment = exemplar[self.selected_columns["comment"]].item() if self.selected_columns["comment"] != "None" else None
+
+        return (filepath, hash, ext, timestamp, station_id,
+                camera_id, sequence_id, external_id, comment)
+
+    def prepare_roi(self, media_id, roi, group):
+        """Return roi row in ROI_COLUMNS order"""
+        # frame number for videos, else 1 if image
+        frame = roi["frame"] if "frame" in group.columns else 0
+
+        # convert old md bbox format if present, else look for new bbox format, else add filterable empties
+        if "bbox1" in roi:
+            bbox_x = roi["bbox1"]
+            bbox_y = roi["bbox2"]
+            bbox_w = roi["bbox3"]
+            bbox_h = roi["bbox4"]
+        elif "bbox_x" in roi:
+            bbox_x = roi["bbox_x"]
+            bbox_y = roi["bbox_y"]
+            bbox_w = roi["bbox_w"]
+            bbox_h = roi["bbox_h"]
+        else:  # add filterable empties
+            bbox_x = -1
+            bbox_y = -1
+            bbox_w = -1
+            bbox_h = -1
+
+        # individual
+        individual_id = self.individual(roi)
+
+        # viewpoint
+        viewpoint = int(roi[self.selected_columns["viewpoint"]]) if self.selected_columns["viewpoint"] != "None" else None
+
+        # set reviewed to 1 for named images
+        reviewed = 1 if individual_id is not None else 0
+
+        # do not add emb_id, to be determined later
+        return (media_id, frame, bbox_x, bbox_y, bbox_w, bbox_h,
+                viewpoint, reviewed, 0, individual_id, 0)
+
+    def import_batch(self, batch, roi_counter):
+        """Insert a batch of media and their rois"""
+        media_ids = self.mpDB.add_media_many([media for media, _ in batch])
+
+        roi_rows = []
+        for (media, group), media_id in zip(batch, media_ids):
+            filepath, sha256 = media[0], media[1]
+            if media_id is None:
+                continue
+            # image already added, get correct media_id
+            if media_id == "duplicate_error":
+                media_id = self.existing_media(filepath, sha256)
+
+            for _, roi in group.iterrows():
+                roi_rows.append(self.prepare_roi(media_id, roi, group))
+
+        self.mpDB.add_roi_many(roi_rows)
+        roi_counter += len(roi_rows)
+        self.progress_update.emit(roi_counter)
+        return roi_counter
+
+    def existing_media(self, filepath, sha256):
+        """Get id of media already in the database by filepath, else by hash"""
+        rows = self.mpDB.select("media", columns="id", row_cond=f'filepath="{filepath}"')
+        if not rows:
+            rows = self.mpDB.select("media", columns="id", row_cond=f"sha256='{sha256}'")
+        return rows[0][0]
+
     def survey(self, exemplar):
         """Get or create survey"""
         # get active survey
@@ -172,6 +198,7 @@ class CSVImportThread(QThread):
 # FOLDER IMPORT ================================================================
 class FolderImportThread(QThread):
     progress_update = pyqtSignal(int)  # Signal to update the progress bar
+    BATCH_SIZE = 500  # files written per bulk insert
 
     def __init__(self, mpDB, active_survey, data, station_level, camera_level, logger):
         super().__init__()
@@ -182,59 +209,79 @@ class FolderImportThread(QThread):
         self.station_level = station_level
         self.camera_level = camera_level
         self.default_station = None
-        self.thumbnail_dir = load_cfg('THUMBNAIL_DIR')
         # get timezone for timestamp parsing
 
     def run(self):
-        for i, file in self.data.iterrows():
-            if not self.isInterruptionRequested():
-                filepath = file['filepath']
-                timestamp = file['datetime']
-
-                # check to see if file exists
-                if not Path(filepath).exists():
-                    self.logger.warning(f"File {filepath} does not exist")
-                    continue
-
-                # get file extension
-                ext = Path(filepath).suffix.lower()
-
-                survey_id = self.active_survey[0]
-
-                # get remaining information
-                if self.station_level > 0:
-                    station_id = self.station(filepath, survey_id)
-
-                    # add camera if camera level provided, else None
-                    if self.camera_level > 0:
-                        camera_id = self.camera(filepath, station_id)
-
-                else:
-                    # create default station if no station level and use for all media
-                    if not self.default_station:
-                        self.default_station = self.mpDB.add_station("Default Station", None, None, int(survey_id))
-                    station_id = self.default_station
-
-                hash = get_sha256(filepath)  # Calculate the SHA256 hash of the file
-
-                # insert into table, force type
-                media_id = self.mpDB.add_media(filepath,
-                                               hash,
-                                               ext,
-                                               str(timestamp),
-                                               int(station_id),
-                                               camera_id=int(camera_id) if self.camera_level > 0 else None,
-                                               sequence_id=None,
-                                               external_id=None,
-                                               comment=None)
-                # save thumbnail
-                thumbnail_path = save_media_thumbnail(self.thumbnail_dir, filepath, ext)
-                self.mpDB.add_thumbnail("media", media_id, thumbnail_path)
-
-                self.progress_update.emit(i)
-
-        # finished adding media
-        self.finished.emit()
+        counter = 0  # progressbar counter, every file processed including skipped ones
+        batch = []
+        file_hashes = []
+        # hash files in the background ahead of the database writes
+        hashes = hash_files(self.data['filepath'].tolist(), workers=int(load_cfg('HASH_WORKERS')),
+                            known=self.mpDB.file_hashes() if load_cfg('FAST_HASH') else None)
+        for (i, file), hashed in zip(self.data.iterrows(), hashes):
+            if self.isInterruptionRequested():
+                break
+            media = self.prepare_media(file, None if hashed is None else hashed[0])
+            if hashed is not None:
+                file_hashes.append((file['filepath'], hashed[1], hashed[2], hashed[0]))
+            counter += 1
+            if media is not None:
+                batch.append(media)
+            # write rows in bulk
+            if len(batch) >= self.BATCH_SIZE:
+                self.import_batch(batch)
+                self.mpDB.add_file_hashes(file_hashes)
+                batch = []
+                file_hashes = []
+                self.progress_update.emit(counter)
+        hashes.close()
+
+        if batch and not self.isInterruptionRequested():
+            self.import_batch(batch)
+        self.mpDB.add_file_hashes(file_hashes)
+
+        if not self.isInterruptionRequested():
+            # finished adding media
+            self.progress_update.emit(counter)
+            self.finished.emit()
+
+    def prepare_media(self, file, hash):
+        """Return media row for a file in MEDIA_COLUMNS order, None if file is missing"""
+        filepath = file['filepath']
+        timestamp = file['datetime']
+
+        # check to see if file exists
+        if hash is None or not Path(filepath).exists():
+            self.logger.warning(f"File {filepath} does not exist")
+            return None
+
+        # get file extension
+        ext = Path(filepath).suffix.lower()
+
+        survey_id = self.active_survey[0]
+        camera_id = None
+
+        # get remaining information
+        if self.station_level > 0:
+            station_id = self.station(filepath, survey_id)
+
+            # add camera if camera level provided, else None
+            if self.camera_level > 0:
+                camera_id = self.camera(filepath, station_id)
+
+        else:
+            # create default station if no station level and use for all media
+            if not self.default_station:
+                self.default_station = self.mpDB.add_station("Default Station", None, None, int(survey_id))
+            station_id = self.default_station
+
+        # force type
+        return (filepath, hash, ext, str(timestamp), int(station_id),
+                int(camera_id) if camera_id is not None else None, None, None, None)
+
+    def import_batch(self, batch):
+        """Insert a batch of media"""
+        self.mpDB.add_media_many(batch)
 
     def station(self, filepath, survey_id):
         """Get or create station"""
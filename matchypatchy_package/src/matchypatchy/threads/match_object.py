@@ -1,8 +1,12 @@
+import pandas as pd
+
+
 class MatchObject():
     def __init__(self, sequence_id, filtered_neighbors, query_data, match_data):
         self.sequence_id = sequence_id
         self.query_data = query_data
          # rank by distance first
+        self.matches = filtered_neighbors  # valid matches, never padded, ranked into neighbors
         self.neighbors = filtered_neighbors
         self.query_data = query_data
         self.match_data = match_data
@@ -22,36 +26,37 @@ class MatchObject():
     def get_ranked_matches(self):
         return self.ranked_matches
 
-    def rank_neighbors_by_distance(self):
-        """Rank matches by distance"""
-        self.neighbors = sorted(self.neighbors, key=lambda x: x[1])
-
-    def rank_neighbors_by_favorites(self, favorite_rois):
-        """Rank matches by favorites"""
-        self.neighbors = sorted(self.neighbors, key=lambda x: (x[0] not in favorite_rois))
-
-    def rank_neighbors_by_ided(self, ided_rois):
-        """Rank matches by IDed status"""
-        self.neighbors = sorted(self.neighbors, key=lambda x: (x[0] not in ided_rois))
+    def rank_neighbors(self, ided_rois=frozenset(), favorite_rois=frozenset()):
+        """
+        Rank matches in one sort: IDed rois first, then favorites, then by distance
+        Always ranks the unpadded matches, so a stack can be ranked and padded again
+        ided_rois, favorite_rois: sets of roi ids
+        """
+        self.neighbors = sorted(self.matches, key=lambda x: (x[0] not in ided_rois,
+                                                             x[0] not in favorite_rois,
+                                                             x[1]))
 
-    def pad_sequences(self, rois, sequences):
+    def pad_sequences(self, roi_lookup, sequences):
         """
         For each remaining match, add the rest of the sequence to the match stack
         and move existing sequence matches to the appropriate position
+        Pads the ranked neighbors, rank_neighbors must run first
+
+        roi_lookup: dict of roi id to its 'sequence_id' and 'viewpoint', shared by all match objects
         """
         matched_rois = [item[0] for item in self.neighbors]
         new_stack = []  # match stack after padding
-        to_remove = []
+        to_remove = set()
         match_sequence_rois = {}
         distances = {}
+        last_index = {roi: i for i, roi in enumerate(matched_rois)}
         for i, match in enumerate(matched_rois):
-            match_sequence_id = rois.loc[rois['id'] == match, 'sequence_id'].values[0]
-            match_sequence_rois[match] = sequences[match_sequence_id]
+            match_sequence_rois[match] = sequences[roi_lookup[match]['sequence_id']]
             distances[match] = self.neighbors[i][1]
             for roi in match_sequence_rois[match]:
                 # check if match sequence appears later in match stack
-                if roi in matched_rois[i + 1:]:
-                    to_remove.append(roi)
+                if last_index.get(roi, -1) > i:
+                    to_remove.add(roi)
 
         # rebuild match stack with padded sequences, using lowest distance match as anchor
         for match in matched_rois:
@@ -59,10 +64,11 @@ class MatchObject():
                 for roi in match_sequence_rois[match]:
                     new_stack.append((roi, distances[match]))
 
-        # replace info with new padded stack
+        # replace info with new padded stack, query rois are unchanged
         self.neighbors = new_stack
-        self.query_data = rois[rois['id'].isin(self.query_data['id'])][['id', 'viewpoint']]
-        self.match_data = rois[rois['id'].isin([x[0] for x in self.neighbors])][['id', 'viewpoint']]
+        match_ids = [id for id in dict.fromkeys(x[0] for x in self.neighbors) if id in roi_lookup]
+        self.match_data = pd.DataFrame({'id': match_ids,
+                                        'viewpoint': [roi_lookup[id]['viewpoint'] for id in match_ids]})
 
     def zip_viewpoint(self):
         self.query_viewpoint_map = dict(zip(self.query_data['id'], self.query_data['viewpoint']))
@@ -77,8 +83,9 @@ class MatchObject():
         self.zip_viewpoint()
 
         # determine viewpoint matches between query sequence and matched sequence
-        viewpoint_matches = {x for x in self.query_data['viewpoint'].values if x in self.match_data['viewpoint'].values}
-        viewpoint_matches.discard(None)  # remove unknown viewpoint category
+        match_viewpoints = set(self.match_viewpoint_map.values())
+        # remove unknown viewpoint category
+        viewpoint_matches = {x for x in self.query_data['viewpoint'].values if pd.notna(x) and x in match_viewpoints}
    
         # reorder query sequence by viewpoint
         self.og_ranked_query_rids = sorted(self.query_data['id'].values.astype(int).tolist(), 
@@ -2,6 +2,7 @@
 QThread for Matching Embeddings
 
 """
+import numpy as np
 import pandas as pd
 
 from PyQt6.QtCore import QThread, pyqtSignal
@@ -9,7 +10,6 @@ from PyQt6.QtCore import QThread, pyqtSignal
 from matchypatchy.threads.match_object import MatchObject
 
 
-
 class MatchEmbeddingThread(QThread):
     progress_update = pyqtSignal(int)  # Signal to update the progress bar
     prompt_update = pyqtSignal(str)  # Signal to update the alert prompt
@@ -20,10 +20,7 @@ class MatchEmbeddingThread(QThread):
                  filter_dict=None, valid_stations=None):
         super().__init__()
         self.mpDB = mpDB
-        self.rois = rois.drop(['frame', 'bbox_x', 'bbox_y', 'bbox_w', 'bbox_h',
-                               'comment', 'name', 'sex', 'age'], axis=1).reset_index()
-        self.sequences = sequences
-        self.n = len(sequences)
+        self.set_rois(rois, sequences)
         self.k = k
         self.metric = metric
         if self.metric == 'cosine':
@@ -33,6 +30,7 @@ class MatchEmbeddingThread(QThread):
         self.filter_dict = filter_dict
         self.valid_stations = valid_stations
 
+        self.neighbors = {}
         self.pairs = []
         self.ranked_sequences = []
         self.ranked_sequences_without_query_order = []
@@ -47,28 +45,16 @@ class MatchEmbeddingThread(QThread):
         # 3. Rank ROIs by match scores, prioritize previously IDd individuals
         # 4. Pad sequences to include all ROIs from matched sequences
         """
+        # knn for every roi from the saved neighbor graph, only rois embedded since it was saved are queried
+        query_ids = [roi_id for s in self.sequences for roi_id in self.sequences[s]]
+        self.neighbors = self.mpDB.knn_many(query_ids, k=self.k)
+        # filter neighbors of every sequence for valid matches in one pass
+        valid_neighbors = self.filter_valid()
+
         for i, s in enumerate(self.sequences):
             if not self.isInterruptionRequested():
-                sequence_rois = self.sequences[s]
-
-                # get all neighbors for sequence
-                all_neighbors = []
-                for roi_id in sequence_rois:
-                    all_neighbors.extend(self.roi_knn(roi_id))
-
-                all_neighbors = self.remove_duplicate_matches(all_neighbors)
-                # filter neighbors for valid matches
-                filtered_neighbors = self.filter_valid(sequence_rois, all_neighbors)
-
-                if filtered_neighbors:
-                    filtered_neighbors = self.remove_duplicate_matches(filtered_neighbors)
-
-                    # get viewpoints for query sequence and matched sequence
-                    query_data = self.rois[self.rois['id'].isin(sequence_rois)][['id', 'viewpoint']]
-                    matches = [x[0] for x in filtered_neighbors]
-                    match_data = self.rois[self.rois['id'].isin(matches)][['id', 'viewpoint']]
-                    # create match object to store matches and data for each sequence, to be used in ranking and padding
-                    match_object = MatchObject(s, filtered_neighbors, query_data, match_data)
+                match_object = self.match_object(s, valid_neighbors.get(s))
+                if match_object is not None:
                     self.pairs.append(match_object)
 
                 completed_percentage = round((100 * (i + 1) / self.n) - 1)
@@ -76,49 +62,118 @@ class MatchEmbeddingThread(QThread):
 
         # rank sequences if matches found
         if len(self.pairs) > 0:
-            # rank sequences by number of matches and ided status of matches
-            self.rank()
+            # rank sequences by number of matches and ided status of matches,
             # pad sequences with remaining matches and order by viewpoint
-            for match_object in self.pairs:
-                match_object.pad_sequences(self.rois, self.sequences)
-                match_object.order_matches()
+            self.rank()
 
         self.progress_update.emit(100)
         self.ranked_queries_return.emit(self.pairs)
 
+    def set_rois(self, rois, sequences):
+        """Set rois and sequences to match, indexed for filter_valid"""
+        self.rois = rois.drop(['frame', 'bbox_x', 'bbox_y', 'bbox_w', 'bbox_h',
+                               'comment', 'name', 'sex', 'age'], axis=1).reset_index()
+        self.sequences = sequences
+        self.n = len(sequences)
+        self.index_rois()
+
+    def match_object(self, s, filtered_neighbors):
+        """Match object of sequence s, None if it has no valid neighbors"""
+        if not filtered_neighbors:
+            return None
+        # get viewpoints for query sequence and matched sequence
+        query_data = self.roi_data(self.sequences[s])
+        match_data = self.roi_data([x[0] for x in filtered_neighbors])
+        # create match object to store matches and data for each sequence, to be used in ranking and padding
+        return MatchObject(s, filtered_neighbors, query_data, match_data)
+
+    def rematch(self, rois, sequences, roi_ids):
+        """
+        Refresh match objects of the sequences of edited rois without running the thread again,
+        only their rois are queried from the saved neighbor graph
+
+        Returns dict of sequence to MatchObject, None if it has no valid matches left
+        """
+        self.set_rois(rois, sequences)
+        keys = list(dict.fromkeys(self.roi_lookup[roi_id]['sequence_id'] for roi_id in roi_ids
+                                  if roi_id in self.roi_lookup))
+        keys = [s for s in keys if s in self.sequences]
+        query_ids = [roi_id for s in keys for roi_id in self.sequences[s]]
+        self.neighbors.update(self.mpDB.knn_many(query_ids, k=self.k))
+        valid_neighbors = self.filter_valid(keys)
+        return {s: self.match_object(s, valid_neighbors.get(s)) for s in keys}
+
     # STEP 1
     def roi_knn(self, emb_id):
         """
-        Calcualtes knn for single roi embedding
+        Returns knn for single roi embedding from the batched results
+        """
+        return self.neighbors.get(emb_id, [])
+
+    def index_rois(self):
+        """
+        Precompute roi position by id and the columns compared by filter_valid,
+        as arrays indexed by roi position, missing values as NaN,
+        and a lookup of sequence and viewpoint by roi id
         """
-        neighbors = self.mpDB.knn(emb_id, k=self.k)
-        nns = list(zip([int(x) for x in neighbors['ids'][0]], neighbors['distances'][0]))
-        return nns[1:]  # skip self-match
+        self.positions = pd.Series(np.arange(len(self.rois)), index=self.rois['id'].to_numpy())
+        self.individual_ids = self.rois['individual_id'].to_numpy(dtype=float)
+        self.sequence_ids = self.rois['sequence_id'].to_numpy(dtype=float)
+        self.viewpoints = self.rois['viewpoint'].to_numpy(dtype=float)
+        # shared by all match objects for padding and viewpoint ordering
+        self.roi_lookup = self.rois.set_index('id')[['sequence_id', 'viewpoint']].to_dict('index')
+
+    def roi_data(self, roi_ids):
+        """Id and viewpoint of rois, in self.rois order"""
+        positions = np.unique(self.positions.reindex(roi_ids).dropna().to_numpy(dtype=int))
+        return self.rois.iloc[positions][['id', 'viewpoint']]
 
     # STEP 2
-    def filter_valid(self, sequence_rois, neighbors):
+    def filter_valid(self, keys=None):
         """
-        Returns list of valid neighbors by roi_emb.id
+        Filters neighbors of every sequence at once, a neighbor is valid if for any roi of the sequence
+        it is from another sequence and individual, has the same viewpoint, and is within threshold
+
+        keys: sequences to filter, all sequences if None
+        Returns dict of sequence to valid neighbors as (roi id, distance), nearest first
         """
-        filtered = []
-        query_rois = self.rois.loc[self.rois['id'].isin(sequence_rois)].copy()
-        neighbors = pd.DataFrame(neighbors, columns=['id', 'distance'])
-        neighbors_df = pd.merge(self.rois, neighbors, on='id')
-
-        # Perform a cross-join using a Cartesian product
-        query_rois["key"] = 1  # Temporary key for cross-join
-        neighbors_df["key"] = 1
-        merged = query_rois.merge(neighbors_df, on="key", suffixes=("_query", "_neighbor")).drop("key", axis=1)
-
-        # Apply filtering conditions
-        filtered = merged[
-            (merged["individual_id_query"].isna() | (merged["individual_id_query"] != merged["individual_id_neighbor"])) &
-            (merged["sequence_id_query"].isna() | (merged["sequence_id_query"] != merged["sequence_id_neighbor"])) &
-            (merged["viewpoint_query"].isna() | (merged["viewpoint_query"] == merged["viewpoint_neighbor"])) &
-            (merged["distance"] < self.threshold) & (merged["distance"] > 0)
-        ]
-        # Return filtered neighbors as tuples of (ROI ID, distance)
-        return list(zip(filtered["id_neighbor"], filtered["distance"]))
+        keys = list(self.sequences) if keys is None else list(keys)
+        # one row per neighbor of each query roi, and per query roi, sequences by position
+        sequence_codes, neighbor_ids, distances = [], [], []
+        query_codes, query_ids = [], []
+        for code, s in enumerate(keys):
+            for roi_id in self.sequences[s]:
+                query_codes.append(code)
+                query_ids.append(roi_id)
+                for neighbor_id, distance in self.roi_knn(roi_id):
+                    sequence_codes.append(code)
+                    neighbor_ids.append(neighbor_id)
+                    distances.append(distance)
+        neighbors = pd.DataFrame({'sequence': sequence_codes, 'id': neighbor_ids, 'distance': distances})
+        # nearest distance of each neighbor to the sequence
+        neighbors = neighbors.groupby(['sequence', 'id'], sort=False)['distance'].min().reset_index()
+        neighbors = neighbors[(neighbors['distance'] < self.threshold) & (neighbors['distance'] > 0)]
+        neighbors = neighbors.assign(neighbor=self.positions.reindex(neighbors['id']).to_numpy()).dropna()
+        queries = pd.DataFrame({'sequence': query_codes,
+                                'query': self.positions.reindex(query_ids).to_numpy()}).dropna()
+
+        # every query roi against every neighbor of its sequence
+        pairs = neighbors.merge(queries, on='sequence')
+        q = pairs['query'].to_numpy(dtype=int)
+        n = pairs['neighbor'].to_numpy(dtype=int)
+        valid = ((np.isnan(self.individual_ids[q]) | (self.individual_ids[q] != self.individual_ids[n])) &
+                 (np.isnan(self.sequence_ids[q]) | (self.sequence_ids[q] != self.sequence_ids[n])) &
+                 (np.isnan(self.viewpoints[q]) | (self.viewpoints[q] == self.viewpoints[n])))
+        pairs = pairs[valid].drop_duplicates(['sequence', 'id']).sort_values(['sequence', 'distance'], kind='stable')
+
+        # split back into sequences
+        codes = pairs['sequence'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else []
+        ends = np.r_[starts[1:], len(codes)] if len(codes) else []
+        ids = pairs['id'].tolist()
+        distances = pairs['distance'].tolist()
+        return {keys[codes[start]]: list(zip(ids[start:end], distances[start:end]))
+                for start, end in zip(starts, ends)}
 
     # STEP 3
     def rank(self):
@@ -126,44 +181,41 @@ class MatchEmbeddingThread(QThread):
         Ranking Function
             Prioritizes sequences with matches that have previously IDd individuals and by total number of matches
         """
-        # remove query sequences with IDed individuals
-        ided_sequences = self.rois[~self.rois["individual_id"].isna()]["sequence_id"].unique().tolist()
-        self.pairs = [m for m in self.pairs if m.sequence_id not in ided_sequences]
-
-        # prioritize rois with known IDs and favorites
-        ided_rois = self.rois[~self.rois["individual_id"].isna()]["id"].unique().tolist()
-        favorite_rois = self.rois[self.rois["favorite"] == 1]["id"].tolist()
-
-        # prioritize sequences with IDed individuals
-        if len(ided_rois) > 0:
-            for match_object in self.pairs:
-                # prioritize matches by favorites 
-                if len(favorite_rois) > 0:
-                    match_object.rank_neighbors_by_distance()
-                    match_object.rank_neighbors_by_favorites(favorite_rois)
-                # then prioritize matches by IDed status
-                match_object.rank_neighbors_by_ided(ided_rois)
-
-            # prioritize by number of matches and ided status
-            self.pairs = sorted(self.pairs, key=lambda x: len(x.neighbors), reverse=True)
-            self.pairs = sorted(self.pairs, key=lambda x: any(item[0] in ided_rois for item in x.neighbors), reverse=True)
-
-        # if no ids, rank by distance
-        else:
-            for match_object in self.pairs:
-                match_object.rank_neighbors_by_distance()
-            # prioritize by number of matches
-            self.pairs = sorted(self.pairs, key=lambda x: len(x.neighbors), reverse=True)
-
-    def remove_duplicate_matches(self, matches):
-        """
-        If a sequence is matched to the same roi multiple times,
-        remove duplicate entries
-        """
-        filtered = []
-        seen = set()
-        for item in sorted(matches, key=lambda x: x[1]):
-            if item[0] not in seen:
-                filtered.append(item)
-                seen.add(item[0])
-        return filtered
+        self.pairs = rank_matches(self.pairs, self.rois, self.sequences, self.roi_lookup)
+
+
+def rank_matches(pairs, rois, sequences, roi_lookup=None):
+    """
+    Rank match objects and their matches from the current state of rois,
+    standalone so matches can be re-ranked after an edit without recomputing knn
+
+    Removes query sequences already IDed, ranks each match stack with IDed rois first,
+    then favorites, then by distance, and orders sequences by whether they matched
+    an IDed roi and by number of matches. Each stack is ranked from its unpadded
+    matches, then padded with the rest of each matched sequence and ordered by viewpoint
+
+    Args
+        - rois (pd.DataFrame): with id, individual_id, sequence_id, favorite and viewpoint columns
+        - sequences (dict): sequence id to roi ids, for padding
+        - roi_lookup (dict): roi id to its sequence_id and viewpoint, built from rois if None
+    """
+    if roi_lookup is None:
+        roi_lookup = rois.set_index('id')[['sequence_id', 'viewpoint']].to_dict('index')
+    ided = rois["individual_id"].notna()
+    # remove query sequences with IDed individuals
+    ided_sequences = set(rois.loc[ided, "sequence_id"].tolist())
+    pairs = [m for m in pairs if m.sequence_id not in ided_sequences]
+
+    # prioritize rois with known IDs, and favorites only when there are IDs
+    ided_rois = set(rois.loc[ided, "id"].tolist())
+    favorite_rois = set(rois.loc[rois["favorite"] == 1, "id"].tolist()) if ided_rois else set()
+    for match_object in pairs:
+        match_object.rank_neighbors(ided_rois, favorite_rois)
+
+    # prioritize by ided status, then number of matches
+    pairs = sorted(pairs, key=lambda x: (any(item[0] in ided_rois for item in x.matches), len(x.matches)),
+                   reverse=True)
+    for match_object in pairs:
+        match_object.pad_sequences(roi_lookup, sequences)
+        match_object.order_matches()
+    return pairs
@@ -3,9 +3,11 @@ Thread Class for Processing Viewpoint and Miew Embedding
 
 """
 import animl
+import numpy as np
 from numpy import argmax
 from pathlib import Path
 import pandas as pd
+from PIL import Image
 
 from PyQt6.QtCore import QThread, pyqtSignal
 
@@ -21,11 +23,13 @@ class ReIDThread(QThread):
     prompt_update = pyqtSignal(str)  # Signal to update the alert prompt
     progress_update = pyqtSignal(int)  # Signal to update the progress bar
     done = pyqtSignal()
+    EMB_CHUNK = 1000  # rois per extraction call and bulk write
 
     def __init__(self, mpDB, REID_KEY, VIEWPOINT_KEY):
         super().__init__()
         self.mpDB = mpDB
         self.ml_dir = Path(config.load_cfg('ML_DIR'))
+        self.REID_KEY = REID_KEY
         self.reid_filepath = get_path(self.ml_dir, REID_KEY)
         self.viewpoint_filepath = get_path(self.ml_dir, VIEWPOINT_KEY)
 
@@ -62,50 +66,159 @@ class ReIDThread(QThread):
             return
 
         # filter rois without viewpoint
-        filtered_rois = self.rois[self.rois['viewpoint'].isna()]
+        filtered_rois = self.readable_rois(self.rois[self.rois['viewpoint'].isna()])
         if len(filtered_rois) > 0:
-            filtered_rois.reset_index(drop=True, inplace=True)
+            filtered_rois = filtered_rois.reset_index(drop=True)
 
             model, classes = animl.load_classifier(self.viewpoint_filepath)
-            dataloader = animl.manifest_dataloader(filtered_rois, resize_width=480, resize_height=480, crop=True)
+            batch_size = int(config.load_cfg('VIEWPOINT_BATCH_SIZE'))
+            dataloader = animl.manifest_dataloader(filtered_rois, file_col='filepath', crop=True,
+                                                   resize_width=480, resize_height=480,
+                                                   batch_size=batch_size,
+                                                   num_workers=int(config.load_cfg('VIEWPOINT_WORKERS')))
+            input_name = model.get_inputs()[0].name
 
+            viewpoints = dict()
+            # batch i is drawn from manifest rows i*batch_size onwards, minus any images animl dropped
             for i, batch in enumerate(dataloader):
-                if not self.isInterruptionRequested():
-                    image = batch[0]
-                    output = model.run(None, {model.get_inputs()[0].name: image})[0]
-                    value = argmax(animl.softmax(output), axis=1)[0]
+                if self.isInterruptionRequested():
+                    break
+                start = i * batch_size
+                roi_ids = batch_roi_ids(filtered_rois.iloc[start:start + batch_size], batch_filepaths(batch))
+                if roi_ids is None:
+                    self.mpDB.logger.warning(f"Could not match viewpoint batch {i} to rois, skipping")
+                    continue
+                output = model.run(None, {input_name: batch[0]})[0]
+                values = argmax(animl.softmax(output), axis=1)
 
-                    # TODO process by sequence
-                    # sequence = self.media[self.media['sequence_id'] == self.rois.loc[roi_id, "sequence_id"]]
-                    roi_id = filtered_rois.at[i, 'roi_id']
-                    self.mpDB.edit_row("roi", roi_id, {"viewpoint": int(value)})
-                    self.progress_update.emit(round(100 * i / len(filtered_rois)))
+                # TODO process by sequence
+                # sequence = self.media[self.media['sequence_id'] == self.rois.loc[roi_id, "sequence_id"]]
+                viewpoints.update(zip(roi_ids, map(int, values)))
+                self.progress_update.emit(round(100 * min(start + batch_size, len(filtered_rois)) / len(filtered_rois)))
+
+            # commit completed viewpoints, including on interruption
+            self.mpDB.edit_rows("roi", "viewpoint", viewpoints)
 
     def get_embeddings(self):
-        """Process embeddings for ROIs"""
+        """
+        Process embeddings for ROIs in batches
+        The dataloader workers decode and crop upcoming images while the model runs
+        """
         # If no reid model selected, skip
         if self.reid_filepath is None:
             self.prompt_update.emit("No Re-ID model selected, skipping embedding extraction...")
             return
 
-        # filter rois without embeddings
-        filtered_rois = self.rois[self.rois['emb'] == 0]
+        # filter rois without embeddings, skip full-frame placeholders
+        filtered_rois = self.rois[(self.rois['emb'] == 0) & (self.rois['bbox_x'] != -1)]
+        filtered_rois = self.readable_rois(filtered_rois)
         if len(filtered_rois) > 0:
-            filtered_rois.reset_index(drop=True, inplace=True)
+            filtered_rois = filtered_rois.reset_index(drop=True)
             model = animl.load_miew(self.reid_filepath)
+            batch_size = int(config.load_cfg('REID_BATCH_SIZE'))
+            workers = int(config.load_cfg('REID_WORKERS'))
+
+            for start in range(0, len(filtered_rois), self.EMB_CHUNK):
+                if self.isInterruptionRequested():
+                    break
+                chunk = filtered_rois.iloc[start:start + self.EMB_CHUNK]
+                roi_ids, embs = self.extract_embeddings(model, chunk, batch_size, workers)
+                self.save_embeddings(roi_ids, embs)
+                self.progress_update.emit(round(100 * (start + len(chunk)) / len(filtered_rois)))
+
+    def extract_embeddings(self, model, rois, batch_size, workers):
+        """
+        Embeddings for a group of ROIs and the roi ids they belong to
+
+        animl drops images it cannot read without saying which, so if any are missing
+        the group is extracted again one file at a time and unreadable files are skipped
+        """
+        try:
+            embs = animl.extract_miew_embeddings(model, rois, batch_size=batch_size, num_workers=workers)
+            if len(embs) == len(rois):
+                return [int(x) for x in rois['roi_id']], embs
+        except (IndexError, ValueError):
+            # a batch or the whole group had no readable images
+            pass
+
+        roi_ids = []
+        embs = []
+        for filepath, group in rois.groupby('filepath', sort=False):
+            if self.isInterruptionRequested():
+                break
+            try:
+                group_embs = animl.extract_miew_embeddings(model, group.reset_index(drop=True),
+                                                           batch_size=batch_size, num_workers=0)
+            except (IndexError, ValueError):
+                group_embs = []
+            if len(group_embs) != len(group):
+                self.mpDB.logger.warning(f"Could not read {filepath}, skipping embeddings for {len(group)} rois")
+                continue
+            roi_ids.extend(int(x) for x in group['roi_id'])
+            embs.append(group_embs)
+        return roi_ids, np.vstack(embs) if embs else []
+
+    def save_embeddings(self, roi_ids, embs):
+        """Write embeddings and emb flags for a group of ROIs"""
+        if len(roi_ids) != len(embs):
+            self.mpDB.logger.error(f"Got {len(embs)} embeddings for {len(roi_ids)} rois, not saving")
+            return
+        if roi_ids:
+            self.mpDB.add_embs(roi_ids, embs, model_key=self.REID_KEY)
+            self.mpDB.edit_rows("roi", "emb", {roi_id: 1 for roi_id in roi_ids})
+
+    def readable_rois(self, rois):
+        """ROIs whose image file opens, so the dataloader does not drop any of them"""
+        filepaths = rois['filepath'].drop_duplicates()
+        readable = {filepath: readable_image(filepath) for filepath in filepaths}
+        for filepath in [filepath for filepath, ok in readable.items() if not ok]:
+            self.mpDB.logger.warning(f"Could not open {filepath}, skipping")
+        return rois[rois['filepath'].map(readable).eq(True)]
+
+
+def batch_filepaths(batch):
+    """
+    Filepaths of the images in a dataloader batch, None if it holds none
+
+    animl's inference dataset yields (image, filepath, size) and its training
+    dataset (image, label, filepath), so the element holding strings is used
+    """
+    for element in batch[1:]:
+        if len(element) > 0 and all(isinstance(filepath, str) for filepath in element):
+            return list(element)
+    return None
+
+
+def batch_roi_ids(rois, filepaths):
+    """
+    Roi ids of the images a batch returned, in order
+    rois are the manifest rows the batch was drawn from, filepaths are the ones it kept
 
-            for i in range(len(filtered_rois)):
-                if not self.isInterruptionRequested():
-                    row = filtered_rois.iloc[i].to_frame().T
-                    if row.at[i, 'bbox_x'] == -1:
-                        continue
-                    roi_id = row.at[i, 'roi_id']
-                    emb = animl.extract_miew_embeddings(model, row)[0]
+    Returns None if the filepaths are missing or not an ordered subset of the rows
+    """
+    if filepaths is None:
+        return None
+    rows = zip(rois['roi_id'], rois['filepath'])
+    roi_ids = []
+    for filepath in filepaths:
+        for roi_id, expected in rows:
+            if str(expected) == str(filepath):
+                roi_ids.append(int(roi_id))
+                break
+        else:
+            return None
+    return roi_ids
 
-                    self.mpDB.add_emb(roi_id, emb)
-                    self.mpDB.edit_row("roi", roi_id, {"emb": 1})
 
-                    self.progress_update.emit(round(100 * i / len(filtered_rois)))
+def readable_image(filepath):
+    """True if filepath opens as an image, reads the header only"""
+    if not isinstance(filepath, str):
+        return False
+    try:
+        with Image.open(filepath):
+            return True
+    except (OSError, ValueError):
+        return False
 
 
 """
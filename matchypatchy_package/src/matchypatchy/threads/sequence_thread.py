@@ -5,6 +5,8 @@ Pair_ID should be given in advance since there is likely
 some mismatch between camera timestamps and they won't be exactly the same
 
 """
+import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
@@ -14,14 +16,70 @@ from matchypatchy.database.media import fetch_media
 from matchypatchy.config import load_cfg
 
 
+def sequence_groups(media, max_time, max_n):
+    """
+    Label media with sequence group numbers
+
+    A sequence starts at an image and takes the following images from the same
+    station and camera taken within max_time of that first image, up to max_n images.
+    Media without a timestamp or camera are their own sequence.
+
+    Args
+        - media (pd.DataFrame): sorted by station_id, camera_id, timestamp
+        - max_time (timedelta): maximum time from first image of a sequence
+        - max_n (int): maximum images per sequence
+    Returns array of group numbers aligned with media rows
+    """
+    n = len(media)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    station = media['station_id'].to_numpy()
+    # as floats a missing camera never equals its neighbor, so it always starts a sequence
+    camera = media['camera_id'].to_numpy(dtype=np.float64)
+    valid = media['timestamp'].notna().to_numpy()
+    timestamp = media['timestamp'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    max_time = int(pd.Timedelta(max_time).value)
+
+    # bursts: consecutive images with no gap over max_time, always sequence boundaries
+    burst_start = np.ones(n, dtype=bool)
+    same_camera = (station[1:] == station[:-1]) & (camera[1:] == camera[:-1])
+    burst_start[1:] = ~same_camera | ~valid[1:] | ~valid[:-1] | (np.diff(timestamp) > max_time)
+    bursts = pd.DataFrame({'burst': np.cumsum(burst_start) - 1, 'timestamp': timestamp})
+    spans = bursts.groupby('burst')['timestamp'].agg(['first', 'last', 'size'])
+
+    # most bursts fit in one sequence, only split the rest
+    sequence_start = burst_start.copy()
+    burst_rows = np.flatnonzero(burst_start)
+    too_long = ((spans['last'] - spans['first']) > max_time).to_numpy()
+    long_bursts = np.flatnonzero(too_long | (spans['size'] > max_n).to_numpy())
+    for burst in long_bursts:
+        start = burst_rows[burst]
+        end = start + int(spans['size'].iat[burst])
+        i = start
+        while i < end:
+            sequence_start[i] = True
+            within = start + np.searchsorted(timestamp[start:end], timestamp[i] + max_time, side='right')
+            i = min(within, i + max_n)
+
+    return np.cumsum(sequence_start) - 1
+
+
 class SequenceThread(QThread):
     prompt_update = pyqtSignal(str)  # Signal to update the alert prompt
     done = pyqtSignal()
 
-    def __init__(self, mpDB, flag):
+    def __init__(self, mpDB, flag, incremental=False):
+        """
+        Args
+            - flag (bool): group media into sequences, else each media is its own sequence
+            - incremental (bool): only sequence media without a sequence_id,
+                                  ie added since the last run, leaving existing sequences as they are
+        """
         super().__init__()
         self.mpDB = mpDB
         self.flag = flag
+        self.incremental = incremental
         self.max_time = timedelta(seconds=int(load_cfg('SEQUENCE_DURATION')))
         self.max_n = int(load_cfg('SEQUENCE_N'))
 
@@ -30,46 +88,29 @@ class SequenceThread(QThread):
         self.media = self.media.sort_values(by=['station_id', 'camera_id', 'timestamp'])
 
     def run(self):
+        # if not calculating sequence, only add sequence_id where blank
+        if self.incremental or not self.flag:
+            self.media = self.media[self.media['sequence_id'].isna()]
+
         # if process sequence option is checked, will rewrite sequence_id
         if self.flag:
             self.prompt_update.emit("Processing sequences...")
-
-            sequences = []
-            current_sequence = []
-            for _, image in self.media.iterrows():
-                if not self.isInterruptionRequested():
-                    if current_sequence:
-                        # station is the same, timestamp under threshold, n under threshold
-                        if (image['station_id'] == current_sequence[0]['station_id']) and \
-                            (image['camera_id'] == current_sequence[0]['camera_id']) and \
-                            (image['timestamp'] - current_sequence[0]['timestamp'] <= self.max_time) and \
-                            (len(current_sequence) < self.max_n):
-                            current_sequence.append(image)
-                        else:
-                            # bank the current sequence and start a new group
-                            sequences.append(current_sequence)
-                            current_sequence = [image]
-                    else:
-                        current_sequence = [image]
-
-            # Append the last group
-            if current_sequence:
-                sequences.append(current_sequence)
-
-            # update media entries
-            for _, group in enumerate(sequences):
-                # create a sequence id
-                sequence_id = self.mpDB.add_sequence()
-                for image in group:
-                    self.mpDB.edit_row('media', image['id'], {"sequence_id": sequence_id})
-
-        # if not calculating sequence, each media entry gets own sequence_id
+            groups = sequence_groups(self.media, self.max_time, self.max_n)
+        # each media entry gets own sequence_id
         else:
-            # only add sequence_id where blank
-            self.media = self.media[self.media['sequence_id'].isna()]
-            for _, image in self.media.iterrows():
-                sequence_id = self.mpDB.add_sequence()
-                self.mpDB.edit_row('media', image['id'], {"sequence_id": sequence_id})
+            groups = np.arange(len(self.media))
+
+        if len(groups) > 0 and not self.isInterruptionRequested():
+            # allocate sequence ids in one block and update media entries
+            try:
+                with self.mpDB.transaction(immediate=True):
+                    block = self.mpDB.add_sequences(int(groups[-1]) + 1)
+                    sequence_ids = np.asarray(block)[groups]
+                    self.mpDB.edit_rows('media', 'sequence_id',
+                                        dict(zip(self.media['id'].astype(int), sequence_ids.tolist())))
+            except sqlite3.Error:
+                # already logged, sequences were rolled back
+                self.prompt_update.emit("Failed to save sequences, no changes were made.")
 
         if not self.isInterruptionRequested():
             self.done.emit()
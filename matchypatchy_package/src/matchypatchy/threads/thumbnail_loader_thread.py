@@ -0,0 +1,56 @@
+"""
+Background Thumbnail Loader
+
+Decodes thumbnails for display in the order the table asks for them,
+a new request replaces everything still pending so rows scrolled past are dropped
+"""
+import threading
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from matchypatchy.database.thumbnails import load_thumbnail, verify_thumbnail
+
+
+class ThumbnailLoaderThread(QThread):
+    loaded = pyqtSignal(str, object, bool, str)  # thumbnail path, QImage, valid against the store, thumbnail dir
+
+    def __init__(self, thumbnail_dir):
+        super().__init__()
+        self.thumbnail_dir = thumbnail_dir
+        # pending (path, size, mtime) keyed by path, in priority order
+        self.jobs = dict()
+        self.condition = threading.Condition()
+
+    def request(self, jobs):
+        """
+        Replace pending loads with jobs, highest priority first
+        jobs: (thumbnail path, recorded size, recorded mtime)
+        """
+        with self.condition:
+            self.jobs = {job[0]: job for job in jobs}
+            self.condition.notify()
+
+    def cancel(self):
+        """Drop pending loads"""
+        self.request([])
+
+    def set_thumbnail_dir(self, thumbnail_dir):
+        """Resolve later loads against thumbnail_dir, ie after switching projects, pending loads are dropped"""
+        with self.condition:
+            self.thumbnail_dir = thumbnail_dir
+            self.jobs = dict()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            with self.condition:
+                if not self.jobs:
+                    # wake periodically to check for interruption
+                    self.condition.wait(timeout=0.5)
+                    continue
+                path = next(iter(self.jobs))
+                path, size, mtime = self.jobs.pop(path)
+                thumbnail_dir = self.thumbnail_dir
+            valid = verify_thumbnail(thumbnail_dir, path, size, mtime)
+            # QImage is safe to decode off the gui thread, QPixmap is not
+            image = load_thumbnail(path, thumbnail_dir)
+            self.loaded.emit(path, image, valid, thumbnail_dir)
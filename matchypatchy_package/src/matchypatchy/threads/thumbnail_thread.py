@@ -0,0 +1,195 @@
+"""
+Background Thumbnail Service
+
+Generates media and ROI thumbnails on a worker pool, decoupled from
+import and detection, and registers them in bulk as they complete
+"""
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from matchypatchy.config import load_cfg
+from matchypatchy.database.thumbnails import (save_thumbnails, check_missing_thumbnails, thumbnail_stat,
+                                              collect_thumbnails, migrate_thumbnails, register_project)
+
+
+class ThumbnailThread(QThread):
+    thumbnails_ready = pyqtSignal(str, list)  # table ("media" or "roi"), ids with new thumbnails
+    BATCH_SIZE = 100  # files decoded per bulk insert
+
+    def __init__(self, mpDB, workers=4):
+        super().__init__()
+        self.mpDB = mpDB
+        self.workers = workers
+        # pending jobs keyed by (table, id), queuing an id again replaces its job
+        self.jobs = dict()
+        self.files = dict()  # filepath to its pending job keys, so each file is decoded once
+        # scans in queued order: (data_type, verify) to check for missing thumbnails, or "cleanup"
+        self.scans = dict()
+        self.generation = 0  # bumped by clear() to drop in-flight results
+        self.registered = None  # database last registered with the thumbnail store
+        self.condition = threading.Condition()
+
+    def queue_media(self, media_id, filepath, ext, sha256):
+        """Queue thumbnail for full media file"""
+        self.queue(("media", int(media_id)), (filepath, ext, sha256))
+
+    def queue_roi(self, roi_id, filepath, ext, sha256, frame, bbox_x, bbox_y, bbox_w, bbox_h):
+        """Queue thumbnail for ROI given bbox coordinates"""
+        self.queue(("roi", int(roi_id)), (filepath, ext, sha256, frame, bbox_x, bbox_y, bbox_w, bbox_h))
+
+    def queue(self, key, job):
+        with self.condition:
+            previous = self.jobs.get(key)
+            if previous is not None and previous[0] != job[0]:
+                self.files[previous[0]].discard(key)
+            self.jobs[key] = job
+            self.files.setdefault(job[0], set()).add(key)
+            self.condition.notify()
+
+    def queue_missing(self, data_type, verify=False):
+        """
+        Queue thumbnails for all rows without a valid thumbnail
+        The check runs on the service thread, data_type: 0 = media, 1 = rois
+        verify also checks every existing thumbnail against the store, a full scan
+        """
+        with self.condition:
+            self.scans[(data_type, verify)] = None
+            self.condition.notify()
+
+    def queue_cleanup(self):
+        """
+        Garbage collect the thumbnail store on the service thread, between batches
+        Run on request only, thumbnails in use by any registered database are kept
+        """
+        with self.condition:
+            self.scans["cleanup"] = None
+            self.condition.notify()
+
+    def cleanup(self):
+        """
+        Move thumbnails into the configured THUMBNAIL_STORE, then remove unused
+        unreferenced thumbnails and evict unreferenced ones down to THUMBNAIL_CACHE_MB
+        """
+        thumbnail_dir = load_cfg('THUMBNAIL_DIR')
+        migrate_thumbnails(self.mpDB, thumbnail_dir, load_cfg('THUMBNAIL_STORE'),
+                           interrupted=self.isInterruptionRequested)
+        if self.isInterruptionRequested():
+            return
+        max_mb = load_cfg('THUMBNAIL_CACHE_MB')
+        max_bytes = int(max_mb) * 1024 * 1024 if max_mb else None
+        collect_thumbnails(self.mpDB, thumbnail_dir, max_bytes=max_bytes, interrupted=self.isInterruptionRequested)
+
+    def scan_missing(self, data_type, verify=False):
+        """Find rows without a valid thumbnail and queue them"""
+        missing = check_missing_thumbnails(self.mpDB, data_type, load_cfg('THUMBNAIL_DIR'), verify=verify,
+                                           interrupted=self.isInterruptionRequested)
+        for start in range(0, len(missing), 900):
+            if self.isInterruptionRequested():
+                return
+            ids = ', '.join(str(int(id)) for id in missing[start:start + 900])
+            if data_type == 1:
+                rows, _ = self.mpDB.select_join("roi", "media", "roi.media_id = media.id",
+                                                columns="roi.id, filepath, ext, sha256, frame, bbox_x, bbox_y, bbox_w, bbox_h",
+                                                row_cond=f"roi.id IN ({ids})")
+                for row in rows:
+                    self.queue_roi(*row)
+            else:
+                rows = self.mpDB.select("media", columns="id, filepath, ext, sha256", row_cond=f"id IN ({ids})")
+                for row in rows:
+                    self.queue_media(*row)
+
+    def clear(self):
+        """Drop pending jobs, ie when switching databases"""
+        with self.condition:
+            self.jobs.clear()
+            self.files.clear()
+            self.scans.clear()
+            self.generation += 1
+
+    def pending(self):
+        """Number of queued jobs"""
+        with self.condition:
+            return len(self.jobs) + len(self.scans)
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self.isInterruptionRequested():
+                self.register_project()
+                with self.condition:
+                    scan = next(iter(self.scans), None)
+                    self.scans.pop(scan, None)
+                if scan == "cleanup":
+                    self.cleanup()
+                    continue
+                if scan is not None:
+                    self.scan_missing(*scan)
+                    continue
+
+                with self.condition:
+                    if not self.jobs:
+                        # wake periodically to check for interruption
+                        self.condition.wait(timeout=0.5)
+                        continue
+                    batch = self.take_batch()
+                    generation = self.generation
+
+                thumbnail_dir = load_cfg('THUMBNAIL_DIR')
+                store = load_cfg('THUMBNAIL_STORE')
+                results = pool.map(lambda jobs: self.save_thumbnails(thumbnail_dir, store, jobs), batch.values())
+                batch = [job for jobs in batch.values() for job in jobs]
+                paths = [path for paths in results for path in paths]
+
+                with self.condition:
+                    if generation != self.generation:
+                        continue
+                self.register(batch, paths)
+
+    def register_project(self):
+        """Register the open database with the thumbnail store, again after switching databases"""
+        if self.mpDB.filepath == self.registered:
+            return
+        try:
+            register_project(load_cfg('THUMBNAIL_DIR'), self.mpDB.filepath)
+            self.registered = self.mpDB.filepath
+        except OSError as error:
+            self.mpDB.logger.warning(f"Could not register database with thumbnail store: {error}")
+
+    def take_batch(self):
+        """Pop pending jobs of up to BATCH_SIZE files, returns dict of filepath to its jobs"""
+        batch = dict()
+        for key in list(islice(self.jobs, self.BATCH_SIZE)):
+            if key not in self.jobs:  # taken with an earlier job of the same file
+                continue
+            filepath = self.jobs[key][0]
+            batch[filepath] = [(k, self.jobs.pop(k)) for k in self.files.pop(filepath)]
+        return batch
+
+    def save_thumbnails(self, thumbnail_dir, store, jobs):
+        """
+        Worker job, saves all thumbnails of one file from a single decode
+        Returns (path, size, mtime) for each job, None if it could not be saved
+        """
+        media = any(key[0] == "media" for key, _ in jobs)
+        rois = [args for key, args in jobs if key[0] == "roi"]
+        filepath, ext, sha256 = jobs[0][1][:3]
+        try:
+            media_path, roi_paths = save_thumbnails(thumbnail_dir, filepath, ext, sha256, media=media,
+                                                    rois=[args[3:] for args in rois], store=store)
+        except Exception as error:
+            self.mpDB.logger.error(f"Failed to save thumbnails for {filepath}: {error}")
+            return [None] * len(jobs)
+        roi_paths = iter(roi_paths)
+        paths = [media_path if key[0] == "media" else next(roi_paths) for key, _ in jobs]
+        # recorded so thumbnails can be verified later without opening them
+        return [(path, *thumbnail_stat(thumbnail_dir, path)) for path in paths]
+
+    def register(self, batch, paths):
+        """Replace thumbnail entries for a completed batch, one bulk insert per table"""
+        for table in ("media", "roi"):
+            rows = [(key[1], *path) for (key, _), path in zip(batch, paths) if key[0] == table and path is not None]
+            if rows:
+                self.mpDB.add_thumbnail_many(table, rows, replace=True)
+                self.thumbnails_ready.emit(table, [row[0] for row in rows])
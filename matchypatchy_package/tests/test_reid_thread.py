@@ -0,0 +1,39 @@
+"""
+Viewpoint batches are matched back to ROIs by the filepaths each batch returns
+"""
+import pandas as pd
+import pytest
+
+pytest.importorskip("animl")
+pytest.importorskip("PyQt6")
+
+from matchypatchy.threads.reid_thread import batch_filepaths, batch_roi_ids  # noqa: E402
+
+
+ROIS = pd.DataFrame({'roi_id': [11, 12, 13, 14],
+                     'filepath': ['a.jpg', 'a.jpg', 'b.jpg', 'c.jpg']})
+
+
+def test_inference_batch_uses_filepaths():
+    # ImageGenerator yields (image, filepath, size), b.jpg was dropped by collate_fn
+    batch = (['img'] * 3, ['a.jpg', 'a.jpg', 'c.jpg'], [(480, 480)] * 3)
+    assert batch_filepaths(batch) == ['a.jpg', 'a.jpg', 'c.jpg']
+    assert batch_roi_ids(ROIS, batch_filepaths(batch)) == [11, 12, 14]
+
+
+def test_labelled_batch_skips_labels():
+    # TrainGenerator yields (image, label, filepath)
+    batch = (['img'] * 2, [0, 1], ['b.jpg', 'c.jpg'])
+    assert batch_filepaths(batch) == ['b.jpg', 'c.jpg']
+    assert batch_roi_ids(ROIS, batch_filepaths(batch)) == [13, 14]
+
+
+def test_batch_without_filepaths_is_not_matched():
+    batch = (['img'] * 2, [0, 1], [(480, 480)] * 2)
+    assert batch_filepaths(batch) is None
+    assert batch_roi_ids(ROIS, batch_filepaths(batch)) is None
+
+
+def test_unknown_or_reordered_filepaths_are_not_matched():
+    assert batch_roi_ids(ROIS, ['z.jpg']) is None
+    assert batch_roi_ids(ROIS, ['c.jpg', 'a.jpg']) is None